@@ -0,0 +1,326 @@
+"""
+Deterministic anomaly detectors over a TelemetryStore.
+
+Every detector is a vectorized pass over one series: a boolean mask of
+"bad" samples is turned into runs (start/end sample of each contiguous
+stretch), runs closer than MERGE_GAP_MS are merged, and each run becomes a
+time-stamped event. The full pass runs once per log (TelemetryStore.events())
+and is served to the model by flight_anomaly_tool, so one tool call replaces
+probing series one at a time.
+
+Each detector reads the first candidate series present in the log, so the
+same detectors cover dataflash (.bin) and telemetry (.tlog) message names.
+"""
+import logging
+import os
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEVERITIES = ("info", "warning", "critical")
+
+# Runs of bad samples closer than this are reported as one event
+MERGE_GAP_MS = float(os.getenv("ANOMALY_MERGE_GAP_MS", "2000"))
+# Per-detector cap on reported events; the rest are counted, not listed
+MAX_EVENTS_PER_DETECTOR = int(os.getenv("ANOMALY_MAX_EVENTS_PER_DETECTOR", "50"))
+
+GPS_MIN_FIX = 3
+GPS_MIN_SATS = int(os.getenv("ANOMALY_GPS_MIN_SATS", "6"))
+BATTERY_SAG_FRACTION = float(os.getenv("ANOMALY_BATTERY_SAG_FRACTION", "0.1"))
+BATTERY_SAG_WINDOW_S = 10
+BATTERY_MAX_TEMP_C = float(os.getenv("ANOMALY_BATTERY_MAX_TEMP_C", "60"))
+ALT_RATE_LIMIT_MPS = float(os.getenv("ANOMALY_ALT_RATE_LIMIT_MPS", "20"))
+ALT_BELOW_HOME_M = float(os.getenv("ANOMALY_ALT_BELOW_HOME_M", "2"))
+# ArduPilot's default FS_EKF_THRESH
+EKF_VARIANCE_LIMIT = float(os.getenv("ANOMALY_EKF_VARIANCE_LIMIT", "0.8"))
+RC_FAILSAFE_PWM = 975
+
+# ArduPilot ERR subsystems (LogErrorSubsystem)
+ERR_SUBSYSTEMS = {
+    1: "MAIN", 2: "RADIO", 3: "COMPASS", 4: "OPTFLOW", 5: "FAILSAFE_RADIO", 6: "FAILSAFE_BATT",
+    7: "FAILSAFE_GPS", 8: "FAILSAFE_GCS", 9: "FAILSAFE_FENCE", 10: "FLIGHT_MODE", 11: "GPS",
+    12: "CRASH_CHECK", 13: "FLIP", 14: "AUTOTUNE", 15: "PARACHUTES", 16: "EKFCHECK",
+    17: "FAILSAFE_EKFINAV", 18: "BARO", 19: "CPU", 20: "FAILSAFE_ADSB", 21: "TERRAIN",
+    22: "NAVIGATION", 23: "FAILSAFE_TERRAIN", 24: "EKF_PRIMARY", 25: "THRUST_LOSS_CHECK",
+    26: "FAILSAFE_SENSORS", 27: "FAILSAFE_LEAK", 28: "PILOT_INPUT", 29: "FAILSAFE_VIBE",
+}
+CRITICAL_SUBSYSTEMS = {5, 6, 7, 8, 12, 17, 25, 26, 29}
+
+# (message type, field, scale to SI units) candidates, in order of preference
+GPS_STATUS = (("GPS[0]", "Status", 1.0), ("GPS", "Status", 1.0), ("GPS_RAW_INT", "fix_type", 1.0))
+GPS_SATS = (("GPS[0]", "NSats", 1.0), ("GPS", "NSats", 1.0), ("GPS_RAW_INT", "satellites_visible", 1.0))
+BATTERY_VOLTAGE = (("BAT[0]", "Volt", 1.0), ("BAT", "Volt", 1.0), ("CURR", "Volt", 1.0),
+                   ("SYS_STATUS", "voltage_battery", 1e-3))
+BATTERY_TEMP = (("BAT[0]", "Temp", 1.0), ("BAT", "Temp", 1.0), ("BATTERY_STATUS", "temperature", 1e-2))
+ALTITUDE = (("POS", "Alt", 1.0), ("AHR2", "Alt", 1.0), ("CTUN", "Alt", 1.0), ("GLOBAL_POSITION_INT", "alt", 1e-3))
+ALTITUDE_ABOVE_HOME = (("POS", "RelHomeAlt", 1.0), ("GLOBAL_POSITION_INT", "relative_alt", 1e-3))
+# (message type, fields, scale to a test ratio): the Dataflash parser already applies the 'c' (x100) multiplier
+EKF_VARIANCES = (
+    ("XKF4[0]", ("SV", "SP", "SH", "SM"), 1.0), ("XKF4", ("SV", "SP", "SH", "SM"), 1.0),
+    ("NKF4", ("SV", "SP", "SH", "SM"), 1.0),
+    ("EKF_STATUS_REPORT", ("velocity_variance", "pos_horiz_variance", "pos_vert_variance", "compass_variance"), 1.0),
+)
+RC_THROTTLE = (("RCIN", "C3", 1.0), ("RC_CHANNELS", "chan3_raw", 1.0), ("RC_CHANNELS_RAW", "chan3_raw", 1.0))
+
+
+def runs(mask):
+    """[start, end) sample ranges of the True stretches of a boolean mask, as two arrays."""
+    if not len(mask):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def merge_runs(starts, ends, time_ms, gap_ms=MERGE_GAP_MS):
+    """Merge runs whose gap in time is below gap_ms."""
+    if len(starts) < 2:
+        return starts, ends
+    gaps = time_ms[starts[1:]] - time_ms[ends[:-1] - 1]
+    keep = np.concatenate(([True], gaps >= gap_ms))
+    return starts[keep], np.concatenate((ends[:-1][keep[1:]], ends[-1:]))
+
+
+def _find(store, candidates):
+    """(path, values scaled to SI, time_ms) of the first candidate series with a time column."""
+    for message_type, field, scale in candidates:
+        table = store.tables.get(message_type)
+        if table is None or table.time_ms is None:
+            continue
+        column = table.columns.get(field)
+        if column is None or column.dtype.kind not in "biuf" or not len(column):
+            continue
+        values = column.astype(np.float64, copy=False)
+        return [message_type, field], values * scale if scale != 1.0 else values, table.time_ms
+    return None
+
+
+def _events(detector, severity, path, values, time_ms, mask, detail, worst=np.nanmin):
+    """Turn a mask of bad samples into merged, time-stamped events."""
+    starts, ends = merge_runs(*runs(mask), time_ms)
+    events = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        start_ms, end_ms = float(time_ms[start]), float(time_ms[end - 1])
+        value = worst(values[start:end])
+        events.append({
+            "detector": detector,
+            "severity": severity,
+            "path": path,
+            "start_ms": start_ms,
+            "end_ms": end_ms,
+            "duration_ms": end_ms - start_ms,
+            "samples": end - start,
+            "value": None if np.isnan(value) else round(float(value), 4),
+            "detail": detail,
+        })
+    return events
+
+
+def _after_first(mask_ok):
+    """True from the first True sample of mask_ok onwards (e.g. after the first GPS fix)."""
+    if not mask_ok.any():
+        return np.zeros(len(mask_ok), dtype=bool)
+    armed = np.zeros(len(mask_ok), dtype=bool)
+    armed[int(np.argmax(mask_ok)):] = True
+    return armed
+
+
+def detect_gps_fix_loss(store):
+    found = _find(store, GPS_STATUS)
+    if found is None:
+        return []
+    path, status, time_ms = found
+    mask = (status < GPS_MIN_FIX) & _after_first(status >= GPS_MIN_FIX)
+    return _events("gps_fix_loss", "critical", path, status, time_ms, mask,
+                   f"GPS fix dropped below 3D (status < {GPS_MIN_FIX}) after the first fix")
+
+
+def detect_satellite_drop(store):
+    found = _find(store, GPS_SATS)
+    if found is None:
+        return []
+    path, sats, time_ms = found
+    mask = (sats < GPS_MIN_SATS) & _after_first(sats >= GPS_MIN_SATS)
+    return _events("satellite_drop", "warning", path, sats, time_ms, mask,
+                   f"Satellite count below {GPS_MIN_SATS}")
+
+
+def detect_battery_sag(store):
+    found = _find(store, BATTERY_VOLTAGE)
+    if found is None:
+        return []
+    path, volts, time_ms = found
+    # Trailing maximum over BATTERY_SAG_WINDOW_S, from per-second bucket maxima
+    seconds = ((time_ms - time_ms[0]) // 1000).astype(np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], seconds[1:] != seconds[:-1])))
+    bucket_max = np.fmax.reduceat(np.where(volts > 0, volts, np.nan), starts)
+    padded = np.concatenate((np.full(BATTERY_SAG_WINDOW_S - 1, np.nan), bucket_max))
+    trailing = np.fmax.reduce(np.lib.stride_tricks.sliding_window_view(padded, BATTERY_SAG_WINDOW_S), axis=1)
+    bucket = np.repeat(np.arange(len(starts)), np.diff(np.concatenate((starts, [len(volts)]))))
+    mask = (volts > 0) & (volts < trailing[bucket] * (1 - BATTERY_SAG_FRACTION))
+    return _events("battery_voltage_sag", "warning", path, volts, time_ms, mask,
+                   f"Voltage more than {BATTERY_SAG_FRACTION:.0%} below its {BATTERY_SAG_WINDOW_S} s trailing maximum")
+
+
+def detect_battery_temperature(store):
+    found = _find(store, BATTERY_TEMP)
+    if found is None:
+        return []
+    path, temp, time_ms = found
+    mask = (temp > BATTERY_MAX_TEMP_C) & (temp < 300)  # INT16_MAX sentinels mean "unknown"
+    return _events("battery_over_temperature", "critical", path, temp, time_ms, mask,
+                   f"Battery temperature above {BATTERY_MAX_TEMP_C:g} degC", worst=np.nanmax)
+
+
+def detect_altitude_excursions(store):
+    events = []
+    found = _find(store, ALTITUDE)
+    if found is not None:
+        path, alt, time_ms = found
+        dt = np.diff(time_ms) / 1000.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rate = np.abs(np.diff(alt)) / dt
+        mask = np.concatenate(([False], (dt > 0) & (rate > ALT_RATE_LIMIT_MPS)))
+        events += _events("altitude_jump", "warning", path, alt, time_ms, mask,
+                          f"Altitude changed faster than {ALT_RATE_LIMIT_MPS:g} m/s (glitch or sensor jump)",
+                          worst=np.nanmax)
+    found = _find(store, ALTITUDE_ABOVE_HOME)
+    if found is not None:
+        path, rel, time_ms = found
+        events += _events("below_home", "warning", path, rel, time_ms, rel < -ALT_BELOW_HOME_M,
+                          f"More than {ALT_BELOW_HOME_M:g} m below the home altitude")
+    return events
+
+
+def detect_ekf_variance(store):
+    for message_type, fields, scale in EKF_VARIANCES:
+        table = store.tables.get(message_type)
+        if table is None or table.time_ms is None:
+            continue
+        events = []
+        for field in fields:
+            column = table.columns.get(field)
+            if column is None or column.dtype.kind not in "biuf":
+                continue
+            # The scale is fixed per message type: a whole-number column may just come from the JSON encoding
+            values = column.astype(np.float64, copy=False)
+            values = values * scale if scale != 1.0 else values
+            events += _events("ekf_variance", "warning", [message_type, field], values, table.time_ms,
+                              values > EKF_VARIANCE_LIMIT,
+                              f"EKF {field} test ratio above {EKF_VARIANCE_LIMIT:g}", worst=np.nanmax)
+        return events
+    return []
+
+
+def detect_rc_failsafe(store):
+    events = []
+    found = _find(store, RC_THROTTLE)
+    if found is not None:
+        path, pwm, time_ms = found
+        # Only once a receiver has produced a valid throttle; all-zero channels mean no receiver
+        mask = (pwm < RC_FAILSAFE_PWM) & _after_first(pwm >= RC_FAILSAFE_PWM)
+        events += _events("rc_failsafe", "critical", path, pwm, time_ms, mask,
+                          f"Throttle channel below {RC_FAILSAFE_PWM} PWM (receiver failsafe or signal loss)")
+
+    table = store.tables.get("ERR")
+    if table is not None and table.time_ms is not None and "Subsys" in table.columns and "ECode" in table.columns:
+        subsys, ecode = table.columns["Subsys"], table.columns["ECode"]
+        for i in np.flatnonzero(ecode != 0).tolist():
+            code = int(subsys[i])
+            events.append({
+                "detector": "error_report",
+                "severity": "critical" if code in CRITICAL_SUBSYSTEMS else "warning",
+                "path": ["ERR", "Subsys"],
+                "start_ms": float(table.time_ms[i]),
+                "end_ms": float(table.time_ms[i]),
+                "duration_ms": 0.0,
+                "samples": 1,
+                "value": int(ecode[i]),
+                "detail": f"ERR {ERR_SUBSYSTEMS.get(code, code)} code {int(ecode[i])}",
+            })
+    return events
+
+
+def detect_mode_changes(store):
+    segments = store.mode_segments()
+    return [{
+        "detector": "mode_change",
+        "severity": "info",
+        "path": None,
+        "start_ms": start_ms,
+        "end_ms": start_ms,
+        "duration_ms": 0.0,
+        "samples": 1,
+        "value": mode,
+        "detail": f"Flight mode changed to {mode}" if i else f"Initial flight mode {mode}",
+    } for i, (start_ms, _, mode) in enumerate(segments)]
+
+
+DETECTORS = {
+    "gps_fix_loss": detect_gps_fix_loss,
+    "satellite_drop": detect_satellite_drop,
+    "battery_voltage_sag": detect_battery_sag,
+    "battery_over_temperature": detect_battery_temperature,
+    "altitude_excursions": detect_altitude_excursions,
+    "ekf_variance": detect_ekf_variance,
+    "rc_failsafe": detect_rc_failsafe,
+    "mode_changes": detect_mode_changes,
+}
+
+
+def detect_events(store):
+    """
+    Run every detector once. Returns {"events": [...] sorted by start_ms,
+    "detectors": {name: {"events", "dropped", "elapsed_ms"}}}.
+    """
+    events, report = [], {}
+    for name, detector in DETECTORS.items():
+        started = time.perf_counter()
+        try:
+            found = detector(store)
+        except Exception as e:
+            logger.warning(f"Anomaly detector {name} failed: {e}")
+            found = []
+        dropped = max(0, len(found) - MAX_EVENTS_PER_DETECTOR)
+        events += found[:MAX_EVENTS_PER_DETECTOR]
+        report[name] = {
+            "events": len(found),
+            "dropped": dropped,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+    events.sort(key=lambda event: event["start_ms"])
+    return {"events": events, "detectors": report}
+
+
+def query_events(table, detectors=None, min_severity=None, start_ms=None, end_ms=None, limit=100):
+    """Filter a detect_events() table for the anomaly tool."""
+    rank = SEVERITIES.index(min_severity) if min_severity in SEVERITIES else 0
+    wanted = set(detectors) if detectors else None
+    selected = [
+        event for event in table["events"]
+        if (wanted is None or event["detector"] in wanted or _group(event["detector"]) in wanted)
+        and SEVERITIES.index(event["severity"]) >= rank
+        and (start_ms is None or event["end_ms"] >= start_ms)
+        and (end_ms is None or event["start_ms"] <= end_ms)
+    ]
+    counts = {}
+    for event in selected:
+        counts[event["detector"]] = counts.get(event["detector"], 0) + 1
+    return {
+        "count": len(selected),
+        "by_detector": counts,
+        "events": selected[:limit],
+        "truncated": len(selected) > limit,
+        "detectors_run": list(table["detectors"])
+    }
+
+
+def _group(event_detector):
+    """Detector group (DETECTORS key) an event type belongs to."""
+    return {
+        "altitude_jump": "altitude_excursions",
+        "below_home": "altitude_excursions",
+        "error_report": "rc_failsafe",
+        "mode_change": "mode_changes",
+    }.get(event_detector, event_detector)
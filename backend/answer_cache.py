@@ -0,0 +1,120 @@
+"""
+Cache of final chat answers.
+
+Entries are keyed by (log content hash, normalized question), so asking the
+same question about the same log again returns the stored answer without a
+single model round trip. The tool evidence the answer was built from is
+stored alongside it.
+Entries expire after a TTL, the cache is bounded by the JSON size of its
+entries, and every entry of a log is dropped when its session leaves the
+SessionStore.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_MB", "16")) * 1024 * 1024
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+
+_QUOTES = str.maketrans({"“": "", "”": "", "„": "", "‘": "'", "’": "'", '"': ""})
+
+
+def normalize_question(question):
+    """Case, quote, whitespace and trailing-punctuation insensitive form of a question."""
+    text = unicodedata.normalize("NFKC", question or "").translate(_QUOTES).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip(" ?!.")
+
+
+class AnswerCache:
+    """Thread-safe, size-bounded LRU of answers with a time-to-live."""
+
+    def __init__(self, max_bytes=ANSWER_CACHE_MAX_BYTES, ttl=ANSWER_CACHE_TTL_S):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._keys_by_log = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(log_hash, question):
+        return (log_hash, normalize_question(question))
+
+    def get(self, key):
+        """Return the stored {"answer", "evidence", "created"} entry, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[2] > self.ttl:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            value = entry[0]
+        return {**value, "age_s": round(now - entry[2], 3)}
+
+    def put(self, key, answer, evidence=None):
+        value = {"answer": answer, "evidence": evidence or {}}
+        try:
+            nbytes = len(json.dumps(value))
+        except (TypeError, ValueError):
+            logger.warning(f"Answer for {key[1]!r} is not JSON-serializable; not cached")
+            return
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, nbytes, time.monotonic())
+            self._keys_by_log.setdefault(key[0], set()).add(key)
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                old_key = next(iter(self._entries))
+                self._remove(old_key)
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.size -= self._entries.pop(key)[1]
+        keys = self._keys_by_log.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_log[key[0]]
+
+    def invalidate(self, log_hash):
+        """Drop every cached answer for one log."""
+        with self._lock:
+            keys = list(self._keys_by_log.get(log_hash, ()))
+            for key in keys:
+                self._remove(key)
+        if keys:
+            logger.info(f"Answer cache dropped {len(keys)} entries for {log_hash}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "maxBytes": self.max_bytes,
+                "ttlSeconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
@@ -1,29 +1,90 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+import atexit
 import logging
+import logging.handlers
 from datetime import datetime
-import time
+import asyncio
 import json
 import os
-import traceback
-from openai import OpenAI
+import queue
+from functools import lru_cache
+import numpy as np
+from ingest import IngestError, ingest_stream
+from anomalies import DETECTORS, SEVERITIES, query_events
+from answer_cache import AnswerCache
+from evidence import compact_evidence, describe_compaction
+from llm_client import DeadlineExceeded, LLMRuntime
+from metrics import SIZE_BUCKETS, registry
+from question_router import ComplexityClassifier, format_direct_answer, route_question
+from result_cache import ResultCache
+from session_files import SESSION_SHARED_DIR, SESSION_SPILL_DIR, SharedSessions, SpillDirectory
+from sessions import LogSession, SessionStore
+from derived_series import DERIVED_TYPE
+from downsample import METHODS as DOWNSAMPLE_METHODS
+from series_index import INDEX_CACHE
+from telemetry_store import (SUMMARY_OPERATIONS, WHERE_OPERATIONS, TelemetryStore, series_payload, summarize, summarize_window,
+                             to_jsonable)
+from tracing import Trace, span, traced
 app = Flask(__name__)
 CORS(app, origins=["http://localhost:8080"], supports_credentials=True)
 
-# Configure logging to file
+# Configure logging to file. Request threads only enqueue records; a
+# listener thread formats them and does the disk I/O.
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, logging.FileHandler('app.log'))
 logging.basicConfig(
-    filename='app.log',
     level=logging.INFO,
-    format='%(asctime)s - %(message)s'
+    format='%(asctime)s - %(message)s',
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
+registry.histogram("tool_payload_bytes", "Size of tool results returned to the model, by tool.", SIZE_BUCKETS)
+registry.counter("evidence_compacted_total", "Reasoning prompts whose evidence was reduced to fit the token budget.")
+
+# Point budget for series returned by flight_data_parser_tool
+PARSER_MAX_POINTS = int(os.getenv("PARSER_MAX_POINTS", "500"))
+# Largest slice flight_data_parser_tool returns when exact samples are requested
+PARSER_EXACT_MAX_POINTS = int(os.getenv("PARSER_EXACT_MAX_POINTS", "5000"))
+
+# Most summaries evaluated by one flight_data_batch_summary_tool call
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "32"))
+
+# Most anomaly events returned by one flight_anomaly_tool call
+ANOMALY_MAX_EVENTS = int(os.getenv("ANOMALY_MAX_EVENTS", "100"))
+
+# Estimated-token budget for the collected evidence in the reasoning prompt (0: no limit)
+REASONING_EVIDENCE_TOKEN_BUDGET = int(os.getenv("REASONING_EVIDENCE_TOKEN_BUDGET", "8000"))
+
+# Attach per-field statistics to the schema string sent to the model
+SCHEMA_INCLUDE_STATS = os.getenv("SCHEMA_INCLUDE_STATS", "0") == "1"
+
+llm = LLMRuntime()
+# With a shared directory (the multi-worker server) every worker maps the same session files;
+# a single process spills sessions over its memory budget to disk instead
+if SESSION_SHARED_DIR:
+    sessions = SessionStore(shared=SharedSessions(SESSION_SHARED_DIR))
+else:
+    sessions = SessionStore(spill=SpillDirectory(SESSION_SPILL_DIR) if SESSION_SPILL_DIR else None)
+result_cache = ResultCache()
+answer_cache = AnswerCache()
+classifier = ComplexityClassifier()
+# Cached tool results and answers die with their log's session
+sessions.on_drop(lambda session: result_cache.invalidate(session.session_id))
+sessions.on_drop(lambda session: answer_cache.invalidate(session.session_id))
+
 # Common prompt components
 SIMPLE_QUESTION_TOOL_INSTRUCTIONS = """
-You have two tools:
+You have these tools:
 
-• **flight_data_parser_tool** – fetches an entire telemetry series or a scalar value.
+• **flight_data_parser_tool** – fetches a telemetry series or a scalar value.
    ▸ Argument: keys_list (e.g. ['GPS[0]', 'Status'])
+   ▸ Long series are downsampled to max_points (default 500); the result
+     reports the original sample count and time range. Use start_ms / end_ms
+     with exact=true when you need every sample of a short slice.
 
 • **flight_data_summary_tool** – computes a simple summary from a telemetry series.
    ▸ Arguments:
@@ -31,25 +92,60 @@ You have two tools:
        operation : 'first' | 'last' | 'min' | 'max' | 'average' |
                    'first_index_where' | 'count_where'
        comparison, threshold : only for *_where operations
+       start_ms, end_ms, flight_mode : optional; restrict the summary to a time
+                   window (ms since boot) and/or to the segments flown in one
+                   flight mode, e.g. the 30 s after an event:
+                   start_ms=T, end_ms=T+30000
+
+• **flight_data_batch_summary_tool** – several summaries in one call.
+   ▸ Argument: requests, a list of summary-tool argument objects, e.g.
+       [{keys_list: ['GPS[0]', 'time_boot_ms'], operation: 'first'},
+        {keys_list: ['GPS[0]', 'time_boot_ms'], operation: 'last'},
+        {keys_list: ['GPS[0]', 'Status'], operation: 'count_where',
+         comparison: '<', threshold: 3}]
+   ▸ Returns a table of results keyed by 'Type.Field operation'.
+
+• **flight_anomaly_tool** (when it is offered) – every anomaly event detected
+   in the log (GPS, battery, altitude, EKF, failsafes, mode changes) in one call.
+   ▸ Optional arguments: detectors, min_severity, start_ms, end_ms
+
+• **Derived series** – the schema entry DERIVED lists series the server computes
+   from several fields, e.g. 'vibration_magnitude', 'ground_speed' or a graph
+   expression such as 'sqrt(IMU[0].AccX**2+IMU[0].AccY**2+IMU[0].AccZ**2)'.
+   ▸ Use them as paths in any tool: keys_list ['DERIVED', 'vibration_magnitude'].
+   ▸ Other expressions over fields work the same way, with + - * / **, sqrt,
+     degrees, radians, abs and lowpass(value, key, factor), e.g.
+     ['DERIVED', 'CTUN.As*CTUN.E2T'].
+   ▸ Prefer one derived series to fetching every component series.
 
 **When to use each tool:**
 
+❗ **Use flight_anomaly_tool first** (when it is offered) for "any issues /
+   anomalies / errors / failsafes?" questions: one call returns every
+   precomputed event; then fetch only the series needed to explain them.
+
 ❗ **Use flight_data_summary_tool directly** for:
    • Duration calculations: get 'first' and 'last' timestamps from time series
    • Statistical summaries: min, max, average of any series
    • Count operations: count_where with conditions
    • Any calculation that needs just the first/last/min/max values
+   • Anything about a time span or flight mode ("during the 30 s after …",
+     "while in AUTO") – pass start_ms / end_ms / flight_mode instead of
+     fetching the full series
 
 ❗ **Use flight_data_parser_tool** only for:
    • When you need the full series for complex analysis
 
 
-➡️ **One tool call = one atomic path.** Never chain multiple fields in the same call.
+➡️ **One keys_list = one atomic path.** Never chain multiple fields in the same path.
 
    ⛔ Wrong : ['GPS[0]', 'time_boot_ms', 'Status']
    ✅ Right : ['GPS[0]', 'time_boot_ms']   (summary call #1)
              ['GPS[0]', 'Status']         (parser call #2)
 
+➡️ **Need two or more summaries? Send them together** in one
+   flight_data_batch_summary_tool call instead of one summary call per turn.
+
 ❌ No prose, explanations, or partial answers before the tool calls.
 
 ✅ After tool responses arrive, compose a short answer (≤ 4 sentences) followed by
@@ -65,18 +161,118 @@ flight_data_parser_tool_schema = {
         "type": "object",
         "properties": {
             "keys_list": {
-                "type": "object",
-                "description": "A dictionary that represents the path to the desired value in the data. Each key leads to the next nested level. For example: {\"message_type\": \"POS\", \"field\": \"Alt\"}"
+                "type": "array",
+                "description": "Path to the desired value in the data: message type, field and optionally a sample index. For example: ['POS', 'Alt'], ['GPS[0]', 'Status', 0] or a derived series, ['DERIVED', 'ground_speed']. Near-miss names are resolved automatically and reported as resolved_path.",
+                "items": {"type": ["string", "integer"]}
+            },
+            "max_points": {
+                "type": "integer",
+                "description": f"Point budget for long series (default {PARSER_MAX_POINTS}, at most {PARSER_EXACT_MAX_POINTS}). Longer series are downsampled to this many points, preserving their shape."
             },
+            "method": {
+                "type": "string",
+                "enum": ["lttb", "minmax"],
+                "description": "Downsampling method: 'lttb' (default, preserves the visual shape) or 'minmax' (keeps every bucket's extremes, so spikes always survive)."
+            },
+            "exact": {
+                "type": "boolean",
+                "description": "Return every sample instead of a downsample. Combine with start_ms/end_ms to keep the slice small."
+            },
+            "start_ms": {
+                "type": "number",
+                "description": "Optional slice start in milliseconds since boot."
+            },
+            "end_ms": {
+                "type": "number",
+                "description": "Optional slice end in milliseconds since boot (inclusive)."
+            }
         },
         "required": ["keys_list"]
     }
 }
+flight_anomaly_tool_schema = {
+    "name": "flight_anomaly_tool",
+    "description": (
+        "Returns the time-stamped anomaly events detected once over the whole log: "
+        "GPS fix loss, satellite drops, battery voltage sag and over-temperature, "
+        "altitude jumps, EKF variance spikes, RC failsafes / ERR reports and flight-mode changes. "
+        "One call replaces probing each series separately."
+    ),
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "detectors": {
+                "type": "array",
+                "description": "Optional subset of detectors; omit for all.",
+                "items": {"type": "string", "enum": list(DETECTORS)}
+            },
+            "min_severity": {
+                "type": "string",
+                "enum": list(SEVERITIES),
+                "description": "Only return events at or above this severity (default 'info')."
+            },
+            "start_ms": {
+                "type": "number",
+                "description": "Optional window start in milliseconds since boot."
+            },
+            "end_ms": {
+                "type": "number",
+                "description": "Optional window end in milliseconds since boot (inclusive)."
+            }
+        },
+        "required": []
+    }
+}
+flight_data_batch_summary_tool_schema = {
+    "name": "flight_data_batch_summary_tool",
+    "description": (
+        "Computes several flight_data_summary_tool requests in one call and "
+        "returns a table of results keyed by 'Type.Field operation [comparison threshold]' "
+        "(or by each request's label). Prefer it whenever you need more than one summary."
+    ),
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "requests": {
+                "type": "array",
+                "description": "Summary requests; each takes the flight_data_summary_tool arguments.",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "keys_list": {
+                            "type": "array",
+                            "description": "Path to one series, e.g. ['GPS[0]', 'Status']",
+                            "items": {"type": ["string", "integer"]}
+                        },
+                        "operation": {
+                            "type": "string",
+                            "enum": list(SUMMARY_OPERATIONS)
+                        },
+                        "comparison": {
+                            "type": "string",
+                            "enum": ["==", "!=", "<", "<=", ">", ">="]
+                        },
+                        "threshold": {"type": ["number", "integer", "string", "boolean"]},
+                        "start_ms": {"type": "number"},
+                        "end_ms": {"type": "number"},
+                        "flight_mode": {"type": "string"},
+                        "label": {
+                            "type": "string",
+                            "description": "Optional key for this result in the returned table."
+                        }
+                    },
+                    "required": ["keys_list", "operation"]
+                }
+            }
+        },
+        "required": ["requests"]
+    }
+}
 flight_data_summary_tool_schema = {
     "name": "flight_data_summary_tool",
     "description": (
-        "Returns a summary statistic computed from a telemetry series that "
-        "has already been fetched via flight_data_parser_tool."
+        "Returns a summary statistic computed on the server from the telemetry series "
+        "at keys_list; the series does not need to be fetched with flight_data_parser_tool first."
     ),
     "parameters": {
         "type": "object",
@@ -85,7 +281,8 @@ flight_data_summary_tool_schema = {
                 "type": "array",
                 "description": (
                     "Path to the series you want to summarise, e.g. "
-                    "['GPS[0]', 'Status'] or ['POS', 'Alt']"
+                    "['GPS[0]', 'Status'] or ['POS', 'Alt'], or a derived "
+                    "series: ['DERIVED', 'vibration_magnitude']"
                 ),
                 "items": {"type": ["string", "integer"]}
             },
@@ -108,137 +305,382 @@ flight_data_summary_tool_schema = {
             "threshold": {
                 "type": ["number", "integer", "string", "boolean"],
                 "description": "Value to compare against in *_where operations"
+            },
+            "start_ms": {
+                "type": "number",
+                "description": (
+                    "Optional window start in milliseconds since boot "
+                    "(same scale as time_boot_ms). Omit for the start of the log."
+                )
+            },
+            "end_ms": {
+                "type": "number",
+                "description": (
+                    "Optional window end in milliseconds since boot (inclusive). "
+                    "Omit for the end of the log."
+                )
+            },
+            "flight_mode": {
+                "type": "string",
+                "description": (
+                    "Optional flight mode name (e.g. 'AUTO', 'RTL'); restricts "
+                    "the summary to the segments flown in that mode."
+                )
             }
         },
         "required": ["keys_list", "operation"]
     }
 }
 
-def _apply_comparison(value, comparison, threshold):
-    if comparison == "==":  return value == threshold
-    if comparison == "!=":  return value != threshold
-    if comparison == "<":   return value < threshold
-    if comparison == "<=":  return value <= threshold
-    if comparison == ">":   return value > threshold
-    if comparison == ">=":  return value >= threshold
-    return False
+def cached_tool_result(data, path, operation, compute, comparison=None, threshold=None, window=None, numeric=True):
+    """
+    Return compute() through the result cache; logs without a content hash are
+    not cached. `numeric` tells whether the threshold applies to a numeric series.
+    """
+    if data.digest is None:
+        return compute()
+    key = result_cache.key(data.digest, path, operation, comparison, threshold, window, numeric)
+    hit, result = result_cache.get(key)
+    if hit:
+        logger.info(f"Tool result for {path} ({operation}) served from cache")
+        return result
+    result = compute()
+    result_cache.put(key, result)
+    return result
 
 
-def flight_data_summary_tool(keys_list, operation, data, comparison=None, threshold=None):
+def flight_data_summary_tool(keys_list, operation, data, comparison=None, threshold=None,
+                             start_ms=None, end_ms=None, flight_mode=None):
     """
-    Summarise a telemetry series already present in `data`.
+    Summarise a telemetry series already present in `data` (a TelemetryStore).
+    All operations are vectorized reductions over the stored column. With
+    start_ms / end_ms / flight_mode the summary covers only that window,
+    located by binary search on the message type's time column.
     """
-    series = flight_data_parser_tool(keys_list, data)
+    resolution, series = resolve_series(keys_list, data)
+    if series is None:
+        return resolution
 
-    # Guard-rails: series must be list-like or dict of lists
-    if series is None or series == {}:
-        logger.info(f"Series not found for {keys_list}")
-        return {"error": "series_not_found"}
+    result = summarize_series(data, resolution, series, operation, comparison, threshold,
+                              start_ms, end_ms, flight_mode)
+    if resolution.corrected:
+        result = {"resolved_path": resolution.path, "result": result}
+
+    logger.info(f"Summary {operation} computed for {keys_list} with result {result}")
+    return result
 
-    # Convert dict-of-lists → list (we only need values)
-    if isinstance(series, dict):
-        # assume dict keyed by indices or timestamps → list(values)
-        series = list(series.values())
 
-    # From here `series` should be indexable
-    if not isinstance(series, (list, tuple)):
+def not_found(error, resolution):
+    """Tool error for an unresolved path, with suggestions and, for derived series, the reason."""
+    result = {"error": error, "suggestions": resolution.suggestions}
+    if resolution.detail:
+        result["detail"] = resolution.detail
+    return result
+
+
+def resolve_series(keys_list, data):
+    """(resolution, series) for a summary path, or (error dict, None)."""
+    resolution = data.resolve(keys_list)
+
+    # Guard-rails: path must resolve to a single series
+    if not resolution.found:
+        logger.info(f"Series not found for {keys_list}")
+        return not_found("series_not_found", resolution), None
+    series = data.get(resolution)
+    if not isinstance(series, np.ndarray) or resolution.index is not None:
         logger.info(f"Series {keys_list} not iterable")
-        return {"error": "not_iterable"}
-
-    result = None
-    if operation == "first":
-        result = series[0]
-    elif operation == "last":
-        result = series[-1]
-    elif operation == "min":
-        result = min(series)
-    elif operation == "max":
-        result = max(series)
-    elif operation == "average":
-        result = sum(series) / len(series) if series else None
-    elif operation == "first_index_where":
-        if comparison is None or threshold is None:
-            return {"error": "comparison_or_threshold_missing"}
-        for idx, val in enumerate(series):
-            if _apply_comparison(val, comparison, threshold):
-                result = {"index": idx, "value": val}
-                break
-        if result is None:
-            result = {"index": None, "value": None}
-    elif operation == "count_where":
-        if comparison is None or threshold is None:
-            return {"error": "comparison_or_threshold_missing"}
-        count = sum(_apply_comparison(v, comparison, threshold) for v in series)
-        result = {"count": count}
+        return {"error": "not_iterable"}, None
+    return resolution, series
+
+
+def summarize_series(data, resolution, series, operation, comparison=None, threshold=None,
+                     start_ms=None, end_ms=None, flight_mode=None):
+    """One summary of an already resolved series, through the result cache."""
+    table = data.table(resolution.message_type, resolution.field)
+    windowed = start_ms is not None or end_ms is not None or flight_mode is not None
+    if windowed:
+        ranges = data.window_ranges(resolution.message_type, start_ms, end_ms, flight_mode, resolution.field)
+        if ranges is None:
+            return {"error": "no_time_column"}
+        window = (start_ms, end_ms, flight_mode)
+
+        def compute():
+            return to_jsonable({
+                "window": {
+                    "start_ms": start_ms,
+                    "end_ms": end_ms,
+                    "flight_mode": flight_mode,
+                    "samples": sum(hi - lo for lo, hi in ranges)
+                },
+                "result": summarize_window(series, table.time_ms, ranges, operation, comparison, threshold)
+            })
     else:
-        result = {"error": "unknown_operation"}
+        window = None
+
+        def compute():
+            # The threshold index is built lazily, on the first *_where call for this series (None: scan)
+            index = table.series_index(resolution.field) if operation in WHERE_OPERATIONS else None
+            stats = table.stats.get(resolution.field)
+            return to_jsonable(summarize(series, operation, comparison, threshold, stats, index))
+
+    return cached_tool_result(data, resolution.path, operation, compute, comparison, threshold, window,
+                              numeric=series.dtype.kind in "biuf")
+
+
+def batch_request_key(request):
+    """Compact result-table key for one batch request, e.g. 'GPS[0].Status count_where <3'."""
+    if request.get("label"):
+        return str(request["label"])
+    keys = request.get("keys_list") or []
+    key = ".".join(str(k) for k in (keys if isinstance(keys, list) else [keys]))
+    key += f" {request.get('operation')}"
+    if request.get("comparison") is not None:
+        key += f" {request.get('comparison')}{request.get('threshold')}"
+    window = [request.get(name) for name in ("start_ms", "end_ms", "flight_mode")]
+    if any(value is not None for value in window):
+        key += " @" + ",".join("" if value is None else str(value) for value in window)
+    return key
+
+
+def flight_data_batch_summary_tool(requests, data):
+    """
+    Evaluate many summary requests in one call. Requests on the same series
+    are grouped so each path is resolved and its series (and threshold index)
+    touched once; results come back keyed by batch_request_key().
+    """
+    if not isinstance(requests, list) or not requests:
+        return {"error": "requests_missing"}
+    if len(requests) > BATCH_MAX_REQUESTS:
+        return {"error": "too_many_requests", "max_requests": BATCH_MAX_REQUESTS}
+
+    groups = {}
+    results = {}
+    resolved_paths = {}
+    resolutions = {}
+    for request in requests:
+        if not isinstance(request, dict):
+            continue
+        key = batch_request_key(request)
+        results[key] = None  # keeps the table in request order
+        keys_list = request.get("keys_list")
+        spelling = json.dumps(keys_list)
+        if spelling not in resolutions:
+            resolutions[spelling] = resolve_series(keys_list, data)
+        resolution, series = resolutions[spelling]
+        if series is None:
+            results[key] = resolution
+            continue
+        if resolution.corrected:
+            requested = keys_list if isinstance(keys_list, list) else [keys_list]
+            resolved_paths[".".join(str(k) for k in requested)] = resolution.path
+        group = groups.setdefault(tuple(resolution.path), (resolution, series, []))
+        group[2].append((key, request))
+
+    for resolution, series, group in groups.values():
+        for key, request in group:
+            results[key] = summarize_series(
+                data, resolution, series,
+                request.get("operation"),
+                request.get("comparison"),
+                request.get("threshold"),
+                request.get("start_ms"),
+                request.get("end_ms"),
+                request.get("flight_mode")
+            )
 
-    logger.info(f"Summary {operation} computed for {keys_list} with result {result}")
-    return result
+    batch = {"results": results, "series": len(groups)}
+    if resolved_paths:
+        batch["resolved_paths"] = resolved_paths
+    logger.info(f"Batch summary of {len(requests)} requests over {len(groups)} series")
+    return batch
 
 
-def flight_data_parser_tool(keys_list, data):
+def flight_data_parser_tool(keys_list, data, max_points=None, method=None, exact=False,
+                            start_ms=None, end_ms=None):
+    """
+    Fetch a value, series or message table from `data` (a TelemetryStore).
+    Short series come back as plain lists. Longer series, and any request
+    with a time window, come back as a bounded payload: a shape-preserving
+    downsample to `max_points` (or the exact samples when `exact`), with the
+    original sample count and time range.
+    """
     #"keys_list":["GPS[0]","Status"]
-    # logging data retrieved to a file log.txt
-    parsed = False
-    print(keys_list)
-    for key in keys_list:
-        if type(key) == int:
-            data = list(data.values())
-            data = data[key]
-            parsed = True
-            continue
-        if key in data:
-            data = data[key]
-            parsed = True
+    resolution = data.resolve(keys_list)
+    found = data.get(resolution) if resolution.found else None
 
-    if parsed:
-        logger.info(f"Data retrieved for keys {keys_list}")
-        return data
-    else:
+    if found is None:
         logger.info(f"Data not found for keys {keys_list}")
-        return {}
-
-def handle_tool_calls(tool_calls, data):
-    results = []
-    for tc in tool_calls:
-        tool_name = tc.function.name
-        print("Tool name: ", tool_name)
-        args = json.loads(tc.function.arguments)
-
-        if tool_name == "flight_data_parser_tool":
-            extracted = flight_data_parser_tool(args.get("keys_list"), data)
-            content = extracted if extracted != {} else \
-                f"Data not found for keys {args.get('keys_list')}"
-            results.append({
-                "role": "tool",
-                "content": json.dumps(content),
-                "tool_call_id": tc.id,
-                "keys_list": args.get("keys_list"),
-                "operation": "parser"
-            })
+        return not_found("path_not_found", resolution)
 
-        elif tool_name == "flight_data_summary_tool":
-            summary = flight_data_summary_tool(
-                args.get("keys_list"),
-                args.get("operation"),
-                data,
-                args.get("comparison"),
-                args.get("threshold")
-            )
-            results.append({
-                "role": "tool",
-                "content": json.dumps(summary),
-                "tool_call_id": tc.id,
-                "keys_list": args.get("keys_list"),
-                "operation": args.get("operation")
-            })
+    logger.info(f"Data retrieved for keys {keys_list} at {resolution.path}")
+    table = data.table(resolution.message_type, resolution.field)
+    # The point budget comes from the model: clamp it so it cannot lift the payload bound
+    try:
+        max_points = min(max(int(max_points or PARSER_MAX_POINTS), 2), PARSER_EXACT_MAX_POINTS)
+    except (TypeError, ValueError):
+        return {"error": "invalid_max_points", "max_points": max_points}
+    method = method or "lttb"
+    if method not in DOWNSAMPLE_METHODS:
+        return {"error": "unknown_method", "allowed": list(DOWNSAMPLE_METHODS)}
+
+    windowed = start_ms is not None or end_ms is not None
+    if resolution.index is not None or (not windowed and not exact and len(table) <= max_points):
+        compute = lambda: to_jsonable(found)
+        options = None
+    else:
+        window = table.window(start_ms, end_ms) if windowed else (0, len(table))
+        if window is None:
+            return {"error": "no_time_column"}
+        compute = lambda: series_payload(
+            table, resolution.field, window[0], window[1], max_points, method, exact, PARSER_EXACT_MAX_POINTS
+        )
+        options = (max_points, method, bool(exact), start_ms, end_ms)
 
-    return results
-    
-def handle_complex_question(question, data, file_information_str):
-    openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    payload = cached_tool_result(data, resolution.path, "parser", compute, window=options)
+    if resolution.corrected:
+        return {"resolved_path": resolution.path, "data": payload}
+    return payload
 
+def flight_anomaly_tool(data, detectors=None, min_severity=None, start_ms=None, end_ms=None,
+                        limit=ANOMALY_MAX_EVENTS):
+    """
+    Filter the anomaly event table of `data`. The detectors run once per
+    log (at upload for session logs), so this is a list scan.
+    """
+    unknown = [d for d in (detectors or []) if d not in DETECTORS]
+    if unknown:
+        return {"error": "unknown_detector", "detectors": unknown, "available": list(DETECTORS)}
+    result = query_events(data.events(), detectors, min_severity, start_ms, end_ms, limit)
+    logger.info(f"Anomaly tool returned {result['count']} events for {detectors or 'all detectors'}")
+    return result
+
+def tool_arguments(tc):
+    """Decoded arguments of a tool call, or None when they are not a JSON object."""
+    try:
+        args = json.loads(tc.function.arguments or "{}")
+    except (TypeError, ValueError):
+        return None
+    return args if isinstance(args, dict) else None
+
+
+def run_tool_call(tc, data):
+    tool_name = tc.function.name
+    args = tool_arguments(tc)
+    if args is None:
+        # Answered like an unknown tool, so the other calls of the turn still run
+        return {
+            "role": "tool",
+            "content": json.dumps({"error": "invalid_arguments", "tool": tool_name,
+                                   "message": "arguments must be a JSON object"}),
+            "tool_call_id": tc.id,
+            "keys_list": None,
+            "operation": tool_name
+        }
+
+    if tool_name == "flight_data_parser_tool":
+        extracted = flight_data_parser_tool(
+            args.get("keys_list"),
+            data,
+            args.get("max_points"),
+            args.get("method"),
+            args.get("exact", False),
+            args.get("start_ms"),
+            args.get("end_ms")
+        )
+        return {
+            "role": "tool",
+            "content": json.dumps(extracted),
+            "tool_call_id": tc.id,
+            "keys_list": args.get("keys_list"),
+            "operation": "parser"
+        }
+
+    elif tool_name == "flight_data_summary_tool":
+        summary = flight_data_summary_tool(
+            args.get("keys_list"),
+            args.get("operation"),
+            data,
+            args.get("comparison"),
+            args.get("threshold"),
+            args.get("start_ms"),
+            args.get("end_ms"),
+            args.get("flight_mode")
+        )
+        return {
+            "role": "tool",
+            "content": json.dumps(summary),
+            "tool_call_id": tc.id,
+            "keys_list": args.get("keys_list"),
+            "operation": args.get("operation")
+        }
+
+    elif tool_name == "flight_data_batch_summary_tool":
+        batch = flight_data_batch_summary_tool(args.get("requests"), data)
+        return {
+            "role": "tool",
+            "content": json.dumps(batch),
+            "tool_call_id": tc.id,
+            "keys_list": [request.get("keys_list") for request in args.get("requests") or []
+                          if isinstance(request, dict)],
+            "operation": "batch_summary"
+        }
+
+    elif tool_name == "flight_anomaly_tool":
+        events = flight_anomaly_tool(
+            data,
+            args.get("detectors"),
+            args.get("min_severity"),
+            args.get("start_ms"),
+            args.get("end_ms")
+        )
+        return {
+            "role": "tool",
+            "content": json.dumps(events),
+            "tool_call_id": tc.id,
+            "keys_list": args.get("detectors") or list(DETECTORS),
+            "operation": "anomalies"
+        }
+
+    # Every tool call needs an answer, or the next completion request is rejected
+    return {
+        "role": "tool",
+        "content": json.dumps({"error": "unknown_tool", "tool": tool_name}),
+        "tool_call_id": tc.id,
+        "keys_list": args.get("keys_list"),
+        "operation": tool_name
+    }
+
+
+def emit(on_event, event, **payload):
+    """Report pipeline progress to a streaming client, if there is one."""
+    if on_event is not None:
+        on_event(event, payload)
+
+async def handle_tool_calls(tool_calls, data, on_event=None):
+    """Run the tool calls of one model turn concurrently; results keep the call order."""
+    async def run(tc):
+        emit(on_event, "tool_call", id=tc.id, name=tc.function.name, arguments=tc.function.arguments)
+        with span("tool_call", tc.function.name) as current:
+            result = await asyncio.to_thread(run_tool_call, tc, data)
+            payload_bytes = len(result["content"])
+            current.set(path=result["keys_list"], operation=result["operation"], payload_bytes=payload_bytes)
+        registry.observe("tool_payload_bytes", payload_bytes, tool=tc.function.name)
+        emit(on_event, "tool_result", id=tc.id, name=tc.function.name, keys_list=result["keys_list"],
+             operation=result["operation"], elapsed_ms=current.duration_ms)
+        return result
+
+    return list(await asyncio.gather(*(run(tc) for tc in tool_calls)))
+
+def record_evidence(evidence, results):
+    """Add tool results to the evidence dict, keyed by operation and path."""
+    for result in results:
+        try:
+            content = json.loads(result["content"])
+        except (TypeError, ValueError):
+            content = result["content"]
+        evidence[f"{result['operation']} - {result['keys_list']}"] = content
+    
+async def handle_complex_question(question, data, file_information_str, evidence=None, on_event=None):
     stage1_messages = [
         {
             "role": "system",
@@ -255,6 +697,7 @@ def handle_complex_question(question, data, file_information_str):
             {SIMPLE_QUESTION_TOOL_INSTRUCTIONS}
 
             If the question requires a time series analysis, you must use the summary tool.
+            For anomaly, issue or failsafe questions, call flight_anomaly_tool before anything else.
             """
         },
         {"role": "user", "content": question}
@@ -262,35 +705,45 @@ def handle_complex_question(question, data, file_information_str):
 
     tools = [
         {"type": "function", "function": flight_data_parser_tool_schema},
-        {"type": "function", "function": flight_data_summary_tool_schema}
+        {"type": "function", "function": flight_data_summary_tool_schema},
+        {"type": "function", "function": flight_data_batch_summary_tool_schema},
+        {"type": "function", "function": flight_anomaly_tool_schema}
     ]
 
-    collected_data = {}
+    collected_data = evidence if evidence is not None else {}
     done = False
-    while not done:
-        response = openai.chat.completions.create(
-            model="gpt-4.1",
-            messages=stage1_messages,
-            tools=tools
-        )
-        finish_reason = response.choices[0].finish_reason
-
-        if finish_reason == "tool_calls":
-            message = response.choices[0].message
-            tool_calls = message.tool_calls
-            results = handle_tool_calls(tool_calls, data)
-            stage1_messages.append(message)
-            stage1_messages.extend(results)
-
-            for result in results:
-                try:
-                    content = json.loads(result["content"])
-                    collected_data[f"{result['operation']} - {result['keys_list']}"] = content
-                except:
-                    collected_data[f"{result['operation']} - {result['keys_list']}"] = result["content"]
-            time.sleep(1)
-        else:
-            done = True
+    with span("collection", "complex") as stage:
+        turns = 0
+        while not done:
+            response = await llm.complete(
+                stage="collection",
+                messages=stage1_messages,
+                tools=tools
+            )
+            finish_reason = response.choices[0].finish_reason
+            turns += 1
+
+            if finish_reason == "tool_calls":
+                message = response.choices[0].message
+                tool_calls = message.tool_calls
+                results = await handle_tool_calls(tool_calls, data, on_event)
+                stage1_messages.append(message)
+                stage1_messages.extend(results)
+                record_evidence(collected_data, results)
+            else:
+                done = True
+        stage.set(turns=turns, evidence_items=len(collected_data))
+
+    with span("compaction") as current:
+        evidence_text, report = await asyncio.to_thread(
+            compact_evidence, collected_data, REASONING_EVIDENCE_TOKEN_BUDGET)
+        current.set(tokens_before=report["tokens_before"], tokens_after=report["tokens_after"],
+                    compacted=list(report["compacted"]), duplicates=list(report["duplicates"]))
+    note = describe_compaction(report)
+    if note:
+        registry.inc("evidence_compacted_total")
+        logger.info(f"Evidence for {question!r} compacted: {json.dumps(report)}")
+    emit(on_event, "compaction", **report)
 
     stage2_messages = [
         {
@@ -316,18 +769,24 @@ def handle_complex_question(question, data, file_information_str):
         },
         {
             "role": "user",
-            "content": f"Question: {question}\n\nCollected Data: {json.dumps(collected_data, indent=2)}"
+            "content": f"Question: {question}\n\nCollected Data: {evidence_text}" + (f"\n\n{note}" if note else "")
         }
     ]
 
-    final_response = openai.chat.completions.create(
-        model="gpt-4.1",
-        messages=stage2_messages
-    )
+    emit(on_event, "stage", stage="reasoning")
+    with span("reasoning", "complex", prompt_bytes=len(stage2_messages[1]["content"])):
+        if on_event is None:
+            final_response = await llm.complete(stage="reasoning", messages=stage2_messages)
+            return final_response.choices[0].message.content
 
-    return final_response.choices[0].message.content
+        # Streaming clients see the answer as it is generated
+        parts = []
+        async for text in llm.stream(stage="reasoning", messages=stage2_messages):
+            parts.append(text)
+            emit(on_event, "token", text=text)
+        return "".join(parts)
 
-def handle_simple_question(question, data, file_information_str):
+async def handle_simple_question(question, data, file_information_str, evidence=None, on_event=None):
     messages = [
         {
             "role": "system",
@@ -366,10 +825,10 @@ def handle_simple_question(question, data, file_information_str):
         {"role": "user", "content": question}
     ]
 
-    openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
     tools = [
         {"type": "function", "function": flight_data_parser_tool_schema},
         {"type": "function", "function": flight_data_summary_tool_schema},
+        {"type": "function", "function": flight_data_batch_summary_tool_schema},
     ]
 
     fetched_paths = set() 
@@ -377,8 +836,8 @@ def handle_simple_question(question, data, file_information_str):
     answer = ""
 
     while not done:
-        response = openai.chat.completions.create(
-            model="gpt-4.1",
+        response = await llm.complete(
+            stage="simple",
             messages=messages,
             tools=tools
         )
@@ -390,8 +849,8 @@ def handle_simple_question(question, data, file_information_str):
             msg = choice.message
             new_calls = []
             for tc in msg.tool_calls:
-                if tc.function.name == "flight_data_parser_tool":
-                    args = json.loads(tc.function.arguments)
+                args = tool_arguments(tc)
+                if tc.function.name == "flight_data_parser_tool" and args is not None:
                     path_tuple = tuple(args.get("keys_list", []))
                     if path_tuple in fetched_paths:
                         continue
@@ -401,95 +860,401 @@ def handle_simple_question(question, data, file_information_str):
                     new_calls.append(tc)
 
             msg.tool_calls = new_calls  # keep only unique parser calls
-            results = handle_tool_calls(msg.tool_calls, data)
+            results = await handle_tool_calls(msg.tool_calls, data, on_event)
             messages.append(msg)
             messages.extend(results)
-            time.sleep(1)
+            if evidence is not None:
+                record_evidence(evidence, results)
         else:
             answer = choice.message.content
+            emit(on_event, "token", text=answer)
             done = True
 
     return answer
 
-def handle_chat_request(question, data, file_information_str):
-    openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+def answer_direct(query, data, evidence=None):
+    """Answer a routed single-statistic question with the summary tool alone; None if it cannot."""
+    results = [flight_data_summary_tool(keys_list, operation, data) for keys_list, operation in query.calls]
+    answer = format_direct_answer(query, results)
+    if answer is not None and evidence is not None:
+        for (keys_list, operation), result in zip(query.calls, results):
+            evidence[f"{operation} - {keys_list}"] = result
+    return answer
 
-    # Stage 0: Let the LLM decide complexity
-    classification_messages = [
-        {
-            "role": "system",
-            "content": f"""
-            You are an expert UAV log assistant. Given a user's question about UAV flight data, classify whether the question is:
-            - 'simple': can be answered using 1–2 data points (e.g., altitude, satellite count, flight duration using first/last timestamps) or without any data points.
-            - 'complex': requires multiple data points, sequence analysis, or anomaly detection (e.g., identifying mid-flight issues, summaries, comparisons, trend analysis). Questions that need time series analysis beyond simple first/last values are complex.
+async def classify_question(question, file_information_str, on_event=None):
+    """'simple' or 'complex', from the local classifier or, when it is unsure, the model."""
+    complexity = classifier.classify(question)
+    source = "local"
+    if complexity is None:
+        emit(on_event, "stage", stage="classification")
+        source = "model"
+        classification_messages = [
+            {
+                "role": "system",
+                "content": f"""
+                You are an expert UAV log assistant. Given a user's question about UAV flight data, classify whether the question is:
+                - 'simple': can be answered using 1–2 data points (e.g., altitude, satellite count, flight duration using first/last timestamps) or without any data points.
+                - 'complex': requires multiple data points, sequence analysis, or anomaly detection (e.g., identifying mid-flight issues, summaries, comparisons, trend analysis). Questions that need time series analysis beyond simple first/last values are complex.
+
+                Data points are the values of the keys in the schema.
+                {file_information_str}
+
+                Respond with a single word: "simple" or "complex" only.
+                """
+            },
+            {"role": "user", "content": question}
+        ]
+
+        classification_response = await llm.complete(stage="classification", messages=classification_messages)
+
+        complexity = classification_response.choices[0].message.content.strip().lower()
+        classifier.learn(question, complexity)
+
+    logger.info(f"Complexity of {question!r}: {complexity} ({source})")
+    emit(on_event, "classification", complexity=complexity, source=source)
+    return complexity
+
+async def handle_chat_request(question, data, file_information_str, evidence=None, on_event=None):
+
+    # Known single-statistic questions never reach the model
+    query = route_question(question, data)
+    if query is not None:
+        with span("direct_answer", query.operation) as current:
+            answer = await asyncio.to_thread(answer_direct, query, data, evidence)
+            current.set(path=[keys_list for keys_list, _ in query.calls], answered=answer is not None)
+        if answer is not None:
+            logger.info(f"Answered {question!r} directly from {query.calls}")
+            emit(on_event, "classification", complexity="direct", source="local")
+            emit(on_event, "token", text=answer)
+            return answer
+
+    # Stage 0: decide complexity locally; ask the LLM only when the classifier is unsure
+    with span("classification") as current:
+        complexity = await classify_question(question, file_information_str, on_event)
+        current.set(complexity=complexity)
+
+    emit(on_event, "stage", stage="collection")
+    if complexity == "simple":
+        with span("simple", "simple"):
+            return await handle_simple_question(question, data, file_information_str, evidence, on_event)
+    else:
+        return await handle_complex_question(question, data, file_information_str, evidence, on_event)
 
-            Data points are the values of the keys in the schema.
-            {file_information_str}
+@lru_cache(maxsize=1)
+def load_schema_info():
+    with open('schema-info.json', 'r') as f:
+        return json.load(f)
 
-            Respond with a single word: "simple" or "complex" only.
-            """
-        },
-        {"role": "user", "content": question}
-    ]
 
-    classification_response = openai.chat.completions.create(
-        model="gpt-4.1",
-        messages=classification_messages
-    )
+def build_file_information(store, include_stats=SCHEMA_INCLUDE_STATS):
+    """
+    Schema string for the prompts. With include_stats, each field also
+    carries its precomputed count/first/last/min/max/mean so the model can
+    answer simple questions without a tool call.
+    """
+    schema_info = load_schema_info()
+    file_information = {}
+    for message_type in store.message_types:
+        entry = schema_info.get(message_type, store.fields(message_type))
+        if include_stats:
+            if isinstance(entry, list):
+                entry = {field: {} for field in entry}
+            stats = store.tables[message_type].stats
+            entry = {
+                field: dict(info, stats=schema_stats(stats[field])) if field in stats else info
+                for field, info in entry.items()
+            }
+        file_information[message_type] = entry
+    derived = store.derived_series()
+    if derived:
+        file_information[DERIVED_TYPE] = {name: description for name, (_, description) in derived.items()}
+    return json.dumps(file_information)
 
-    complexity = classification_response.choices[0].message.content.strip().lower()
 
-    print("Complexity: ", complexity)
-    time.sleep(1)
-    if complexity == "simple":
-        return handle_simple_question(question, data, file_information_str)
-    else:
-        return handle_complex_question(question, data, file_information_str)
+def schema_stats(stats):
+    keys = ("count", "first", "last", "min", "max", "mean")
+    return {k: round(v, 4) if isinstance(v, float) else v
+            for k, v in to_jsonable(stats).items() if k in keys}
+
+
+def describe_log(name, log_type, store):
+    return {
+        "name": name,
+        "type": log_type,
+        "messageCount": sum(len(table.columns) for table in store.tables.values()),
+        "messageTypes": list(store.message_types)
+    }
+
+
+@app.route('/api/logs', methods=['POST'])
+def upload_log():
+    """
+    Ingest a parsed log once and return its session id. The id is the content
+    hash of the upload, so uploading the same log twice reuses the session.
+    The body is decoded incrementally (JSON or columnar frames, optionally
+    gzip-compressed; see ingest.py) instead of through request.json.
+    """
+    try:
+        meta, messages, digest = ingest_stream(request.stream)
+        store = TelemetryStore.from_messages(messages, digest=digest)
+        del messages
+        # Anomaly detectors run once per log, at ingest
+        store.events()
+
+        session, created = sessions.add(LogSession(
+            session_id=digest,
+            name=meta.get('name'),
+            log_type=meta.get('type'),
+            data=store,
+            file_information=build_file_information(store),
+            nbytes=store.nbytes
+        ))
+
+        return jsonify({
+            "status": "success",
+            "sessionId": session.session_id,
+            "deduplicated": not created,
+            # The session may already be spilled again; the store just built holds the same log
+            "fileInfo": describe_log(session.name, session.log_type, store)
+        })
+
+    except IngestError as e:
+        logger.info(f"Rejected log upload: {e}")
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+
+    except Exception as e:
+        logger.exception(f"Error ingesting log: {e}")
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 500
+
+
+@app.route('/api/logs/<session_id>', methods=['DELETE'])
+def drop_log(session_id):
+    if not sessions.drop(session_id):
+        return jsonify({"status": "error", "message": "unknown_session"}), 404
+    return jsonify({"status": "success", "sessionId": session_id})
+
+
+def load_chat_log(body):
+    """
+    (store, schema string, log description) for a chat request, from its
+    sessionId or its inline fileInfo. None when the session is unknown.
+    """
+    session_id = body.get('sessionId')
+    if session_id:
+        # Log was uploaded through /api/logs; only the id travels with the question
+        session, data = sessions.get(session_id)
+        if session is None:
+            return None
+        return data, session.file_information, describe_log(session.name, session.log_type, data)
+    file_info = body.get('fileInfo', {})
+    data = TelemetryStore.from_messages(file_info.get('messages'))
+    return data, build_file_information(data), describe_log(file_info.get('name'), file_info.get('type'), data)
+
+
+def unknown_session(session_id):
+    return jsonify({
+        "status": "error",
+        "message": "unknown_or_expired_session",
+        "sessionId": session_id
+    }), 404
+
+
+def cached_answer(data, message, bypass_cache):
+    """(cache key, cached entry or None); logs without a content hash have no key."""
+    cache_key = answer_cache.key(data.digest, message) if data.digest else None
+    if cache_key is None or bypass_cache:
+        return cache_key, None
+    return cache_key, answer_cache.get(cache_key)
+
+
+def chat_response(answer, log_info, session_id, cached):
+    response = {
+        "status": "success",
+        "message": f"{answer}. ",
+        "timestamp": datetime.now().isoformat(),
+        "fileInfo": log_info,
+        "cached": cached is not None
+    }
+    if cached is not None:
+        response["evidence"] = cached["evidence"]
+        response["cacheAgeSeconds"] = cached["age_s"]
+    if session_id:
+        response["sessionId"] = session_id
+    return response
+
+
+def load_traced_chat_log(trace, body):
+    with trace.span("schema_load", "session" if body.get('sessionId') else "inline"):
+        return load_chat_log(body)
+
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
+    trace = Trace("chat")
+    outcome = "error"
     try:
-        data = request.json
-        message = data.get('message')
-        file_info = data.get('fileInfo', {})
-        
-        file_information = {}
-        with open('schema-info.json', 'r') as f:
-            schema_info = json.load(f)
-        for message_type in file_info.get('messages', {}):
-            file_information[message_type] = schema_info.get(message_type, list(file_info['messages'][message_type].keys()))
-        
-                                    
-        file_information_str = json.dumps(file_information)
-        data = file_info.get('messages')
-        
-        # Check if this is a complex question that requires multiple data points
-        answer = handle_chat_request(message, data, file_information_str)
-            
-        
-        response = {
-            "status": "success",
-            "message": f"{answer}. ",
-            "timestamp": datetime.now().isoformat(),
-            "fileInfo": {
-                "name": file_info.get('name'),
-                "type": file_info.get('type'),
-                "messageCount": sum(len(msgs) for msgs in file_info.get('messages', {}).values()),
-                "messageTypes": list(file_info.get('messages', {}).keys())
-            }
-        }
-        
-        return jsonify(response)
+        with trace.span("json_decode", bytes=request.content_length):
+            body = request.json
+        message = body.get('message')
+        session_id = body.get('sessionId')
+
+        loaded = load_traced_chat_log(trace, body)
+        if loaded is None:
+            outcome = "unknown_session"
+            return unknown_session(session_id)
+        data, file_information_str, log_info = loaded
+
+        # Repeat questions on a content-addressed log are answered from the cache
+        cache_key, cached = cached_answer(data, message, body.get('bypassCache'))
+        if cached is not None:
+            logger.info(f"Answer for {message!r} served from cache")
+            answer = cached["answer"]
+            outcome = "cached"
+        else:
+            evidence = {}
+            answer = llm.run(traced(trace, handle_chat_request(message, data, file_information_str, evidence)))
+            if cache_key:
+                answer_cache.put(cache_key, answer, evidence)
+            outcome = "success"
+
+        response = jsonify(chat_response(answer, log_info, session_id, cached))
+        response.headers["X-Trace-Id"] = trace.trace_id
+        return response
+
+    except DeadlineExceeded as e:
+        logger.error(f"Chat request timed out: {e}")
+        outcome = "timeout"
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 504
     
     except Exception as e:
-        logger.error(f"Error processing chat message: {e}")
-        print(traceback.format_exc())
+        logger.exception(f"Error processing chat message: {e}")
         return jsonify({
             "status": "error",
             "message": str(e)
         }), 500
+
+    finally:
+        trace.finish(outcome)
+
+
+def sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Same request body as /api/chat, answered as Server-Sent Events:
+    `classification`, `stage`, `tool_call` / `tool_result` (with timings),
+    `compaction` (the evidence report) and `token` events while the pipeline runs, then one `done` event carrying the
+    /api/chat response body, or an `error` event.
+    """
+    trace = Trace("chat_stream")
+    # Failures before the stream starts are answered as JSON; the generator finishes the trace otherwise
+    try:
+        with trace.span("json_decode", bytes=request.content_length):
+            body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            trace.finish("error")
+            return jsonify({
+                "status": "error",
+                "message": "invalid_request_body"
+            }), 400
+        message = body.get('message')
+        session_id = body.get('sessionId')
+
+        loaded = load_traced_chat_log(trace, body)
+        if loaded is None:
+            trace.finish("unknown_session")
+            return unknown_session(session_id)
+        data, file_information_str, log_info = loaded
+        cache_key, cached = cached_answer(data, message, body.get('bypassCache'))
+    except Exception as e:
+        logger.exception(f"Error starting chat stream: {e}")
+        trace.finish("error")
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 500
+
+    def generate():
+        outcome = "cancelled"
+        try:
+            yield sse("stage", {"stage": "accepted"})
+            if cached is not None:
+                logger.info(f"Answer for {message!r} served from cache")
+                yield sse("classification", {"complexity": "cached", "source": "cache"})
+                yield sse("token", {"text": cached["answer"]})
+                outcome = "cached"
+                yield sse("done", chat_response(cached["answer"], log_info, session_id, cached))
+                return
+
+            # Progress is emitted from the pipeline's loop and worker threads
+            events = queue.Queue()
+            evidence = {}
+            future = llm.submit(traced(trace, handle_chat_request(
+                message, data, file_information_str, evidence,
+                on_event=lambda event, payload: events.put((event, payload))
+            )))
+            future.add_done_callback(lambda _: events.put(None))
+            try:
+                while (item := events.get()) is not None:
+                    yield sse(*item)
+                answer = future.result()
+            except DeadlineExceeded as e:
+                logger.error(f"Chat stream timed out: {e}")
+                outcome = "timeout"
+                yield sse("error", {"status": "error", "message": str(e)})
+                return
+            except Exception as e:
+                logger.exception(f"Error processing chat stream: {e}")
+                outcome = "error"
+                yield sse("error", {"status": "error", "message": str(e)})
+                return
+            finally:
+                # The client went away: stop the pipeline instead of finishing it for nobody
+                if not future.done():
+                    future.cancel()
+
+            if cache_key:
+                answer_cache.put(cache_key, answer, evidence)
+            outcome = "success"
+            yield sse("done", chat_response(answer, log_info, session_id, None))
+        finally:
+            trace.finish(outcome)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+        "X-Trace-Id": trace.trace_id
+    })
     
 
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        "status": "success",
+        "resultCache": result_cache.stats(),
+        "answerCache": answer_cache.stats(),
+        "seriesIndexCache": INDEX_CACHE.stats()
+    })
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Latency histograms and counters of this process, in the Prometheus text format."""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/api/hello', methods=['GET'])
 def hello():
     return jsonify({"message": "Hello from Flask!", "status": "success"})
@@ -0,0 +1 @@
+"""Benchmark suite for the backend: synthetic logs, a stub model server and timing runs."""
@@ -0,0 +1,390 @@
+"""
+Backend benchmark suite.
+
+Run from backend/:
+
+    python -m benchmarks.run                                  # default sizes
+    python -m benchmarks.run --sizes 10000,100000,1000000,10000000 --formats frames
+    python -m benchmarks.run --output benchmarks/baseline.json   # save a baseline
+    python -m benchmarks.run --baseline benchmarks/baseline.json --threshold 0.25
+
+Benchmarks:
+
+* ingest: /api/logs decoding (ingest_stream + TelemetryStore + anomaly pass)
+  for each size and upload encoding. Each run is a fresh child process, so
+  peak RSS is per run.
+* tools: latency of every tool on a store built from the synthetic log,
+  without the result cache (first call and p50 / p95 of repeats), including
+  the evaluation of derived series.
+* chat: end-to-end /api/chat and /api/chat/stream against the stub model
+  server (benchmarks/stub_llm.py): sequential latency, time to first event,
+  cached-answer latency and throughput under concurrent clients.
+
+Results are a flat {metric: value} JSON document. Metric names end in _ms,
+_mb or _rps. With --baseline, any p50 latency, total time, peak RSS or
+throughput worse than the baseline by more than --threshold (and by more
+than a small absolute noise floor) is reported and the exit status is 1.
+Baselines are machine-specific: record one per machine with --output.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.synthetic_log import encode_frames, encode_json, generate_columns
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+NOISE_FLOOR = {"_ms": 1.0, "_mb": 5.0, "_rps": 0.5}
+# Reported but not gated: sizes of the inputs, and single-sample / tail timings that are too noisy
+UNCHECKED = ("upload_mb", "store_mb", "first_ms", "p95_ms")
+
+
+def _percentiles(samples_ms):
+    ordered = sorted(samples_ms)
+    return {
+        "p50_ms": round(statistics.median(ordered), 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))], 3),
+    }
+
+
+def _timed(fn, repeat):
+    """(first call ms, [repeat call ms])."""
+    started = time.perf_counter()
+    fn()
+    first = (time.perf_counter() - started) * 1000
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return first, samples
+
+
+def _rss_mb():
+    """Peak resident set size of this process in MB."""
+    # On Linux ru_maxrss survives exec, so a spawned child would report its
+    # parent's peak; VmHWM belongs to the current address space only.
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / (1024 * 1024)
+
+
+# ---------------------------------------------------------------- ingest
+
+def _ingest_worker(path, results):
+    from ingest import ingest_stream
+    from telemetry_store import TelemetryStore
+
+    baseline_mb = _rss_mb()
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        _, messages, digest = ingest_stream(f)
+    decoded = time.perf_counter()
+    store = TelemetryStore.from_messages(messages, digest=digest)
+    del messages
+    built = time.perf_counter()
+    store.events()
+    finished = time.perf_counter()
+    results.put({
+        "decode_ms": (decoded - started) * 1000,
+        "store_ms": (built - decoded) * 1000,
+        "anomalies_ms": (finished - built) * 1000,
+        "total_ms": (finished - started) * 1000,
+        "peak_rss_mb": _rss_mb(),
+        "peak_rss_over_import_mb": _rss_mb() - baseline_mb,
+        "store_mb": store.nbytes / (1024 * 1024),
+    })
+
+
+def bench_ingest(sizes, formats, workdir):
+    metrics = {}
+    context = multiprocessing.get_context("spawn")
+    for size in sizes:
+        columns = generate_columns(size)
+        for encoding in formats:
+            body = encode_frames(columns) if encoding == "frames" else encode_json(columns)
+            path = os.path.join(workdir, f"log-{size}.{encoding}")
+            with open(path, "wb") as f:
+                f.write(body)
+            upload_mb = len(body) / (1024 * 1024)
+            del body
+
+            results = context.Queue()
+            worker = context.Process(target=_ingest_worker, args=(path, results))
+            worker.start()
+            result = results.get()
+            worker.join()
+            os.remove(path)
+
+            prefix = f"ingest.{encoding}.{size}"
+            metrics[f"{prefix}.upload_mb"] = round(upload_mb, 3)
+            for name, value in result.items():
+                metrics[f"{prefix}.{name}"] = round(value, 3)
+            print(f"  ingest {encoding:6s} {size:>10,d} rows: {result['total_ms']:9.1f} ms, "
+                  f"peak RSS {result['peak_rss_mb']:8.1f} MB")
+        del columns
+    return metrics
+
+
+# ---------------------------------------------------------------- tools
+
+def bench_tools(sizes, repeat):
+    import app
+    from telemetry_store import TelemetryStore
+
+    metrics = {}
+    for size in sizes:
+        # No digest: the result cache is bypassed, so every call does the work
+        store = TelemetryStore.from_messages(generate_columns(size))
+        last_ms = float(store.tables["GPS[0]"].time_ms[-1])
+        cases = {
+            "summary_max": lambda: app.flight_data_summary_tool(["POS", "Alt"], "max", store),
+            "summary_count_where": lambda: app.flight_data_summary_tool(
+                ["GPS[0]", "Status"], "count_where", store, "<", 3),
+            "summary_first_index_where": lambda: app.flight_data_summary_tool(
+                ["XKF4[0]", "SV"], "first_index_where", store, ">", 100),
+            "summary_window_average": lambda: app.flight_data_summary_tool(
+                ["ATT", "Roll"], "average", store, start_ms=last_ms * 0.25, end_ms=last_ms * 0.75),
+            "parser_lttb": lambda: app.flight_data_parser_tool(["ACC", "AccZ"], store),
+            "parser_minmax": lambda: app.flight_data_parser_tool(["ACC", "AccZ"], store, method="minmax"),
+            "batch_summary": lambda: app.flight_data_batch_summary_tool([
+                {"keys_list": ["GPS[0]", "time_boot_ms"], "operation": "first"},
+                {"keys_list": ["GPS[0]", "time_boot_ms"], "operation": "last"},
+                {"keys_list": ["GPS[0]", "NSats"], "operation": "min"},
+                {"keys_list": ["POS", "Alt"], "operation": "average"},
+            ], store),
+            "anomaly_tool": lambda: app.flight_anomaly_tool(store),
+            "path_resolve_fuzzy": lambda: store.resolve(["gps", "nsat"]),
+            # Derived series are evaluated once per store; drop them so every call evaluates
+            "derived_magnitude": lambda: (store._derived.clear(), app.flight_data_summary_tool(
+                ["DERIVED", "acceleration_magnitude"], "max", store)),
+            "derived_lowpass": lambda: (store._derived.clear(), app.flight_data_summary_tool(
+                ["DERIVED", "lowpass(ACC.AccZ,0,0.9)"], "max", store)),
+        }
+        with contextlib.redirect_stdout(io.StringIO()):
+            for name, case in cases.items():
+                first, samples = _timed(case, repeat)
+                prefix = f"tools.{size}.{name}"
+                metrics[f"{prefix}.first_ms"] = round(first, 3)
+                for key, value in _percentiles(samples).items():
+                    metrics[f"{prefix}.{key}"] = value
+            detector_samples = []
+            for _ in range(max(repeat // 4, 1)):
+                started = time.perf_counter()
+                store._events = None
+                store.events()
+                detector_samples.append((time.perf_counter() - started) * 1000)
+        metrics[f"tools.{size}.anomaly_detectors.p50_ms"] = round(statistics.median(detector_samples), 3)
+        print(f"  tools  {size:>10,d} rows: " + ", ".join(
+            f"{name} {metrics[f'tools.{size}.{name}.p50_ms']:.2f}" for name in cases) + " (p50 ms)")
+    return metrics
+
+
+# ---------------------------------------------------------------- chat
+
+def _post(url, payload, timeout=120):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def _first_event_ms(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=120) as response:
+        response.readline()
+        first = (time.perf_counter() - started) * 1000
+        response.read()
+    return first, (time.perf_counter() - started) * 1000
+
+
+def bench_chat(size, requests, clients, llm_latency_ms, workdir):
+    from benchmarks.stub_llm import StubServer
+
+    stub = StubServer(latency_ms=llm_latency_ms).start()
+    os.environ["OPENAI_BASE_URL"] = stub.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["QUESTION_HISTORY_PATH"] = os.path.join(workdir, "question_history.jsonl")
+
+    import app
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}/api"
+    metrics = {}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            body = encode_frames(generate_columns(size))
+            upload = urllib.request.Request(f"{base}/logs", data=body,
+                                            headers={"Content-Type": "application/x-uavlog-frames"})
+            started = time.perf_counter()
+            with urllib.request.urlopen(upload, timeout=600) as response:
+                session_id = json.loads(response.read())["sessionId"]
+            metrics[f"chat.{size}.upload_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+            question = {"message": "Are there any anomalies in this flight?", "sessionId": session_id,
+                        "bypassCache": True}
+            _post(f"{base}/chat", question)  # warm up the client pool and lazy indexes
+
+            latencies = []
+            for _ in range(requests):
+                started = time.perf_counter()
+                _post(f"{base}/chat", question)
+                latencies.append((time.perf_counter() - started) * 1000)
+            for key, value in _percentiles(latencies).items():
+                metrics[f"chat.{size}.latency.{key}"] = value
+
+            first_events, totals = zip(*(_first_event_ms(f"{base}/chat/stream", question) for _ in range(requests)))
+            for key, value in _percentiles(first_events).items():
+                metrics[f"chat.{size}.stream_first_event.{key}"] = value
+            for key, value in _percentiles(totals).items():
+                metrics[f"chat.{size}.stream_total.{key}"] = value
+
+            cached = dict(question, bypassCache=False)
+            _post(f"{base}/chat", cached)
+            _, samples = _timed(lambda: _post(f"{base}/chat", cached), requests)
+            for key, value in _percentiles(samples).items():
+                metrics[f"chat.{size}.cached.{key}"] = value
+
+            direct = {"message": "What was the highest altitude?", "sessionId": session_id, "bypassCache": True}
+            _, samples = _timed(lambda: _post(f"{base}/chat", direct), requests)
+            for key, value in _percentiles(samples).items():
+                metrics[f"chat.{size}.direct.{key}"] = value
+
+            errors = []
+
+            def client(count):
+                for _ in range(count):
+                    try:
+                        _post(f"{base}/chat", question)
+                    except Exception as e:
+                        errors.append(e)
+
+            per_client = max(requests // clients, 1) * 2
+            threads = [threading.Thread(target=client, args=(per_client,)) for _ in range(clients)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            metrics[f"chat.{size}.throughput.{clients}_clients_rps"] = round(
+                (per_client * clients - len(errors)) / elapsed, 3)
+            metrics[f"chat.{size}.throughput.errors"] = len(errors)
+    finally:
+        server.shutdown()
+        stub.stop()
+
+    print(f"  chat   {size:>10,d} rows: p50 {metrics[f'chat.{size}.latency.p50_ms']:.1f} ms, "
+          f"first event {metrics[f'chat.{size}.stream_first_event.p50_ms']:.1f} ms, "
+          f"cached {metrics[f'chat.{size}.cached.p50_ms']:.1f} ms, "
+          f"{metrics[f'chat.{size}.throughput.{clients}_clients_rps']:.1f} req/s with {clients} clients")
+    return metrics
+
+
+# ---------------------------------------------------------------- baselines
+
+def compare(current, baseline, threshold):
+    """Metrics that regressed by more than `threshold` (relative) and the noise floor."""
+    regressions = []
+    for name, base in baseline.get("metrics", {}).items():
+        value = current["metrics"].get(name)
+        if not isinstance(value, (int, float)) or not isinstance(base, (int, float)):
+            continue
+        suffix = next((s for s in NOISE_FLOOR if name.endswith(s)), None)
+        if suffix is None or name.endswith(UNCHECKED):
+            continue
+        higher_is_better = suffix == "_rps"
+        delta = (base - value) if higher_is_better else (value - base)
+        if delta > NOISE_FLOOR[suffix] and delta > threshold * abs(base):
+            regressions.append({"metric": name, "baseline": base, "current": value,
+                                "change": round(delta / base, 3) if base else None})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated synthetic log sizes in rows (default %(default)s)")
+    parser.add_argument("--formats", default="json,frames", help="upload encodings for ingest (json, frames)")
+    parser.add_argument("--only", default="ingest,tools,chat", help="benchmarks to run")
+    parser.add_argument("--repeat", type=int, default=20, help="repeats per tool measurement")
+    parser.add_argument("--chat-size", type=int, default=100_000, help="log size for the chat benchmarks")
+    parser.add_argument("--chat-requests", type=int, default=20, help="sequential chat requests per measurement")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients for the throughput run")
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0, help="stub model latency per completion")
+    parser.add_argument("--output", help="write results JSON here (use it later as --baseline)")
+    parser.add_argument("--baseline", help="baseline results JSON to check against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    only = set(args.only.split(","))
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "sizes": sizes,
+            "args": vars(args),
+        },
+        "metrics": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="uav-bench-") as workdir:
+        if "ingest" in only:
+            print("ingest")
+            results["metrics"].update(bench_ingest(sizes, args.formats.split(","), workdir))
+        if "tools" in only:
+            print("tools")
+            results["metrics"].update(bench_tools(sizes, args.repeat))
+        if "chat" in only:
+            print("chat")
+            results["metrics"].update(bench_chat(args.chat_size, args.chat_requests, args.clients,
+                                                 args.llm_latency_ms, workdir))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for r in regressions:
+                print(f"  {r['metric']}: {r['baseline']} -> {r['current']}")
+            return 1
+        print(f"no regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""
+Local stand-in for the chat-completions API.
+
+It replays a scripted conversation: the Stage 0 classification reply, then
+one scripted tool-call turn per model round trip, then the final answer
+(streamed when the request asks for it). The turn is derived from the
+request itself (the number of assistant tool-call messages already in it),
+so any number of concurrent clients can share one server.
+
+Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+Run standalone with:
+
+    python -m benchmarks.stub_llm --port 8765 --latency-ms 50
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_SCRIPT = {
+    "classification": "complex",
+    "tool_turns": [
+        [
+            {"name": "flight_anomaly_tool", "arguments": {"min_severity": "warning"}},
+            {"name": "flight_data_batch_summary_tool", "arguments": {"requests": [
+                {"keys_list": ["GPS[0]", "time_boot_ms"], "operation": "first"},
+                {"keys_list": ["GPS[0]", "time_boot_ms"], "operation": "last"},
+                {"keys_list": ["GPS[0]", "Status"], "operation": "count_where", "comparison": "<", "threshold": 3},
+                {"keys_list": ["POS", "Alt"], "operation": "max"},
+            ]}},
+        ],
+        [
+            {"name": "flight_data_parser_tool", "arguments": {"keys_list": ["GPS[0]", "NSats"], "max_points": 200}},
+            {"name": "flight_data_summary_tool", "arguments": {
+                "keys_list": ["XKF4[0]", "SV"], "operation": "first_index_where", "comparison": ">", "threshold": 100}},
+        ],
+    ],
+    "answer": (
+        "The flight shows a short GPS fix loss mid-flight together with a satellite drop, and one EKF "
+        "velocity innovation spike.\n\n"
+        "- GPS[0].Status fell below 3D fix once after the first fix.\n"
+        "- GPS[0].NSats dropped to 4 during the same window.\n"
+        "- XKF4[0].SV exceeded the EKF threshold at about 70% of the flight.\n\n"
+        "Recommendations: check the GPS antenna placement and review EKF settings."
+    ),
+}
+
+
+def _usage(messages, content):
+    """Rough token counts (4 characters per token) so usage metrics have something to add up."""
+    prompt = len(json.dumps(messages)) // 4
+    completion = len(content or "") // 4
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def _completion(message, finish_reason, usage):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "stub",
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": usage,
+    }
+
+
+def _chunk(content=None, usage=None):
+    chunk = {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": "stub",
+        "choices": [] if usage else [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+    }
+    if usage:
+        chunk["usage"] = usage
+    return chunk
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+        number = server.count_request()
+        if server.latency_s:
+            time.sleep(server.latency_s)
+        if server.rate_limit_every and number % server.rate_limit_every == 0:
+            self._send_json(429, {"error": {"message": "rate limited", "type": "rate_limit"}},
+                            {"Retry-After": "0.05"})
+            return
+
+        script = server.script
+        messages = body.get("messages", [])
+        system = messages[0].get("content", "") if messages and isinstance(messages[0], dict) else ""
+        if "Respond with a single word" in system:
+            self._send_json(200, _completion({"role": "assistant", "content": script["classification"]}, "stop",
+                                             _usage(messages, script["classification"])))
+            return
+
+        if body.get("tools"):
+            turn = sum(1 for m in messages if isinstance(m, dict) and m.get("role") == "assistant"
+                       and m.get("tool_calls"))
+            if turn < len(script["tool_turns"]):
+                calls = [{
+                    "id": f"call_{turn}_{i}",
+                    "type": "function",
+                    "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])},
+                } for i, call in enumerate(script["tool_turns"][turn])]
+                self._send_json(200, _completion({"role": "assistant", "content": None, "tool_calls": calls},
+                                                 "tool_calls", _usage(messages, json.dumps(calls))))
+                return
+            # The data-collection agent ends its loop with a plain reply
+            content = "done" if "Collection Agent" in system else script["answer"]
+            self._send_json(200, _completion({"role": "assistant", "content": content}, "stop",
+                                             _usage(messages, content)))
+            return
+
+        usage = _usage(messages, script["answer"])
+        if body.get("stream"):
+            self._stream(script["answer"], usage if (body.get("stream_options") or {}).get("include_usage") else None)
+        else:
+            self._send_json(200, _completion({"role": "assistant", "content": script["answer"]}, "stop", usage))
+
+    def _stream(self, text, usage=None):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            piece = word if i == 0 else " " + word
+            self.wfile.write(b"data: " + json.dumps(_chunk(piece)).encode("utf-8") + b"\n\n")
+            if self.server.token_delay_s:
+                self.wfile.flush()
+                time.sleep(self.server.token_delay_s)
+        if usage:
+            self.wfile.write(b"data: " + json.dumps(_chunk(usage=usage)).encode("utf-8") + b"\n\n")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class StubServer(ThreadingHTTPServer):
+    """Threaded stub server; start() serves in a daemon thread."""
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, script=None, latency_ms=0.0, token_delay_ms=0.0,
+                 rate_limit_every=0):
+        super().__init__((host, port), StubHandler)
+        self.script = script or DEFAULT_SCRIPT
+        self.latency_s = latency_ms / 1000.0
+        self.token_delay_s = token_delay_ms / 1000.0
+        self.rate_limit_every = rate_limit_every
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/v1"
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+    def stats(self):
+        return {"requests": self.requests}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="stub-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--script", help="JSON file with classification / tool_turns / answer")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay before every response")
+    parser.add_argument("--token-delay-ms", type=float, default=0.0, help="delay between streamed tokens")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="answer every Nth request with 429")
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, "r") as f:
+            script = json.load(f)
+    server = StubServer(args.host, args.port, script, args.latency_ms, args.token_delay_ms, args.rate_limit_every)
+    print(f"Stub chat-completions API on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
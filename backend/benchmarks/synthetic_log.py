@@ -0,0 +1,192 @@
+"""
+Synthetic parsed logs for benchmarks.
+
+generate_columns(rows) builds a flight with the message types and fields of
+schema-info.json, sized by the total number of rows (records) across all
+message types. Each type is logged at a realistic rate, and values follow
+the field's unit: monotonic timestamps, a climb / cruise / descent altitude
+profile, attitude oscillations, GPS dropouts, an EKF spike and a radio
+failsafe, so every tool and anomaly detector has real work to do.
+
+The columns can be encoded as the JSON body the frontend posts
+(fileInfo.messages shape, `encode_json`) or as the columnar frame format
+read by ingest.py (`encode_frames`).
+"""
+import json
+import os
+import struct
+
+import numpy as np
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "schema-info.json")
+
+# Rows per second of flight for each message type
+RATES_HZ = {
+    "ACC": 50, "ATT": 25, "AETR": 25, "AHR2": 10, "XKQ": 10, "XKQ[0]": 10,
+    "XKF4[0]": 10, "POS": 10, "GPS[0]": 5,
+}
+# Sparse message types and their row counts
+EVENT_ROWS = {"ARM": 2, "EV": 6, "ERR": 4, "PARM": 300}
+
+FRAME_CHUNK = 1 << 20
+
+HOME_LAT, HOME_LNG, HOME_ALT = -35.3632621, 149.1652374, 584.0
+
+
+def load_schema(path=SCHEMA_PATH):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _profile(t, duration):
+    """Altitude above home: climb for 10% of the flight, cruise, descend for the last 10%."""
+    ramp = max(duration * 0.1, 1.0)
+    return 100.0 * np.clip(np.minimum(t / ramp, (duration - t) / ramp), 0.0, 1.0)
+
+
+def _field_values(message_type, field, unit, t, duration, rng):
+    n = len(t)
+    name = field.lower()
+    if field == "TimeUS" or field == "SampleUS":
+        return (t * 1e6).astype(np.int64)
+    if field == "time_boot_ms":
+        return (t * 1e3).astype(np.int64)
+    if name in ("instance", "i", "c"):
+        return np.zeros(n, dtype=np.int64)
+    if field == "Status":
+        status = np.full(n, 6, dtype=np.int64)
+        status[: max(n // 100, 1)] = 1
+        status[n // 2: n // 2 + max(n // 200, 1)] = 1
+        return status
+    if field == "NSats":
+        sats = np.full(n, 14, dtype=np.int64) - rng.integers(0, 3, n)
+        sats[n // 2: n // 2 + max(n // 200, 1)] = 4
+        return sats
+    if field == "GWk":
+        return np.full(n, 2300, dtype=np.int64)
+    if field == "GMS":
+        return ((t * 1e3).astype(np.int64) + 345_600_000) % 604_800_000
+    if message_type == "XKF4[0]" and field in ("SV", "SP", "SH", "SM", "SVT"):
+        # Test ratios as the Dataflash parser delivers them, already divided by 100
+        ratio = rng.integers(0, 40, n) / 100.0
+        ratio[int(n * 0.7): int(n * 0.7) + max(n // 500, 1)] = 1.5
+        return ratio
+    if unit == "deg":
+        if field in ("Lat", "Lng"):
+            base = HOME_LAT if field == "Lat" else HOME_LNG
+            return base + 1e-3 * np.sin(t / max(duration, 1.0) * 2 * np.pi)
+        if "yaw" in name or field == "GCrs":
+            return (t * 3.0) % 360.0
+        return 10.0 * np.sin(t * 0.5) + rng.normal(0, 0.5, n)
+    if unit == "1e-7°":
+        base = HOME_LAT if field == "Lat" else HOME_LNG
+        return ((base + 1e-3 * np.sin(t / max(duration, 1.0) * 2 * np.pi)) * 1e7).astype(np.int64)
+    if unit == "m":
+        above_home = _profile(t, duration) + rng.normal(0, 0.2, n)
+        if field == "RelHomeAlt" or field == "RelOriginAlt":
+            return above_home
+        return HOME_ALT + above_home
+    if unit == "mm":
+        return ((HOME_ALT + _profile(t, duration)) * 1e3).astype(np.int64)
+    if unit == "m/s²":
+        return rng.normal(-9.81 if field == "AccZ" else 0.0, 0.3, n)
+    if unit == "quat":
+        return np.cos(t * 0.01) if field == "Q1" else np.sin(t * 0.01) * 0.1
+    if unit == "m/s":
+        return np.abs(5.0 + rng.normal(0, 0.5, n))
+    if unit == "cm/s":
+        return rng.normal(0, 20, n)
+    if unit in ("flag", "bool"):
+        return (rng.random(n) < 0.01).astype(np.int64)
+    if unit == "bitmask":
+        return np.full(n, 0xFFFF, dtype=np.int64)
+    if unit == "%":
+        return np.zeros(n)
+    if field == "HDop":
+        return 0.8 + np.abs(rng.normal(0, 0.1, n))
+    return rng.normal(0, 1, n)
+
+
+def _event_columns(message_type, fields, duration, rng):
+    n = EVENT_ROWS[message_type]
+    t = np.sort(rng.uniform(0, duration, n)) if message_type != "PARM" else np.zeros(n)
+    columns = {}
+    for field in fields:
+        if field == "TimeUS":
+            columns[field] = (t * 1e6).astype(np.int64)
+        elif field == "time_boot_ms":
+            columns[field] = (t * 1e3).astype(np.int64)
+        elif field == "ArmState":
+            columns[field] = np.array([1, 0])
+        elif field == "Subsys":
+            columns[field] = np.array([5, 5, 11, 16][:n])
+        elif field == "ECode":
+            columns[field] = np.array([1, 0, 2, 2][:n])
+        elif field == "Id":
+            columns[field] = np.array([10, 11, 15, 16, 18, 17][:n])
+        elif field == "Name":
+            columns[field] = np.array([f"PARAM_{i:03d}" for i in range(n)])
+        else:
+            columns[field] = rng.normal(0, 1, n)
+    return columns
+
+
+def generate_columns(rows, seed=0, schema=None):
+    """
+    {message type: {field: NumPy array}} for a flight of about `rows` rows.
+    Deterministic for a given (rows, seed).
+    """
+    schema = schema or load_schema()
+    rng = np.random.default_rng(seed)
+    total_rate = sum(RATES_HZ.values())
+    duration = max(rows - sum(EVENT_ROWS.values()), total_rate) / total_rate
+
+    messages = {}
+    for message_type, fields in schema.items():
+        if not fields:
+            continue
+        if message_type in RATES_HZ:
+            n = int(duration * RATES_HZ[message_type])
+            t = np.arange(n) / RATES_HZ[message_type]
+            messages[message_type] = {
+                field: _field_values(message_type, field, info.get("unit"), t, duration, rng)
+                for field, info in fields.items()
+            }
+        elif message_type in EVENT_ROWS:
+            messages[message_type] = _event_columns(message_type, fields, duration, rng)
+    return messages
+
+
+def row_count(columns):
+    return sum(max((len(c) for c in fields.values()), default=0) for fields in columns.values())
+
+
+def to_messages(columns):
+    """The fileInfo.messages shape: plain lists, as posted by the frontend."""
+    return {mt: {field: column.tolist() for field, column in fields.items()} for mt, fields in columns.items()}
+
+
+def encode_json(columns, name="synthetic.bin", log_type="bin"):
+    """JSON upload body for /api/logs."""
+    return json.dumps({"name": name, "type": log_type, "messages": to_messages(columns)}).encode("utf-8")
+
+
+def encode_frames(columns, name="synthetic.bin", log_type="bin"):
+    """Columnar frame upload body for /api/logs (see ingest.py for the layout)."""
+    meta = json.dumps({"name": name, "type": log_type}).encode("utf-8")
+    parts = [b"ULF1", struct.pack("<I", len(meta)), meta]
+    for message_type, fields in columns.items():
+        type_bytes = message_type.encode("utf-8")
+        for field, column in fields.items():
+            field_bytes = field.encode("utf-8")
+            header = struct.pack("<H", len(type_bytes)) + type_bytes + struct.pack("<H", len(field_bytes)) + field_bytes
+            if column.dtype.kind in "US":
+                payload = json.dumps(column.tolist()).encode("utf-8")
+                parts += [header, struct.pack("<cI", b"J", len(payload)), payload]
+                continue
+            column = column.astype("<f8" if column.dtype.kind == "f" else "<i8", copy=False)
+            code = b"d" if column.dtype.kind == "f" else b"q"
+            for start in range(0, max(len(column), 1), FRAME_CHUNK):
+                chunk = column[start:start + FRAME_CHUNK]
+                parts += [header, struct.pack("<cI", code, len(chunk)), chunk.tobytes()]
+    return b"".join(parts)
@@ -0,0 +1,403 @@
+"""
+Derived series compiled from the MAVExplorer graph expressions.
+
+src/assets/mavgraphs.xml defines each graph as one or more alternative
+lines of whitespace-separated expressions over log fields, e.g.
+sqrt(IMU[0].AccX**2+IMU[0].AccY**2+IMU[0].AccZ**2) or
+lowpass(degrees(IMU.GyrY),"gy",0.9). The file is parsed once per process and
+every expression is compiled once (compile_expression is memoized) into a
+plan: a tree of NumPy operations over whole columns, so evaluating a series
+is a few vectorized passes instead of a per-sample interpreter.
+
+Supported are field references (MSG.Field, MSG[i].Field), numbers,
++ - * / **, sqrt / degrees / radians / abs / sin / cos / tan / atan2,
+comparisons, lowpass(x, key, factor) (pymavlink's first-order filter,
+evaluated in blocks) and a trailing {condition} that blanks the samples
+where it does not hold. Fields of other message types are sampled at the
+timestamps of the first referenced message type: the last value at or
+before each of them, as MAVExplorer does while it replays a log. The
+helpers that take whole messages (expected_mag, mag_heading, gravity, ...)
+are not compiled; their expressions are skipped and counted.
+
+The tools address a derived series under the pseudo message type DERIVED:
+['DERIVED', 'vibration_magnitude'] for the NAMED_SERIES below,
+['DERIVED', '<graph expression>'] for a catalog entry, or any other
+expression in the same grammar. TelemetryStore.derived() evaluates a series
+into a MessageTable, so statistics, threshold indexes, time windows and
+downsampling work on it as on a logged field. Each store keeps the recently
+used ones, up to DERIVED_CACHE_MAX_BYTES, and re-evaluates the others.
+"""
+import ast
+import logging
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+
+import numpy as np
+
+from path_index import normalize
+
+logger = logging.getLogger(__name__)
+
+DERIVED_TYPE = "DERIVED"
+
+# Graph definitions shared with the frontend
+MAVGRAPHS_PATH = os.getenv("MAVGRAPHS_PATH", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "assets", "mavgraphs.xml"))
+
+# Evaluated derived series each store keeps; the least recently used are dropped beyond this
+DERIVED_CACHE_MAX_BYTES = int(os.getenv("DERIVED_CACHE_MAX_MB", "64")) * 1024 * 1024
+
+# Samples per block of the lowpass filter: a matrix product inside a block, a carry between blocks
+LOWPASS_BLOCK = 128
+
+# Series the model is likely to ask for by name: (description, candidate expressions).
+# The first candidate whose fields are all in the log is used.
+NAMED_SERIES = {
+    "vibration_magnitude": ("Vibration level, m/s/s, norm of the three axes", (
+        "sqrt(VIBE[0].VibeX**2+VIBE[0].VibeY**2+VIBE[0].VibeZ**2)",
+        "sqrt(VIBE.VibeX**2+VIBE.VibeY**2+VIBE.VibeZ**2)",
+        "sqrt(VIBRATION.vibration_x**2+VIBRATION.vibration_y**2+VIBRATION.vibration_z**2)",
+    )),
+    "ground_speed": ("Horizontal speed over ground, m/s", (
+        "GPS[0].Spd",
+        "GPS.Spd",
+        "VFR_HUD.groundspeed",
+        "GPS_RAW_INT.vel*0.01",
+        "sqrt(XKF1[0].VN**2+XKF1[0].VE**2)",
+        "sqrt(NKF1[0].VN**2+NKF1[0].VE**2)",
+        "sqrt(LOCAL_POSITION_NED.vx**2+LOCAL_POSITION_NED.vy**2)",
+    )),
+    "speed_3d": ("Speed including the vertical component, m/s, from the EKF velocities", (
+        "sqrt(XKF1[0].VN**2+XKF1[0].VE**2+XKF1[0].VD**2)",
+        "sqrt(NKF1[0].VN**2+NKF1[0].VE**2+NKF1[0].VD**2)",
+        "sqrt(LOCAL_POSITION_NED.vx**2+LOCAL_POSITION_NED.vy**2+LOCAL_POSITION_NED.vz**2)",
+    )),
+    "acceleration_magnitude": ("Norm of the first accelerometer, m/s/s", (
+        "sqrt(IMU[0].AccX**2+IMU[0].AccY**2+IMU[0].AccZ**2)",
+        "sqrt(IMU.AccX**2+IMU.AccY**2+IMU.AccZ**2)",
+        "sqrt(ACC[0].AccX**2+ACC[0].AccY**2+ACC[0].AccZ**2)",
+        "sqrt(ACC.AccX**2+ACC.AccY**2+ACC.AccZ**2)",
+        "sqrt(RAW_IMU.xacc**2+RAW_IMU.yacc**2+RAW_IMU.zacc**2)*9.81*0.001",
+    )),
+    "tilt_angle": ("Combined roll and pitch angle, degrees", (
+        "sqrt(ATT.Roll**2+ATT.Pitch**2)",
+        "degrees(sqrt(ATTITUDE.roll**2+ATTITUDE.pitch**2))",
+    )),
+    "magnetic_field_magnitude": ("Norm of the first compass, mGauss", (
+        "sqrt(MAG[0].MagX**2+MAG[0].MagY**2+MAG[0].MagZ**2)",
+        "sqrt(MAG.MagX**2+MAG.MagY**2+MAG.MagZ**2)",
+        "sqrt(RAW_IMU.xmag**2+RAW_IMU.ymag**2+RAW_IMU.zmag**2)",
+    )),
+}
+
+_FUNCTIONS = {
+    "sqrt": (np.sqrt, 1), "degrees": (np.degrees, 1), "radians": (np.radians, 1), "abs": (np.abs, 1),
+    "sin": (np.sin, 1), "cos": (np.cos, 1), "tan": (np.tan, 1), "atan2": (np.arctan2, 2),
+}
+_BINARY = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.true_divide,
+           ast.Pow: np.power}
+_COMPARE = {ast.Eq: np.equal, ast.NotEq: np.not_equal, ast.Lt: np.less, ast.LtE: np.less_equal,
+            ast.Gt: np.greater, ast.GtE: np.greater_equal}
+_BOOLEAN = {ast.And: np.logical_and, ast.Or: np.logical_or}
+
+# "expression{condition}:axis"; the axis only matters for plotting
+_EXPRESSION = re.compile(r"^(?P<expression>[^{}]+?)(?:\{(?P<condition>[^{}]*)\})?(?::\d+)?$")
+
+
+class DerivedSeriesError(ValueError):
+    """An expression that cannot be compiled or evaluated over a log."""
+
+
+def lowpass(values, factor):
+    """
+    y[i] = factor * y[i-1] + (1 - factor) * x[i] with y[0] = x[0], the filter
+    of pymavlink's mavextra.lowpass, over a whole column. Inside each block of
+    LOWPASS_BLOCK samples the response is one matrix product; only the state
+    carried from block to block is a Python loop. NaN samples hold the last
+    value for the filter and stay NaN in the result.
+    """
+    x = np.asarray(values, dtype=np.float64)
+    n = len(x)
+    if n == 0 or factor == 0:
+        return x.copy()
+    missing = np.isnan(x)
+    if missing.any():
+        valid = np.flatnonzero(~missing)
+        if not len(valid):
+            return x.copy()
+        held = np.maximum.accumulate(np.where(missing, 0, np.arange(n)))
+        held[:valid[0]] = valid[0]
+        x = x[held]
+
+    size = min(LOWPASS_BLOCK, n)
+    blocks = -(-n // size)
+    padded = np.zeros(blocks * size)
+    padded[:n] = x
+    lags = np.arange(size)
+    power = lags[:, None] - lags[None, :]
+    # weights[j, k] = factor ** (j - k) for k <= j: the zero-state response inside a block
+    weights = np.where(power >= 0, factor ** np.maximum(power, 0), 0.0)
+    response = (padded.reshape(blocks, size) @ weights.T) * (1.0 - factor)
+    decay = factor ** (lags + 1)
+    carry = x[0]
+    for block in response:
+        block += decay * carry
+        carry = block[-1]
+    result = response.reshape(-1)[:n]
+    if missing.any():
+        result[missing] = np.nan
+    return result
+
+
+def sample_at(times, values, at):
+    """The last of `values` at or before each time in `at`; NaN before the first sample."""
+    if not len(values):
+        return np.full(len(at), np.nan)
+    positions = np.searchsorted(times, at, side="right") - 1
+    sampled = values[np.maximum(positions, 0)].astype(np.float64)
+    sampled[positions < 0] = np.nan
+    return sampled
+
+
+class Expression:
+    """A compiled expression: the fields it reads and its evaluation plan."""
+
+    def __init__(self, text, references, plan, condition=None, is_field=False):
+        self.text = text
+        self.references = references
+        self.plan = plan
+        self.condition = condition
+        self.is_field = is_field
+
+    def evaluate(self, columns, length):
+        """Evaluate over `columns` (reference -> aligned float64 column) of `length` samples."""
+        with np.errstate(all="ignore"):
+            values = np.broadcast_to(np.asarray(self.plan(columns), dtype=np.float64), (length,))
+            if self.condition is not None:
+                mask = np.broadcast_to(np.asarray(self.condition(columns), dtype=bool), (length,))
+                values = np.where(mask, values, np.nan)
+        return np.array(values, dtype=np.float64)
+
+
+class _Compiler:
+    def __init__(self):
+        self.references = []
+
+    @staticmethod
+    def reference(node):
+        """'MSG' or 'MSG[i]' plus the field for a field reference node, else None."""
+        if not isinstance(node, ast.Attribute):
+            return None
+        owner = node.value
+        if isinstance(owner, ast.Name):
+            return f"{owner.id}.{node.attr}"
+        if isinstance(owner, ast.Subscript) and isinstance(owner.value, ast.Name) \
+                and isinstance(owner.slice, ast.Constant) and type(owner.slice.value) is int:
+            return f"{owner.value.id}[{owner.slice.value}].{node.attr}"
+        return None
+
+    @staticmethod
+    def number(node):
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            value = _Compiler.number(node.operand)
+            return None if value is None else -value
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return float(node.value)
+        return None
+
+    def compile(self, node):
+        reference = self.reference(node)
+        if reference is not None:
+            if reference not in self.references:
+                self.references.append(reference)
+            return lambda columns: columns[reference]
+        value = self.number(node)
+        if value is not None:
+            return lambda columns: value
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+            op, left, right = _BINARY[type(node.op)], self.compile(node.left), self.compile(node.right)
+            return lambda columns: op(left(columns), right(columns))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = self.compile(node.operand)
+            if isinstance(node.op, ast.UAdd):
+                return operand
+            return lambda columns: np.negative(operand(columns))
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _COMPARE:
+            op, left, right = _COMPARE[type(node.ops[0])], self.compile(node.left), self.compile(node.comparators[0])
+            return lambda columns: op(left(columns), right(columns))
+        if isinstance(node, ast.BoolOp):
+            op, operands = _BOOLEAN[type(node.op)], [self.compile(value) for value in node.values]
+            return lambda columns: op.reduce([np.asarray(f(columns), dtype=bool) for f in operands])
+        if isinstance(node, ast.Call):
+            return self.call(node)
+        if isinstance(node, ast.Attribute):
+            # e.g. expected_mag(GPS,ATT).x: fails on the helper function first
+            self.compile(node.value)
+            raise DerivedSeriesError(f"unsupported attribute .{node.attr}")
+        raise DerivedSeriesError(f"unsupported syntax: {type(node).__name__}")
+
+    def call(self, node):
+        name = node.func.id if isinstance(node.func, ast.Name) else None
+        if node.keywords:
+            raise DerivedSeriesError(f"unsupported keyword arguments to {name}()")
+        if name == "lowpass":
+            # lowpass(value, state key, factor); the key only names pymavlink's filter state
+            factor = self.number(node.args[2]) if len(node.args) == 3 else None
+            if factor is None or not 0 <= factor < 1:
+                raise DerivedSeriesError("lowpass() takes (value, key, factor) with 0 <= factor < 1")
+            operand = self.compile(node.args[0])
+            return lambda columns: lowpass(np.atleast_1d(operand(columns)), factor)
+        if name not in _FUNCTIONS:
+            raise DerivedSeriesError(f"unsupported function {name or ast.unparse(node.func)}()")
+        function, arity = _FUNCTIONS[name]
+        if len(node.args) != arity:
+            raise DerivedSeriesError(f"{name}() takes {arity} argument(s)")
+        operands = [self.compile(arg) for arg in node.args]
+        return lambda columns: function(*(f(columns) for f in operands))
+
+
+def _parse(text):
+    try:
+        return ast.parse(text.strip(), mode="eval").body
+    except SyntaxError:
+        raise DerivedSeriesError(f"cannot parse {text!r}")
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(text):
+    """Expression for one graph expression; raises DerivedSeriesError when it is not supported."""
+    match = _EXPRESSION.match(text.strip())
+    if match is None:
+        raise DerivedSeriesError(f"cannot parse {text!r}")
+    tree = _parse(match.group("expression"))
+    if isinstance(tree, ast.Name):
+        raise DerivedSeriesError(f"unknown derived series {text!r}")
+    compiler = _Compiler()
+    plan = compiler.compile(tree)
+    condition = None
+    if match.group("condition"):
+        condition = compiler.compile(_parse(match.group("condition")))
+    if not compiler.references:
+        raise DerivedSeriesError(f"{text!r} reads no log field")
+    is_field = condition is None and compiler.reference(tree) is not None
+    text = match.group("expression").strip() + (f"{{{match.group('condition')}}}" if condition else "")
+    return Expression(text, compiler.references, plan, condition, is_field)
+
+
+@lru_cache(maxsize=None)
+def load_catalog(path=MAVGRAPHS_PATH):
+    """
+    The graphs of mavgraphs.xml as [(graph name, [alternative, ...])], each
+    alternative a list of compiled Expressions, parsed and compiled once per
+    process. Expressions that do not compile are left out and logged.
+    """
+    started = time.perf_counter()
+    try:
+        root = ET.parse(path).getroot()
+    except (OSError, ET.ParseError) as e:
+        logger.warning(f"Graph expressions not loaded from {path}: {e}")
+        return []
+    graphs = []
+    compiled, skipped = 0, {}
+    for graph in root.iter("graph"):
+        alternatives = []
+        for line in graph.findall("expression"):
+            expressions = []
+            for text in (line.text or "").split():
+                try:
+                    expressions.append(compile_expression(text))
+                    compiled += 1
+                except DerivedSeriesError as e:
+                    reason = str(e)
+                    skipped[reason] = skipped.get(reason, 0) + 1
+            alternatives.append(expressions)
+        graphs.append((graph.get("name"), alternatives))
+    elapsed = (time.perf_counter() - started) * 1000
+    logger.info(f"Compiled {compiled} graph expressions from {path} in {elapsed:.1f} ms; "
+                f"skipped {sum(skipped.values())}: {skipped}")
+    return graphs
+
+
+def derived_name(keys_list):
+    """The series name of a DERIVED tool path (['DERIVED', name] and its spellings), else None."""
+    if isinstance(keys_list, dict):
+        keys_list = list(keys_list.values())
+    if isinstance(keys_list, str):
+        prefix, _, rest = keys_list.partition(".")
+        keys_list = [prefix, rest] if rest else [keys_list]
+    if not isinstance(keys_list, list) or len(keys_list) != 2:
+        return None
+    owner, name = keys_list
+    if not isinstance(owner, str) or normalize(owner) != "derived" or not isinstance(name, str):
+        return None
+    return name
+
+
+def bind(store, expression):
+    """{reference: (message type, field)} for every field `expression` reads, or None if one is missing."""
+    bound = {}
+    for reference in expression.references:
+        owner, _, field = reference.rpartition(".")
+        found = store.paths.lookup(owner, field)
+        if found is None:
+            return None
+        bound[reference] = found
+    return bound
+
+
+def available_series(store):
+    """
+    {name: (expression text, description)} of the derived series `store` can
+    evaluate: the NAMED_SERIES, then the compound expressions of the first
+    alternative of each graph whose fields are all in the log (the one
+    MAVExplorer would plot). Plain field references are left out.
+    """
+    series = {}
+    for name, (description, candidates) in NAMED_SERIES.items():
+        for text in candidates:
+            expression = compile_expression(text)
+            if bind(store, expression) is not None:
+                series[name] = (expression.text, f"{description}: {expression.text}")
+                break
+    texts = {text for text, _ in series.values()}
+    for graph_name, alternatives in load_catalog():
+        for alternative in alternatives:
+            if alternative and all(bind(store, expression) is not None for expression in alternative):
+                for expression in alternative:
+                    if not expression.is_field and expression.text not in texts:
+                        series[expression.text] = (expression.text, graph_name)
+                        texts.add(expression.text)
+                break
+    return series
+
+
+def evaluate(store, text):
+    """
+    (values, time_ms) of the expression `text` over `store`, aligned on the
+    first referenced message type; time_ms is None when it has no time column.
+    """
+    expression = compile_expression(text)
+    bound = bind(store, expression)
+    if bound is None:
+        missing = [r for r in expression.references if bind(store, compile_expression(r)) is None]
+        raise DerivedSeriesError(f"fields not in this log: {', '.join(missing)}")
+
+    base_type, base_field = bound[expression.references[0]]
+    base = store.tables[base_type]
+    length = len(base.columns[base_field])
+    columns = {}
+    for reference, (message_type, field) in bound.items():
+        table = store.tables[message_type]
+        column = table.columns[field]
+        if column.dtype.kind not in "biuf":
+            raise DerivedSeriesError(f"{message_type}.{field} is not numeric")
+        column = column.astype(np.float64, copy=False)
+        if message_type != base_type:
+            if base.time_ms is None or table.time_ms is None:
+                raise DerivedSeriesError(f"{base_type} and {message_type} cannot be aligned without time columns")
+            column = sample_at(table.time_ms, column, base.time_ms)
+        columns[reference] = column
+    return expression.evaluate(columns, length), base.time_ms
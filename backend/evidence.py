@@ -0,0 +1,208 @@
+"""
+Token-budget compaction of the evidence sent to the reasoning stage.
+
+The collection agent's tool results can be large: parser payloads carry up
+to PARSER_MAX_POINTS (or, exact, PARSER_EXACT_MAX_POINTS) samples per
+series, and anomaly lists up to ANOMALY_MAX_EVENTS events. compact_evidence()
+serializes the evidence compactly and, while the estimate is over the
+budget, shrinks the largest item one level at a time:
+
+* numeric series are cut down to fewer points, keeping each bucket's
+  min and max sample (aligned lists such as time_ms / values keep the same
+  samples), then replaced by summary statistics;
+* long lists of records (anomaly events, batch results) keep their first
+  entries and report how many were left out;
+* as a last resort an item is omitted and only its size is reported.
+
+Identical results stored under different keys are sent once. Each level is
+applied to the original item, so nothing is summarized twice. The report
+lists every item that was changed, so answers can be audited against what
+the model actually saw.
+"""
+import json
+import math
+import re
+
+import numpy as np
+
+from downsample import downsample_indices
+
+# Roughly one token per word, punctuation mark or group of up to three digits
+TOKEN_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+# (max points per series, max records per list) for each compaction level;
+# 0 points means summary statistics only
+LEVELS = ((None, None), (256, 50), (128, 25), (64, 12), (32, 6), (16, 3), (0, 3))
+TIME_KEYS = ("time_ms", "index")
+
+
+def estimate_tokens(text):
+    """Local estimate of the model's token count for `text`."""
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def dumps(value):
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+def _is_number(value):
+    return value is None or (isinstance(value, (int, float)) and not isinstance(value, bool))
+
+
+def _is_series(value):
+    return isinstance(value, list) and len(value) > 1 and all(_is_number(v) for v in value)
+
+
+def _as_array(values):
+    return np.array([math.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def series_summary(values):
+    """count / first / last / min / max / mean of a numeric list, ignoring nulls."""
+    array = _as_array(values)
+    finite = array[~np.isnan(array)]
+    summary = {"count": len(values), "first": values[0], "last": values[-1]}
+    if len(finite):
+        summary.update({"min": finite.min().item(), "max": finite.max().item(),
+                        "mean": round(finite.mean().item(), 6)})
+    return summary
+
+
+def _pick(values, indices):
+    return [values[i] for i in indices]
+
+
+def _compact_dict(value, max_points, max_items):
+    # Lists of equal length in one payload are aligned (time_ms, values, fields...)
+    groups = {}
+    for key, item in value.items():
+        if _is_series(item) and (max_points == 0 or len(item) > max_points):
+            groups.setdefault(len(item), []).append(key)
+
+    compacted = {}
+    notes = {}
+    for length, keys in groups.items():
+        if max_points == 0:
+            for key in keys:
+                compacted[key] = {"summary": series_summary(value[key])}
+            notes[length] = {"samples": length, "kept": 0, "method": "summary"}
+            continue
+        reference = next((k for k in keys if k == "values"), None) or \
+            next((k for k in keys if k not in TIME_KEYS), keys[0])
+        x = _as_array(value["time_ms"]) if "time_ms" in keys else None
+        indices = downsample_indices(_as_array(value[reference]), x, max_points, "minmax")
+        for key in keys:
+            compacted[key] = _pick(value[key], indices)
+        notes[length] = {"samples": length, "kept": len(indices), "method": "minmax"}
+
+    result = {}
+    for key, item in value.items():
+        if key in compacted:
+            result[key] = compacted[key]
+        elif key == "fields" and isinstance(item, dict):
+            result[key] = _compact_dict(item, max_points, max_items)
+        else:
+            result[key] = compact_value(item, max_points, max_items)
+    if notes:
+        result["compacted"] = list(notes.values()) if len(notes) > 1 else next(iter(notes.values()))
+    return result
+
+
+def compact_value(value, max_points, max_items):
+    """`value` with series cut to `max_points` and record lists to `max_items`."""
+    if max_points is None:
+        return value
+    if isinstance(value, dict):
+        return _compact_dict(value, max_points, max_items)
+    if _is_series(value):
+        if max_points == 0:
+            return {"summary": series_summary(value)}
+        if len(value) > max_points:
+            indices = downsample_indices(_as_array(value), None, max_points, "minmax")
+            return {"values": _pick(value, indices), "index": indices.tolist(),
+                    "compacted": {"samples": len(value), "kept": len(indices), "method": "minmax"}}
+        return value
+    if isinstance(value, list):
+        items = [compact_value(item, max_points, max_items) for item in value[:max_items]]
+        if len(value) > max_items:
+            items.append({"omitted_entries": len(value) - max_items})
+        return items
+    return value
+
+
+def _level_name(level):
+    if level >= len(LEVELS):
+        return "omitted"
+    max_points, max_items = LEVELS[level]
+    if max_points is None:
+        return "unchanged"
+    if max_points == 0:
+        return f"summary statistics, first {max_items} records"
+    return f"series <= {max_points} points (min/max kept), first {max_items} records"
+
+
+def compact_evidence(evidence, budget):
+    """
+    (JSON text for the reasoning prompt, report) for the `evidence` dict,
+    within about `budget` tokens (0: no limit). The evidence dict itself is
+    not changed.
+    """
+    items = {}
+    duplicates = {}
+    seen = {}
+    for key, value in evidence.items():
+        text = dumps(value)
+        if text in seen and len(text) > 64:
+            duplicates[key] = seen[text]
+            items[key] = {"same_as": seen[text]}
+            continue
+        seen[text] = key
+        items[key] = value
+
+    texts = {key: dumps(value) for key, value in items.items()}
+    tokens = {key: estimate_tokens(text) for key, text in texts.items()}
+    original = {key: tokens[key] for key in items if key not in duplicates}
+    overhead = estimate_tokens(dumps({key: None for key in items}))
+    tried = {key: 0 for key in original}  # last level tried
+    applied = dict(tried)  # level of the value now in `items`
+    while budget and overhead + sum(tokens.values()) > budget:
+        shrinkable = [key for key, level in tried.items() if level < len(LEVELS)]
+        if not shrinkable:
+            break
+        key = max(shrinkable, key=lambda k: tokens[k])
+        tried[key] += 1
+        if tried[key] < len(LEVELS):
+            value = compact_value(evidence[key], *LEVELS[tried[key]])
+        else:
+            value = {"omitted": True, "reason": "token budget", "estimated_tokens": original[key]}
+        text = dumps(value)
+        count = estimate_tokens(text)
+        # A level that does not make the item smaller is skipped over
+        if count < tokens[key]:
+            items[key], texts[key], tokens[key] = value, text, count
+            applied[key] = tried[key]
+
+    text = "{" + ",".join(f"{json.dumps(key)}:{texts[key]}" for key in items) + "}"
+    tokens_after = overhead + sum(tokens.values())
+    report = {
+        "budget": budget,
+        "tokens_before": overhead + sum(original.values()) + sum(original[k] for k in duplicates.values()),
+        "tokens_after": tokens_after,
+        "over_budget": bool(budget) and tokens_after > budget,
+        "duplicates": duplicates,
+        "compacted": {
+            key: {"level": _level_name(level), "tokens_before": original[key], "tokens": tokens[key]}
+            for key, level in applied.items() if level
+        },
+    }
+    return text, report
+
+
+def describe_compaction(report):
+    """Note for the reasoning prompt listing what was reduced, or '' when nothing was."""
+    lines = [f"- {key}: identical to {original}" for key, original in report["duplicates"].items()]
+    lines += [f"- {key}: {change['level']}" for key, change in report["compacted"].items()]
+    if not lines:
+        return ""
+    return ("Some collected data was reduced to fit the prompt budget; treat reduced series as "
+            "approximate and do not infer sample-level detail that is no longer present:\n" + "\n".join(lines))
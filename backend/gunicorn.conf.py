@@ -0,0 +1,30 @@
+"""
+Production server: several worker processes sharing memory-mapped log sessions.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Uploaded logs are written once under LOG_SESSION_SHARED_DIR (see
+session_files.py) and memory-mapped by every worker, so any worker can answer
+a question about a log another worker ingested. Each worker runs its own
+threads and LLM event loop, so a long complex question occupies one thread of
+one worker rather than the whole server. `python app.py` remains the
+single-process development server.
+"""
+import multiprocessing
+import os
+import tempfile
+
+# Workers inherit the environment of the master, which reads this file first.
+# (Backend modules are not imported here: workers import app after the fork.)
+if not os.getenv("LOG_SESSION_SHARED_DIR"):
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    os.environ["LOG_SESSION_SHARED_DIR"] = os.path.join(base, "uav-log-sessions")
+
+bind = os.getenv("BIND", "127.0.0.1:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(multiprocessing.cpu_count(), 8))))
+# Every open /api/chat/stream response holds a thread for its whole duration
+worker_class = "gthread"
+threads = int(os.getenv("WORKER_THREADS", "16"))
+# Requests are bounded by CHAT_DEADLINE_S already; leave room for the 504
+timeout = int(float(os.getenv("CHAT_DEADLINE_S", "120"))) + 30
+graceful_timeout = 30
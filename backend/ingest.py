@@ -0,0 +1,352 @@
+"""
+Streaming log ingest for /api/logs.
+
+Uploads are decoded incrementally from the request stream straight into
+per-field NumPy arrays, so the nested dict tree of the parsed log is never
+materialized and peak memory stays close to the size of the final
+TelemetryStore. Two encodings are accepted, each optionally gzip-compressed
+(detected from the gzip magic bytes):
+
+* JSON: {"name": ..., "type": ..., "messages": {type: {field: [...]}}}.
+  Only one field's text is buffered at a time; numeric series are parsed
+  with NumPy's C tokenizer instead of json.loads.
+* Columnar frames (application/x-uavlog-frames), little-endian:
+
+      b"ULF1" | u32 meta_len | meta JSON ({"name", "type", ...})
+      then, until EOF, one frame per field (repeat frames to append chunks):
+      u16 type_len | type utf-8 | u16 field_len | field utf-8 |
+      u8 dtype | u32 count | payload
+
+  dtype is a struct/NumPy type char ('d', 'f', 'q', 'Q', 'i', 'I', 'h',
+  'H', 'b', 'B', '?'); count is the number of elements and the payload is
+  the raw array bytes. dtype 'J' carries a UTF-8 JSON list and count is its
+  length in bytes (used for text fields such as MSG.Message).
+
+The content hash is computed over the decompressed stream while it is
+read, so the session id is known without buffering the upload.
+"""
+import codecs
+import gzip
+import hashlib
+import json
+import logging
+import re
+import struct
+
+import numpy as np
+
+from telemetry_store import to_array
+
+logger = logging.getLogger(__name__)
+
+FRAMES_MAGIC = b"ULF1"
+FRAMES_CONTENT_TYPE = "application/x-uavlog-frames"
+GZIP_MAGIC = b"\x1f\x8b"
+CHUNK_SIZE = 1 << 20
+
+FRAME_DTYPES = {code: np.dtype("<" + code) for code in "dfqQiIhHbB?"}
+
+_INDEX_KEY = re.compile(r'"\d+"\s*:')
+_NON_INTEGER = re.compile(r"[.eEnN]")
+_INT64 = np.iinfo(np.int64)
+
+
+class IngestError(ValueError):
+    """The upload is not a valid JSON or frame-encoded log."""
+
+
+class StreamReader:
+    """File-like wrapper adding peek/exact reads and hashing of consumed bytes."""
+
+    def __init__(self, raw, hasher=None):
+        self.raw = raw
+        self.hasher = hasher
+        self._pushback = b""
+
+    def _fill(self, n):
+        data = self.raw.read(n)
+        if data and self.hasher is not None:
+            self.hasher.update(data)
+        return data
+
+    def peek(self, n):
+        while len(self._pushback) < n:
+            data = self._fill(n - len(self._pushback))
+            if not data:
+                break
+            self._pushback += data
+        return self._pushback[:n]
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            chunks = [self._pushback]
+            self._pushback = b""
+            while True:
+                data = self._fill(CHUNK_SIZE)
+                if not data:
+                    return b"".join(chunks)
+                chunks.append(data)
+        if self._pushback:
+            data, self._pushback = self._pushback[:n], self._pushback[n:]
+            return data
+        return self._fill(n)
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast("B")
+        filled = 0
+        if self._pushback:
+            filled = min(len(self._pushback), len(view))
+            view[:filled] = self._pushback[:filled]
+            self._pushback = self._pushback[filled:]
+        while filled < len(view):
+            data = self._fill(min(CHUNK_SIZE, len(view) - filled))
+            if not data:
+                break
+            view[filled:filled + len(data)] = data
+            filled += len(data)
+        return filled
+
+    def read_exact(self, n):
+        data = self.read(n)
+        while len(data) < n:
+            more = self.read(n - len(data))
+            if not more:
+                raise IngestError("truncated upload")
+            data += more
+        return data
+
+
+def ingest_stream(stream):
+    """
+    Decode an upload from `stream`. Returns (meta, messages, digest) where
+    `messages` maps message type -> field -> NumPy array and `digest` is the
+    SHA-256 hex digest of the (decompressed) upload.
+    """
+    raw = StreamReader(stream)
+    if raw.peek(2) == GZIP_MAGIC:
+        raw = gzip.GzipFile(fileobj=raw, mode="rb")
+
+    hasher = hashlib.sha256()
+    reader = StreamReader(raw, hasher)
+    if reader.peek(len(FRAMES_MAGIC)) == FRAMES_MAGIC:
+        meta, messages = _read_frames(reader)
+    else:
+        meta, messages = _read_json(reader)
+
+    logger.info(f"Ingested {len(messages)} message types")
+    return meta, messages, hasher.hexdigest()
+
+
+def _read_frames(reader):
+    reader.read_exact(len(FRAMES_MAGIC))
+    (meta_len,) = struct.unpack("<I", reader.read_exact(4))
+    meta = json.loads(reader.read_exact(meta_len)) if meta_len else {}
+
+    chunks = {}
+    while reader.peek(1):
+        (type_len,) = struct.unpack("<H", reader.read_exact(2))
+        message_type = reader.read_exact(type_len).decode("utf-8")
+        (field_len,) = struct.unpack("<H", reader.read_exact(2))
+        field = reader.read_exact(field_len).decode("utf-8")
+        code, count = struct.unpack("<cI", reader.read_exact(5))
+        code = code.decode("ascii")
+
+        if code == "J":
+            column = to_array(json.loads(reader.read_exact(count)))
+        elif code in FRAME_DTYPES:
+            column = np.empty(count, dtype=FRAME_DTYPES[code])
+            if reader.readinto(column) != column.nbytes:
+                raise IngestError("truncated upload")
+            if not column.dtype.isnative:
+                column = column.astype(column.dtype.newbyteorder("="))
+        else:
+            raise IngestError(f"unknown frame dtype {code!r}")
+        chunks.setdefault(message_type, {}).setdefault(field, []).append(column)
+
+    messages = {
+        message_type: {
+            field: parts[0] if len(parts) == 1 else np.concatenate(parts)
+            for field, parts in fields.items()
+        }
+        for message_type, fields in chunks.items()
+    }
+    return meta, messages
+
+
+class _JsonScanner:
+    """Pull-based scanner over a UTF-8 byte stream holding a bounded text buffer."""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        # Buffer position that refills must keep, so a caller can rewind to it
+        self.mark = None
+        self.eof = False
+
+    def _more(self):
+        if self.eof:
+            return False
+        data = self.reader.read(CHUNK_SIZE)
+        keep = self.pos if self.mark is None else min(self.mark, self.pos)
+        if not data:
+            self.eof = True
+            self.buf = self.buf[keep:] + self.decoder.decode(b"", final=True)
+        else:
+            self.buf = self.buf[keep:] + self.decoder.decode(data)
+        self.pos -= keep
+        if self.mark is not None:
+            self.mark -= keep
+        return True
+
+    def peek(self):
+        """Next non-whitespace character without consuming it ('' at EOF)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                return ""
+
+    def lookahead(self, n):
+        """Up to `n` characters from the current position, without consuming."""
+        while len(self.buf) - self.pos < n and self._more():
+            pass
+        return self.buf[self.pos:self.pos + n]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise IngestError(f"expected {char!r} in upload")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next JSON value; used for small values only."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._more():
+                    raise IngestError("malformed JSON upload")
+                continue
+            # A number at the buffer edge may continue in the next chunk
+            if end == len(self.buf) and not self.eof:
+                self._more()
+                continue
+            self.pos = end
+            return value
+
+    def until(self, closing):
+        """Raw text from the current position through the next `closing` char."""
+        searched = 0
+        while True:
+            end = self.buf.find(closing, self.pos + searched)
+            if end >= 0:
+                text = self.buf[self.pos:end + 1]
+                self.pos = end + 1
+                return text
+            searched = len(self.buf) - self.pos
+            if not self._more():
+                raise IngestError("malformed JSON upload")
+
+    def members(self):
+        """Iterate the keys of the object at the current position."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == "}":
+                return
+            if char != ",":
+                raise IngestError("malformed JSON upload")
+
+
+def _read_json(reader):
+    scanner = _JsonScanner(reader)
+    meta, messages = {}, {}
+    for key in scanner.members():
+        if key != "messages":
+            meta[key] = scanner.value()
+            continue
+        for message_type in scanner.members():
+            if scanner.peek() != "{":
+                scanner.value()
+                continue
+            fields = messages.setdefault(message_type, {})
+            for field in scanner.members():
+                column = _read_json_series(scanner)
+                if column is not None:
+                    fields[field] = column
+    return meta, messages
+
+
+def _json_series(scanner, opening):
+    value = scanner.value()
+    if opening == "{" and not (isinstance(value, dict) and all(k.isdigit() for k in value)):
+        return None
+    return to_array(value)
+
+
+def _read_json_series(scanner):
+    """
+    Decode one field. Plain numeric arrays and index-keyed objects (typed
+    arrays serialized by the browser) are parsed with np.fromstring; anything
+    else (text, nulls, nested values, integers beyond int64) falls back to
+    json for that field only.
+    """
+    opening = scanner.peek()
+    if opening not in "[{":
+        scanner.value()
+        return None
+
+    closing = "]" if opening == "[" else "}"
+    head = scanner.lookahead(32)[1:].lstrip()
+    index_keyed = opening == "{" and head[:1] == '"' and head[1:2].isdigit()
+    if head[:1] in '"[{' and not index_keyed:
+        return _json_series(scanner, opening)
+
+    scanner.mark = scanner.pos
+    try:
+        scanner.pos += 1
+        raw = scanner.until(closing)
+        text = _INDEX_KEY.sub("", raw[:-1]) if index_keyed else raw[:-1]
+        if '"' in text:
+            # A string value before the first closing character may contain that character,
+            # so the cut is not trustworthy: rewind to the opening and decode the field with json
+            scanner.pos = scanner.mark
+            scanner.mark = None
+            return _json_series(scanner, opening)
+    finally:
+        scanner.mark = None
+    if not text.strip():
+        return np.empty(0, dtype=np.float64)
+    if "null" in text or "true" in text or "false" in text:
+        return _json_text_series(text)
+    dtype = np.float64 if _NON_INTEGER.search(text) else np.int64
+    try:
+        column = np.fromstring(text, dtype=dtype, sep=",")
+    except ValueError:
+        raise IngestError("malformed numeric series in upload")
+    if column.size != text.count(",") + 1:
+        raise IngestError("malformed numeric series in upload")
+    if dtype == np.int64 and column.size and (column.max() == _INT64.max or column.min() == _INT64.min):
+        # np.fromstring saturates integers beyond int64; json keeps them (as float64 via to_array)
+        return _json_text_series(text)
+    return column
+
+
+def _json_text_series(text):
+    try:
+        return to_array(json.loads("[" + text + "]"))
+    except ValueError:
+        raise IngestError("malformed series in upload")
+
@@ -0,0 +1,151 @@
+"""
+Shared asynchronous OpenAI client for the chat pipeline.
+
+One AsyncOpenAI client (with a pooled HTTP connection pool) lives on a
+single background event loop for the whole process. Flask's synchronous
+request threads submit pipeline coroutines to that loop with run(), which
+also enforces the per-request deadline. Completions are retried with
+exponential backoff only when the API answers with a rate limit.
+Every completion is a tracing span carrying its stage and token counts.
+
+Point OPENAI_BASE_URL at a local stub of the chat-completions API to run
+the pipeline without the real service.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+import httpx
+from openai import AsyncOpenAI, RateLimitError
+
+from metrics import registry
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1")
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "5"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "0.5"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "20"))
+CHAT_DEADLINE_S = float(os.getenv("CHAT_DEADLINE_S", "120"))
+
+registry.counter("llm_tokens_total", "Model tokens by pipeline stage and kind (prompt or completion).")
+registry.counter("llm_rate_limited_total", "Completions answered with a rate limit, by pipeline stage.")
+
+
+class DeadlineExceeded(Exception):
+    """The chat pipeline did not finish within its deadline."""
+
+
+def _retry_after(error):
+    """Server-suggested wait from a 429 response, if any."""
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _record_usage(current, stage, usage):
+    if usage is None:
+        return
+    prompt, completion = usage.prompt_tokens or 0, usage.completion_tokens or 0
+    current.set(prompt_tokens=prompt, completion_tokens=completion)
+    registry.inc("llm_tokens_total", prompt, stage=stage, kind="prompt")
+    registry.inc("llm_tokens_total", completion, stage=stage, kind="completion")
+
+
+class LLMRuntime:
+    """Background event loop plus the one AsyncOpenAI client bound to it."""
+
+    def __init__(self, api_key=None, base_url=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._loop.run_forever, name="llm-loop", daemon=True)
+                thread.start()
+            return self._loop
+
+    @property
+    def client(self):
+        """The shared client; must be used from coroutines running on this runtime's loop."""
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                api_key=self.api_key or os.getenv("OPENAI_API_KEY"),
+                base_url=self.base_url or os.getenv("OPENAI_BASE_URL"),
+                max_retries=0,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=LLM_MAX_CONNECTIONS
+                    ),
+                    timeout=httpx.Timeout(CHAT_DEADLINE_S, connect=10.0)
+                )
+            )
+        return self._client
+
+    async def _create(self, stage, **kwargs):
+        """chat.completions.create with backoff on rate limits only."""
+        kwargs.setdefault("model", OPENAI_MODEL)
+        for attempt in range(LLM_RATE_LIMIT_RETRIES + 1):
+            try:
+                return await self.client.chat.completions.create(**kwargs)
+            except RateLimitError as e:
+                registry.inc("llm_rate_limited_total", stage=stage)
+                if attempt == LLM_RATE_LIMIT_RETRIES:
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = min(LLM_BACKOFF_MAX_S, LLM_BACKOFF_BASE_S * 2 ** attempt)
+                    delay *= random.uniform(0.5, 1.0)
+                logger.info(f"Rate limited; retrying in {delay:.2f}s (attempt {attempt + 1})")
+                await asyncio.sleep(delay)
+
+    async def complete(self, stage="", **kwargs):
+        """chat.completions.create, retried on rate limits and traced as an llm_call span of `stage`."""
+        with span("llm_call", stage, model=kwargs.get("model", OPENAI_MODEL)) as current:
+            response = await self._create(stage, **kwargs)
+            _record_usage(current, stage, getattr(response, "usage", None))
+            return response
+
+    async def stream(self, stage="", **kwargs):
+        """Content deltas of a streamed completion; rate limits are retried as in complete()."""
+        with span("llm_call", stage, model=kwargs.get("model", OPENAI_MODEL), stream=True) as current:
+            # The last chunk then carries the token counts, with no choices
+            response = await self._create(stage, stream=True, stream_options={"include_usage": True}, **kwargs)
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if "first_token_ms" not in current.attributes:
+                        current.set(first_token_ms=round((time.perf_counter() - current.start) * 1000, 3))
+                    yield chunk.choices[0].delta.content
+                if getattr(chunk, "usage", None) is not None:
+                    _record_usage(current, stage, chunk.usage)
+
+    def submit(self, coro, deadline=CHAT_DEADLINE_S):
+        """
+        Schedule `coro` on the shared loop, bounded by `deadline` seconds.
+        Returns a concurrent.futures.Future; cancelling it cancels the coroutine.
+        """
+        loop = self._ensure_loop()
+
+        async def bounded():
+            try:
+                return await asyncio.wait_for(coro, deadline)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f"chat pipeline exceeded {deadline:.0f}s deadline")
+
+        return asyncio.run_coroutine_threadsafe(bounded(), loop)
+
+    def run(self, coro, deadline=CHAT_DEADLINE_S):
+        """Run `coro` on the shared loop from a synchronous thread, bounded by `deadline` seconds."""
+        return self.submit(coro, deadline).result()
@@ -0,0 +1,202 @@
+"""
+Path index for tool lookups.
+
+Built once per TelemetryStore. It resolves the paths the model proposes
+(['GPS[0]', 'Status'], ['GPS', 0, 'Status'], 'GPS[0].Status',
+{"message_type": "POS", "field": "Alt"}, positional integers, ...) to a
+(message type, field, sample index) triple with dict lookups only.
+Case/punctuation variants and bare instance names ('gps' -> 'GPS[0]') are
+precomputed as aliases; near misses fall back to a memoized fuzzy match so
+an almost-right path resolves without another model round trip.
+"""
+import difflib
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+FUZZY_CUTOFF = 0.75
+SUGGESTION_CUTOFF = 0.4
+
+_INSTANCE = re.compile(r"^(?P<base>.+?)\[(?P<instance>\d+)\]$")
+_SEPARATORS = re.compile(r"[./]")
+_TRAILING_DIGITS = re.compile(r"\d*$")
+
+
+def normalize(name):
+    """Case- and punctuation-insensitive form of a message type or field name."""
+    return re.sub(r"[^0-9a-z]", "", str(name).lower())
+
+
+class PathResolution:
+    """Outcome of resolving one tool path."""
+
+    def __init__(self, message_type=None, field=None, index=None, corrected=False, suggestions=None, detail=None):
+        self.message_type = message_type
+        self.field = field
+        self.index = index
+        self.corrected = corrected
+        self.suggestions = suggestions or []
+        self.detail = detail
+
+    @property
+    def found(self):
+        return self.message_type is not None
+
+    @property
+    def path(self):
+        path = [self.message_type]
+        if self.field is not None:
+            path.append(self.field)
+        if self.index is not None:
+            path.append(self.index)
+        return path
+
+
+class PathIndex:
+    """Precomputed exact, positional, alias and fuzzy lookups for one store."""
+
+    def __init__(self, tables):
+        self.types = list(tables)
+        self.fields = {name: list(table.columns) for name, table in tables.items()}
+        self.field_sets = {name: set(fields) for name, fields in self.fields.items()}
+
+        self.type_aliases = {}
+        for name in self.types:
+            self.type_aliases.setdefault(normalize(name), name)
+        # Bare base names point at the first instance: 'GPS' -> 'GPS[0]'
+        for name in self.types:
+            match = _INSTANCE.match(name)
+            if match:
+                self.type_aliases.setdefault(normalize(match.group("base")), name)
+
+        self.field_aliases = {
+            name: {normalize(field): field for field in reversed(fields)}
+            for name, fields in self.fields.items()
+        }
+
+        # Field name -> owning message types, for paths that omit the type
+        self.field_owners = {}
+        for name, fields in self.fields.items():
+            for field in fields:
+                self.field_owners.setdefault(normalize(field), []).append(name)
+
+        self._fuzzy_memo = {}
+
+    def _fuzzy(self, key, aliases, scope):
+        """
+        Return (best, suggestions) for a key with no exact or alias match.
+        `best` is set only when the match is close enough to use directly.
+        """
+        memo_key = (scope, key)
+        if memo_key not in self._fuzzy_memo:
+            matches = difflib.get_close_matches(key, list(aliases), n=3, cutoff=SUGGESTION_CUTOFF)
+            best = None
+            # Never across numbers: 'gps1' is the second GPS, not a typo of 'gps0' (nor C15 of C1)
+            if matches and difflib.SequenceMatcher(None, key, matches[0]).ratio() >= FUZZY_CUTOFF \
+                    and _TRAILING_DIGITS.search(key).group() == _TRAILING_DIGITS.search(matches[0]).group():
+                best = aliases[matches[0]]
+            self._fuzzy_memo[memo_key] = (best, [aliases[m] for m in matches])
+        return self._fuzzy_memo[memo_key]
+
+    def _resolve_type(self, key):
+        """Return (message_type, corrected, suggestions)."""
+        if isinstance(key, int):
+            if -len(self.types) <= key < len(self.types):
+                return self.types[key], False, []
+            return None, False, []
+        if key in self.field_sets:
+            return key, False, []
+        alias = self.type_aliases.get(normalize(key))
+        if alias is not None:
+            return alias, True, []
+        best, suggestions = self._fuzzy(normalize(key), self.type_aliases, None)
+        if best is None:
+            # A missing instance ('GPS[1]' in a single-GPS log): suggest the instances there are
+            match = _INSTANCE.match(key)
+            base = normalize(match.group("base")) if match else _TRAILING_DIGITS.sub("", normalize(key))
+            instances = [name for name in self.types
+                         if _INSTANCE.match(name) and normalize(_INSTANCE.match(name).group("base")) == base]
+            suggestions = instances or suggestions
+        return best, best is not None, suggestions
+
+    def _resolve_field(self, message_type, key):
+        """Return (field, corrected, suggestions)."""
+        fields = self.fields[message_type]
+        if isinstance(key, int):
+            if -len(fields) <= key < len(fields):
+                return fields[key], False, []
+            return None, False, []
+        if key in self.field_sets[message_type]:
+            return key, False, []
+        aliases = self.field_aliases[message_type]
+        alias = aliases.get(normalize(key))
+        if alias is not None:
+            return alias, True, []
+        best, suggestions = self._fuzzy(normalize(key), aliases, message_type)
+        return best, best is not None, suggestions
+
+    def lookup(self, message_type, field):
+        """(message type, field) by exact name or alias only, without fuzzy matching; None if absent."""
+        if message_type not in self.field_sets:
+            message_type = self.type_aliases.get(normalize(message_type))
+            if message_type is None:
+                return None
+        if field not in self.field_sets[message_type]:
+            field = self.field_aliases[message_type].get(normalize(field))
+            if field is None:
+                return None
+        return message_type, field
+
+    def split(self, keys_list):
+        """Flatten the accepted path spellings into a list of keys."""
+        if isinstance(keys_list, dict):
+            keys_list = list(keys_list.values())
+        elif isinstance(keys_list, str):
+            keys_list = [keys_list]
+        keys = []
+        for key in keys_list or []:
+            if isinstance(key, str) and key.lstrip("-").isdigit() and keys:
+                key = int(key)
+            if isinstance(key, str) and _SEPARATORS.search(key) and key not in self.field_sets:
+                keys.extend(k for k in _SEPARATORS.split(key) if k)
+            else:
+                keys.append(key)
+        # ['GPS', 0, 'Status'] means instance 0 of GPS, not sample 0
+        if len(keys) >= 3 and isinstance(keys[0], str) and isinstance(keys[1], int) \
+                and f"{keys[0]}[{keys[1]}]" in self.field_sets:
+            keys = [f"{keys[0]}[{keys[1]}]"] + keys[2:]
+        return keys
+
+    def resolve(self, keys_list):
+        keys = self.split(keys_list)
+        if not keys:
+            return PathResolution(suggestions=self.types[:10])
+
+        message_type, corrected, suggestions = self._resolve_type(keys[0])
+        rest = keys[1:]
+        if message_type is None:
+            # The model may have skipped the message type: ['Alt'] -> ['POS', 'Alt']
+            owners = self.field_owners.get(normalize(keys[0]), []) if isinstance(keys[0], str) else []
+            if len(owners) != 1:
+                return PathResolution(suggestions=[[o, keys[0]] for o in owners] or suggestions)
+            message_type, rest, corrected = owners[0], keys, True
+
+        if not rest:
+            return PathResolution(message_type, corrected=corrected)
+
+        field, field_corrected, suggestions = self._resolve_field(message_type, rest[0])
+        if field is None:
+            return PathResolution(suggestions=[[message_type, f] for f in suggestions])
+        corrected = corrected or field_corrected
+
+        index = None
+        if len(rest) > 1:
+            index = rest[1]
+            if not isinstance(index, int) or len(rest) > 2:
+                return PathResolution(suggestions=[[message_type, field]])
+
+        resolution = PathResolution(message_type, field, index, corrected=corrected)
+        if corrected:
+            logger.info(f"Path {keys_list} resolved to {resolution.path}")
+        return resolution
@@ -0,0 +1,274 @@
+"""
+Local routing for chat questions, ahead of any model call.
+
+* route_question(question, store) recognises single-statistic questions ("What was
+  the highest altitude?", "max of POS.Alt", "How long was the flight?") and
+  returns a DirectQuery: the summary-tool calls that answer it, so the
+  pipeline can skip the model entirely.
+* classify(question) replaces the Stage 0 complexity call for most
+  questions. Keyword/pattern rules decide first; questions the rules cannot
+  settle go to a small multinomial naive Bayes trained on the past
+  classifications of the model, which are appended to QUESTION_HISTORY_PATH.
+  When neither is confident it returns None and the caller asks the model.
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from answer_cache import normalize_question
+from telemetry_store import TIME_FIELDS
+
+logger = logging.getLogger(__name__)
+
+QUESTION_HISTORY_PATH = os.getenv("QUESTION_HISTORY_PATH", "question_history.jsonl")
+# Naive Bayes only decides once it has seen this many labelled questions...
+CLASSIFIER_MIN_EXAMPLES = int(os.getenv("CLASSIFIER_MIN_EXAMPLES", "20"))
+# ...and only when its posterior for the winning label is at least this high
+CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("CLASSIFIER_MIN_CONFIDENCE", "0.9"))
+
+LABELS = ("simple", "complex")
+
+COMPLEX_PATTERNS = re.compile(
+    r"\b(anomal\w*|issues?|problems?|errors?|critical|failures?|faults?|wrong|unusual|abnormal\w*|"
+    r"trends?|patterns?|compar\w*|versus|vs|summar\w*|analy\w*|diagnos\w*|detect\w*|spot|"
+    r"mid-?flight|throughout|over time|list all|all the|why|explain|health|overall|investigat\w*|glitch\w*)\b"
+)
+SIMPLE_PATTERNS = re.compile(
+    r"\b(highest|lowest|maximum|minimum|max|min|peak|average|mean|first|last|initial|final|"
+    r"how long|how many|how much|duration|total flight time|what was the|what is the)\b"
+)
+
+OPERATIONS = (
+    ("max", re.compile(r"\b(highest|maximum|max|peak|greatest|top)\b")),
+    ("min", re.compile(r"\b(lowest|minimum|min|smallest)\b")),
+    ("average", re.compile(r"\b(average|mean|avg)\b")),
+)
+# A direct answer is only given when, besides the statistic and the quantity (or
+# path), the question holds nothing but these words: anything else may narrow it
+# ("in AUTO", "in the first 30 seconds", "GPS altitude", "above home")
+FILLER_WORDS = frozenset((
+    "what", "whats", "was", "is", "were", "the", "a", "an", "of", "for", "during", "this",
+    "flight", "log", "value", "recorded", "reached",
+))
+# Several questions in one ("... and were there any glitches?") are not settled by the rules
+CONJUNCTIONS = re.compile(r"\b(and|or|also|plus|then|as well as)\b|[;,]")
+DURATION = re.compile(r"^(how long (was|did) the (total )?flight( time)?( last)?|(what was the )?(total )?flight "
+                      r"(time|duration)|how long did (it|the drone|the vehicle) fly)$")
+EXPLICIT_PATH = re.compile(r"\b([A-Za-z][A-Za-z0-9_]*(?:\[\d+\])?)\.([A-Za-z][A-Za-z0-9_]*)\b")
+
+# Everyday names for common series, with candidate paths in order of preference
+QUANTITIES = (
+    ("altitude", re.compile(r"\baltitude\b|\balt\b|\bheight\b"),
+     (("POS", "Alt", "m"), ("AHR2", "Alt", "m"), ("CTUN", "Alt", "m"), ("GPS[0]", "Alt", "mm"),
+      ("GPS", "Alt", "m"), ("VFR_HUD", "alt", "m"))),
+    ("battery temperature", re.compile(r"\bbattery temp(erature)?\b"),
+     (("BAT[0]", "Temp", "degC"), ("BAT", "Temp", "degC"), ("BATTERY_STATUS", "temperature", "cdegC"))),
+    ("battery voltage", re.compile(r"\bbattery volt(age)?\b|\bvoltage\b"),
+     (("BAT[0]", "Volt", "V"), ("BAT", "Volt", "V"), ("SYS_STATUS", "voltage_battery", "mV"))),
+    ("battery current", re.compile(r"\bbattery current\b|\bcurrent draw\b"),
+     (("BAT[0]", "Curr", "A"), ("BAT", "Curr", "A"), ("SYS_STATUS", "current_battery", "cA"))),
+    ("ground speed", re.compile(r"\b(ground ?)?speed\b"),
+     (("GPS[0]", "Spd", "m/s"), ("GPS", "Spd", "m/s"), ("VFR_HUD", "groundspeed", "m/s"))),
+    ("satellite count", re.compile(r"\bsatellites?( count)?\b|\bsats\b"),
+     (("GPS[0]", "NSats", "count"), ("GPS", "NSats", "count"), ("GPS_RAW_INT", "satellites_visible", "count"))),
+    ("GPS HDop", re.compile(r"\bhdop\b"),
+     (("GPS[0]", "HDop", ""), ("GPS", "HDop", ""), ("GPS_RAW_INT", "eph", "cm"))),
+    ("roll", re.compile(r"\broll( angle)?\b"), (("ATT", "Roll", "deg"), ("AHR2", "Roll", "deg"))),
+    ("pitch", re.compile(r"\bpitch( angle)?\b"), (("ATT", "Pitch", "deg"), ("AHR2", "Pitch", "deg"))),
+)
+DURATION_TYPES = ("ATT", "POS", "GPS[0]", "GPS", "AHR2")
+
+
+class DirectQuery:
+    """Summary-tool calls that fully answer a single-statistic question."""
+
+    def __init__(self, label, operation, calls, unit=""):
+        self.label = label
+        self.operation = operation
+        self.calls = calls  # [(keys_list, operation), ...]
+        self.unit = unit
+
+
+def _series_exists(store, message_type, field):
+    table = store.tables.get(message_type)
+    return table is not None and field in table.columns
+
+
+def _find_quantity(text, store):
+    matches = [(label, pattern, candidates) for label, pattern, candidates in QUANTITIES if pattern.search(text)]
+    if len(matches) != 1:
+        return None
+    label, pattern, candidates = matches[0]
+    for message_type, field, unit in candidates:
+        if _series_exists(store, message_type, field):
+            return label, [message_type, field], unit, pattern
+    return None
+
+
+def _only_filler(text, *patterns):
+    """True when `text` holds nothing but FILLER_WORDS once every match of `patterns` is removed."""
+    for pattern in patterns:
+        text = pattern.sub(" ", text)
+    return all(token in FILLER_WORDS for token in _tokens(text))
+
+
+def route_question(question, store):
+    """DirectQuery for a single-statistic question, or None."""
+    text = normalize_question(question)
+    if not text:
+        return None
+
+    if DURATION.match(text):
+        for message_type in DURATION_TYPES + tuple(store.message_types):
+            table = store.tables.get(message_type)
+            if table is not None and table.time_field is not None and len(table.time_ms):
+                keys = [message_type, table.time_field]
+                return DirectQuery("flight duration", "duration", [(keys, "first"), (keys, "last")], "s")
+        return None
+
+    operations = [(op, pattern) for op, pattern in OPERATIONS if pattern.search(text)]
+    if len(operations) != 1:
+        return None
+    operation, operation_pattern = operations[0]
+
+    # An explicit, exactly matching path wins ("max of POS.Alt")
+    explicit = [m for m in EXPLICIT_PATH.finditer(question) if _series_exists(store, m.group(1), m.group(2))]
+    if len(explicit) == 1:
+        if not _only_filler(text, operation_pattern, re.compile(re.escape(explicit[0].group(0).lower()))):
+            return None
+        keys = [explicit[0].group(1), explicit[0].group(2)]
+        return DirectQuery(".".join(keys), operation, [(keys, operation)])
+    if explicit:
+        return None
+
+    quantity = _find_quantity(text, store)
+    if quantity is None:
+        return None
+    label, keys, unit, quantity_pattern = quantity
+    if not _only_filler(text, operation_pattern, quantity_pattern):
+        return None
+    return DirectQuery(label, operation, [(keys, operation)], unit)
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return f"{value:.4g}" if abs(value) < 1e4 else f"{value:.0f}"
+    return str(value)
+
+
+def format_direct_answer(query, results):
+    """Answer text in the agents' output format from the results of query.calls."""
+    values = [r.get("result", r) if isinstance(r, dict) else r for r in results]
+    if any(isinstance(v, dict) or v is None for v in values):
+        return None
+    unit = f" {query.unit}" if query.unit else ""
+
+    if query.operation == "duration":
+        keys = query.calls[0][0]
+        scale = dict(TIME_FIELDS)[keys[1]] / 1000.0
+        first, last = values
+        seconds = (last - first) * scale
+        minutes, rest = divmod(seconds, 60)
+        return (
+            f"The log covers {seconds:.1f} s ({int(minutes)} min {rest:.0f} s) from the first to the last "
+            f"{keys[0]} sample.\n\n"
+            f"- {keys[0]}.{keys[1]}: first = {_format_value(first)}, last = {_format_value(last)} "
+            f"(summary tool, first/last)"
+        )
+
+    keys, operation = query.calls[0]
+    names = {"max": "maximum", "min": "minimum", "average": "average"}
+    return (
+        f"The {names[operation]} {query.label} was {_format_value(values[0])}{unit}.\n\n"
+        f"- {keys[0]}.{keys[1]}: {operation} = {_format_value(values[0])}{unit} (summary tool)"
+    )
+
+
+def _tokens(text):
+    return re.findall(r"[a-z0-9_]+", text)
+
+
+class ComplexityClassifier:
+    """Rules first, then naive Bayes over past model classifications."""
+
+    def __init__(self, history_path=QUESTION_HISTORY_PATH):
+        self.history_path = history_path
+        self.word_counts = {label: Counter() for label in LABELS}
+        self.label_counts = Counter()
+        self.vocabulary = set()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.history_path or not os.path.exists(self.history_path):
+            return
+        with open(self.history_path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("label") in LABELS:
+                    self._train(entry.get("question", ""), entry["label"])
+        logger.info(f"Complexity classifier trained on {sum(self.label_counts.values())} questions")
+
+    def _train(self, question, label):
+        tokens = _tokens(normalize_question(question))
+        self.word_counts[label].update(tokens)
+        self.label_counts[label] += 1
+        self.vocabulary.update(tokens)
+
+    def learn(self, question, label):
+        """Record a model classification and add it to the training data."""
+        if label not in LABELS:
+            return
+        with self._lock:
+            self._train(question, label)
+            if self.history_path:
+                try:
+                    with open(self.history_path, "a") as f:
+                        f.write(json.dumps({"question": question, "label": label}) + "\n")
+                except OSError as e:
+                    logger.warning(f"Could not append to question history: {e}")
+
+    def _rules(self, text):
+        complex_hit = COMPLEX_PATTERNS.search(text)
+        simple_hit = SIMPLE_PATTERNS.search(text)
+        if complex_hit and not simple_hit:
+            return "complex"
+        if simple_hit and not complex_hit and not CONJUNCTIONS.search(text):
+            return "simple"
+        return None
+
+    def _bayes(self, text):
+        with self._lock:
+            total = sum(self.label_counts.values())
+            if total < CLASSIFIER_MIN_EXAMPLES or len(self.label_counts) < len(LABELS):
+                return None, 0.0
+            tokens = _tokens(text)
+            vocabulary = len(self.vocabulary) + 1
+            scores = {}
+            for label in LABELS:
+                words = self.word_counts[label]
+                denominator = sum(words.values()) + vocabulary
+                scores[label] = math.log(self.label_counts[label] / total) + sum(
+                    math.log((words[token] + 1) / denominator) for token in tokens)
+        best = max(scores, key=scores.get)
+        peak = scores[best]
+        confidence = 1.0 / sum(math.exp(score - peak) for score in scores.values())
+        return best, confidence
+
+    def classify(self, question):
+        """'simple', 'complex', or None when the model should decide."""
+        text = normalize_question(question)
+        label = self._rules(text)
+        if label is not None:
+            return label
+        label, confidence = self._bayes(text)
+        if label is not None and confidence >= CLASSIFIER_MIN_CONFIDENCE:
+            return label
+        return None
@@ -0,0 +1,108 @@
+"""
+LRU cache for tool results.
+
+Entries are keyed by (log content hash, resolved path, operation,
+comparison, threshold, time window), so the same question asked twice on
+one log, or a different spelling of the same path, is answered without
+recomputing.
+The cache is bounded by the JSON size of the stored results and drops
+every entry of a log when its session leaves the SessionStore.
+"""
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_MB", "64")) * 1024 * 1024
+
+
+def _normalize_threshold(threshold, numeric=True):
+    """
+    Key form of a threshold. Numeric series compare "1", 1 and 1.0 alike, so
+    they share a key; other series compare them differently, so the value
+    keeps its type and spelling.
+    """
+    if not numeric:
+        return (type(threshold).__name__, threshold)
+    if isinstance(threshold, str):
+        try:
+            return float(threshold)
+        except ValueError:
+            return threshold
+    return threshold
+
+
+class ResultCache:
+    """Thread-safe, size-bounded LRU of JSON-serializable tool results."""
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._keys_by_log = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(log_hash, path, operation, comparison=None, threshold=None, window=None, numeric=True):
+        return (log_hash, tuple(path), operation, comparison, _normalize_threshold(threshold, numeric),
+                tuple(window) if window else None)
+
+    def get(self, key):
+        """Return (hit, value)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key, value):
+        nbytes = len(json.dumps(value))
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, nbytes)
+            self._keys_by_log.setdefault(key[0], set()).add(key)
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                old_key, (_, old_bytes) = self._entries.popitem(last=False)
+                self._forget(old_key)
+                self.size -= old_bytes
+                self.evictions += 1
+
+    def _forget(self, key):
+        keys = self._keys_by_log.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_log[key[0]]
+
+    def invalidate(self, log_hash):
+        """Drop every cached result for one log."""
+        with self._lock:
+            keys = self._keys_by_log.pop(log_hash, set())
+            for key in keys:
+                self.size -= self._entries.pop(key)[1]
+        if keys:
+            logger.info(f"Result cache dropped {len(keys)} entries for {log_hash}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
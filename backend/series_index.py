@@ -0,0 +1,211 @@
+"""
+Threshold index for count_where / first_index_where.
+
+Built lazily the first time a *_where operation touches a series, then
+reused for every later threshold:
+
+* a sorted copy of the non-NaN values with their original positions, so
+  counts for <, <=, >, >=, == and != are two binary searches;
+* per-block min/max (BLOCK_SIZE samples per block) for numeric series, so
+  a first-crossing lookup jumps to the first block that can contain a
+  match and only scans that block;
+* for enum-like series (few distinct values: GPS Status, flight mode, text)
+  an inverted index value -> sorted positions.
+
+An index is about twice the size of its series, so built indexes live in a
+process-wide IndexCache bounded by their bytes rather than on the tables:
+the least recently used are dropped and rebuilt on their next use.
+"""
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+BLOCK_SIZE = 1024
+ENUM_MAX_UNIQUE = 64
+INDEX_CACHE_MAX_BYTES = int(os.getenv("SERIES_INDEX_CACHE_MB", "256")) * 1024 * 1024
+
+COMPARISONS = {
+    "==": np.equal,
+    "!=": np.not_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+}
+
+
+class SeriesIndex:
+    """Sorted view, block summaries and (for enum-like series) an inverted index."""
+
+    def __init__(self, series):
+        self.series = series
+        self.size = len(series)
+        self.numeric = series.dtype.kind in "biuf"
+        values = series.view(np.uint8) if series.dtype.kind == "b" else series
+
+        position_dtype = np.int32 if self.size < 2 ** 31 else np.int64
+        order = np.argsort(values)
+        # NaNs sort last; they never satisfy an ordering comparison
+        self.valid = self.size - (int(np.count_nonzero(np.isnan(values))) if values.dtype.kind == "f" else 0)
+        self.order = order.astype(position_dtype, copy=False)
+        self.sorted = values[order[:self.valid]]
+
+        self.block_min = self.block_max = self.block_has_nan = None
+        if self.numeric and self.size:
+            starts = np.arange(0, self.size, BLOCK_SIZE)
+            self.block_min = np.fmin.reduceat(values, starts)
+            self.block_max = np.fmax.reduceat(values, starts)
+            if values.dtype.kind == "f":
+                self.block_has_nan = np.logical_or.reduceat(np.isnan(values), starts)
+
+        self.positions = None
+        enum_like = not self.numeric or (
+            self.valid and np.count_nonzero(self.sorted[1:] != self.sorted[:-1]) < ENUM_MAX_UNIQUE)
+        if enum_like:
+            uniques, starts = np.unique(self.sorted, return_index=True)
+            bounds = starts.tolist() + [self.valid]
+            self.positions = {
+                value: np.sort(self.order[bounds[i]:bounds[i + 1]])
+                for i, value in enumerate(uniques.tolist())
+            }
+
+    @property
+    def nbytes(self):
+        """Bytes held by the index itself; the indexed series is not counted."""
+        total = self.order.nbytes + self.sorted.nbytes
+        for blocks in (self.block_min, self.block_max, self.block_has_nan):
+            if blocks is not None:
+                total += blocks.nbytes
+        if self.positions is not None:
+            total += sum(p.nbytes for p in self.positions.values())
+        return total
+
+    def _range(self, comparison, threshold):
+        """[lo, hi) slice of the sorted values satisfying the comparison."""
+        left = int(np.searchsorted(self.sorted, threshold, side="left"))
+        right = int(np.searchsorted(self.sorted, threshold, side="right"))
+        return {
+            "<": (0, left),
+            "<=": (0, right),
+            ">": (right, self.valid),
+            ">=": (left, self.valid),
+            "==": (left, right),
+        }[comparison]
+
+    def count(self, comparison, threshold):
+        if self.positions is not None and comparison in ("==", "!="):
+            matches = len(self.positions.get(threshold, ()))
+        else:
+            lo, hi = self._range("==" if comparison == "!=" else comparison, threshold)
+            matches = hi - lo
+        # NaN != threshold is true, as in the unindexed comparison
+        return self.size - matches if comparison == "!=" else matches
+
+    def first_index(self, comparison, threshold):
+        """Position of the first sample satisfying the comparison, or None."""
+        if self.positions is not None and comparison == "==":
+            positions = self.positions.get(threshold)
+            return int(positions[0]) if positions is not None and len(positions) else None
+        if self.block_min is not None:
+            return self._first_in_blocks(comparison, threshold)
+        if comparison == "!=":
+            lo, hi = self._range("==", threshold)
+            if hi - lo == self.size:
+                return None
+            matches = np.ones(self.size, dtype=bool)
+            matches[self.order[lo:hi]] = False
+            return int(np.argmax(matches))
+        lo, hi = self._range(comparison, threshold)
+        return int(self.order[lo:hi].min()) if hi > lo else None
+
+    def _first_in_blocks(self, comparison, threshold):
+        if comparison == "<":
+            candidates = self.block_min < threshold
+        elif comparison == "<=":
+            candidates = self.block_min <= threshold
+        elif comparison == ">":
+            candidates = self.block_max > threshold
+        elif comparison == ">=":
+            candidates = self.block_max >= threshold
+        elif comparison == "==":
+            candidates = (self.block_min <= threshold) & (self.block_max >= threshold)
+        else:
+            candidates = (self.block_min != threshold) | (self.block_max != threshold)
+            if self.block_has_nan is not None:
+                candidates |= self.block_has_nan
+
+        # Ordering candidates always hold a match; '==' candidates may not
+        for block in np.flatnonzero(candidates):
+            start = int(block) * BLOCK_SIZE
+            chunk = self.series[start:start + BLOCK_SIZE]
+            mask = COMPARISONS[comparison](chunk, threshold)
+            if mask.any():
+                return start + int(np.argmax(mask))
+        return None
+
+
+class IndexCache:
+    """Thread-safe LRU of SeriesIndex objects keyed by (table, field), bounded by index bytes."""
+
+    def __init__(self, max_bytes=INDEX_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, table, field):
+        """Index of `field` in `table`, built on a miss (outside the lock) and cached."""
+        key = (id(table), field)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        index = SeriesIndex(table.columns[field])
+        nbytes = index.nbytes
+        if nbytes > self.max_bytes:
+            return index
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key][0]
+            # Ids are reused once a table is collected, so its entries go with it
+            finalizer = weakref.finalize(table, self._discard, key)
+            finalizer.atexit = False
+            self._entries[key] = (index, nbytes, finalizer)
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return index
+
+    def _remove(self, key):
+        _, nbytes, finalizer = self._entries.pop(key)
+        finalizer.detach()
+        self.size -= nbytes
+
+    def _discard(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+INDEX_CACHE = IndexCache()
@@ -0,0 +1,293 @@
+"""
+Log sessions stored as memory-mapped files.
+
+In the production server (gunicorn.conf.py) several worker processes answer
+requests. A log ingested by any of them is written once under
+LOG_SESSION_SHARED_DIR (gunicorn.conf.py defaults it to a directory on
+/dev/shm, so the files live in RAM):
+
+    <session id>/meta.json    name, type, schema string, per-table time
+                              field, per-series statistics, anomaly events
+    <session id>/<n>.npy      one column (or derived time column) each
+    <session id>/<n>.json     a boxed (object) column, e.g. text with nulls
+
+Every worker, including the one that ingested the log, reopens the columns
+with np.load(mmap_mode="r"), so all workers read the same pages of one copy
+and a question can be answered by a worker that never saw the upload.
+
+A session directory is written under a temporary name and published with an
+atomic rename, so a reader never sees a half-written log. Its mtime is the
+last access by any worker. Directories idle for longer than the idle TTL
+are removed, and so are the least recently used ones once the directory
+holds more than the memory budget.
+
+Nothing read back is executable: boxed columns are stored as JSON rather than
+pickles and arrays are loaded with allow_pickle=False. The shared and spill
+roots have fixed, guessable paths, so they are created with mode 0700 and
+refused when another user owns them.
+
+A single process (no shared directory) uses the same layout to spill
+sessions: once resident logs exceed the memory budget, the least recently
+used are written to a private SpillDirectory and their arrays released.
+The next question about a spilled log reopens it as memory maps in a few
+milliseconds, and the OS page cache decides how much of it stays in RAM.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from sessions import SESSION_IDLE_TTL, SESSION_MEMORY_BUDGET, LogSession
+from telemetry_store import MessageTable, TelemetryStore, to_array
+
+logger = logging.getLogger(__name__)
+
+SESSION_SHARED_DIR = os.getenv("LOG_SESSION_SHARED_DIR", "")
+# Where a single process spills sessions over its memory budget; empty to drop them instead
+SESSION_SPILL_DIR = os.getenv("LOG_SESSION_SPILL_DIR", os.path.join(tempfile.gettempdir(), "uav-log-spill"))
+# Workers refresh a session directory's access time at most this often
+SESSION_TOUCH_INTERVAL_S = float(os.getenv("LOG_SESSION_TOUCH_INTERVAL_S", "30"))
+# Temporary directories left behind by a worker that died mid-write
+STALE_WRITE_S = 3600.0
+
+SESSION_ID = re.compile(r"[0-9a-f]{16,128}")
+
+
+def private_directory(root):
+    """Create `root` only this user can enter, or check that an existing one is this user's."""
+    os.makedirs(root, mode=0o700, exist_ok=True)
+    info = os.stat(root)
+    if info.st_uid != os.getuid():
+        raise PermissionError(f"session directory {root} is owned by another user")
+    if info.st_mode & 0o077:
+        os.chmod(root, 0o700)
+
+
+def _save_array(directory, files, array):
+    if array.dtype.hasobject:
+        # Boxed values come from JSON uploads, so JSON holds them without a pickle
+        name = f"{len(files)}.json"
+        with open(os.path.join(directory, name), "w") as f:
+            json.dump(array.tolist(), f)
+    else:
+        name = f"{len(files)}.npy"
+        np.save(os.path.join(directory, name), array, allow_pickle=False)
+    files.append(name)
+    return name
+
+
+def _load_array(directory, name):
+    path = os.path.join(directory, name)
+    if name.endswith(".json"):
+        with open(path, "r") as f:
+            return to_array(json.load(f))
+    try:
+        return np.load(path, mmap_mode="r", allow_pickle=False)
+    except ValueError:
+        # Empty columns cannot be mapped
+        return np.load(path, allow_pickle=False)
+
+
+def save_store(store, directory, **meta):
+    """Write `store` into the existing `directory`; `meta` is stored alongside it."""
+    files = []
+    tables = {}
+    for message_type, table in store.tables.items():
+        columns = {field: _save_array(directory, files, column) for field, column in table.columns.items()}
+        time_ms = None
+        if table.time_ms is not None:
+            time_column = table.columns[table.time_field]
+            # The time column is usually the raw column itself; store it only when it is derived
+            time_ms = columns[table.time_field] if table.time_ms is time_column \
+                else _save_array(directory, files, table.time_ms)
+        tables[message_type] = {"columns": columns, "time_ms": time_ms, "stats": table.stats}
+    meta = dict(meta, digest=store.digest, nbytes=store.nbytes, tables=tables, events=store.events())
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def load_store(directory):
+    """(meta, TelemetryStore) for a directory written by save_store, with memory-mapped columns."""
+    with open(os.path.join(directory, "meta.json"), "r") as f:
+        meta = json.load(f)
+    tables = {}
+    for message_type, entry in meta.pop("tables").items():
+        columns = {field: _load_array(directory, name) for field, name in entry["columns"].items()}
+        time_ms = _load_array(directory, entry["time_ms"]) if entry["time_ms"] is not None else None
+        tables[message_type] = MessageTable(message_type, columns, time_ms=time_ms, stats=entry["stats"])
+    store = TelemetryStore(tables, digest=meta["digest"], events=meta.pop("events"))
+    return meta, store
+
+
+def write_session(root, session):
+    """
+    Write `session` to root/<session id> through a staging directory and an
+    atomic rename. Returns the path; raises OSError if the target exists.
+    """
+    target = os.path.join(root, session.session_id)
+    staging = tempfile.mkdtemp(prefix=f".{session.session_id}-", dir=root)
+    try:
+        save_store(session.data, staging, name=session.name, log_type=session.log_type,
+                   file_information=session.file_information)
+        os.rename(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return target
+
+
+def open_session(path, session_id):
+    """LogSession with memory-mapped columns from a directory written by write_session."""
+    meta, store = load_store(path)
+    return LogSession(
+        session_id=session_id,
+        name=meta.get("name"),
+        log_type=meta.get("log_type"),
+        data=store,
+        file_information=meta.get("file_information"),
+        nbytes=meta["nbytes"]
+    )
+
+
+def directory_size(directory):
+    try:
+        return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+    except FileNotFoundError:
+        return 0
+
+
+class SharedSessions:
+    """Session directories under `root`, shared by every worker process."""
+
+    def __init__(self, root, memory_budget=SESSION_MEMORY_BUDGET, idle_ttl=SESSION_IDLE_TTL):
+        self.root = root
+        self.memory_budget = memory_budget
+        self.idle_ttl = idle_ttl
+        self._touched = {}
+        self._lock = threading.Lock()
+        private_directory(root)
+
+    def path(self, session_id):
+        # Session ids come from URLs; only content hashes name a directory
+        if not isinstance(session_id, str) or not SESSION_ID.fullmatch(session_id):
+            return None
+        return os.path.join(self.root, session_id)
+
+    def __contains__(self, session_id):
+        path = self.path(session_id)
+        return path is not None and os.path.isdir(path)
+
+    def publish(self, session):
+        """
+        Write `session` unless another worker already has. Returns
+        (session reopened from the shared files, whether this call wrote it).
+        """
+        target = self.path(session.session_id)
+        if target is None:
+            raise ValueError(f"session id {session.session_id!r} is not a content hash")
+        created = False
+        if not os.path.isdir(target):
+            try:
+                write_session(self.root, session)
+                created = True
+                logger.info(f"Session {session.session_id} published to {target}")
+            except OSError:
+                # Losing the race to a worker that published the same log is fine
+                if not os.path.isdir(target):
+                    raise
+        self.expire(keep=session.session_id)
+        return self.attach(session.session_id), created
+
+    def attach(self, session_id):
+        """LogSession backed by the shared files of `session_id`, or None."""
+        path = self.path(session_id)
+        if path is None:
+            return None
+        try:
+            session = open_session(path, session_id)
+        except FileNotFoundError:
+            return None
+        self.touch(session_id, force=True)
+        return session
+
+    def touch(self, session_id, force=False):
+        """Record an access; True while the session directory still exists."""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._touched.get(session_id, 0.0) < SESSION_TOUCH_INTERVAL_S:
+                return True
+            self._touched[session_id] = now
+        try:
+            os.utime(self.path(session_id))
+            return True
+        except (FileNotFoundError, TypeError):
+            with self._lock:
+                self._touched.pop(session_id, None)
+            return False
+
+    def remove(self, session_id):
+        path = self.path(session_id)
+        if path is None or not os.path.isdir(path):
+            return False
+        with self._lock:
+            self._touched.pop(session_id, None)
+        # Workers that still map the files keep reading them until they let go
+        shutil.rmtree(path, ignore_errors=True)
+        logger.info(f"Shared session {session_id} removed")
+        return True
+
+    def expire(self, keep=None, now=None):
+        """Remove idle session directories, then the least recently used ones over the budget."""
+        now = time.time() if now is None else now
+        entries = []
+        for entry in os.scandir(self.root):
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if entry.name.startswith("."):
+                if now - mtime > STALE_WRITE_S:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            if entry.name == keep or not SESSION_ID.fullmatch(entry.name):
+                continue
+            if now - mtime > self.idle_ttl:
+                self.remove(entry.name)
+                continue
+            entries.append((mtime, entry.name, directory_size(entry.path)))
+
+        used = sum(size for _, _, size in entries)
+        if keep in self:
+            used += directory_size(self.path(keep))
+        for _, session_id, size in sorted(entries):
+            if used <= self.memory_budget:
+                break
+            self.remove(session_id)
+            used -= size
+
+
+class SpillDirectory:
+    """Private directory of this process for sessions spilled over the memory budget."""
+
+    def __init__(self, root=SESSION_SPILL_DIR):
+        private_directory(root)
+        self.root = tempfile.mkdtemp(prefix=f"{os.getpid()}-", dir=root)
+        atexit.register(shutil.rmtree, self.root, True)
+
+    def write(self, session):
+        """Write `session` and return its path."""
+        return write_session(self.root, session)
+
+    def reopen(self, path):
+        """TelemetryStore of a spilled session, with memory-mapped columns."""
+        return load_store(path)[1]
+
+    def remove(self, path):
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,233 @@
+"""
+Server-side log sessions.
+
+A log is uploaded once through /api/logs and kept here under an id derived
+from its content hash, so /api/chat only needs the id and the question.
+Sessions are evicted least-recently-used first once the memory budget is
+exceeded, and dropped after sitting idle for longer than the idle TTL.
+
+With a `shared` SharedSessions (session_files.py), as in the multi-worker
+server, uploads are published to shared memory-mapped files and a session
+this process has not seen is attached from there. Local eviction and expiry
+then only unmap the files; dropping a session removes the shared copy too.
+
+Without one, a `spill` SpillDirectory turns memory-budget eviction into a
+spill to disk: the session keeps its id, releases its arrays, and is reopened
+as memory maps on its next use. Spilled sessions do not count against the
+memory budget.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+SESSION_MEMORY_BUDGET = int(os.getenv("LOG_SESSION_MEMORY_BUDGET_MB", "2048")) * 1024 * 1024
+SESSION_IDLE_TTL = float(os.getenv("LOG_SESSION_IDLE_TTL_S", "3600"))
+
+
+class LogSession:
+    """One ingested log: its telemetry plus the metadata /api/chat needs."""
+
+    def __init__(self, session_id, name, log_type, data, file_information, nbytes):
+        self.session_id = session_id
+        self.name = name
+        self.log_type = log_type
+        self.data = data
+        self.file_information = file_information
+        self.nbytes = nbytes
+        self.created = time.time()
+        self.last_access = self.created
+        # Set once the session is spilled to disk (see SessionStore)
+        self.spill_path = None
+        self.spilling = False
+
+    def touch(self):
+        self.last_access = time.time()
+
+
+class SessionStore:
+    """Thread-safe LRU of LogSessions bounded by memory budget and idle TTL."""
+
+    def __init__(self, memory_budget=SESSION_MEMORY_BUDGET, idle_ttl=SESSION_IDLE_TTL, shared=None, spill=None):
+        self.memory_budget = memory_budget
+        self.idle_ttl = idle_ttl
+        self.shared = shared
+        self.spill = spill
+        self.memory_used = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.RLock()
+        self._drop_listeners = []
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def on_drop(self, callback):
+        """Register callback(session) run whenever a session leaves the store."""
+        self._drop_listeners.append(callback)
+
+    def add(self, session):
+        """
+        Insert `session`, returning (stored_session, created). If a session
+        with the same content hash already exists it is kept and refreshed.
+        """
+        with self._lock:
+            self.expire_idle()
+            existing = self._reuse(session.session_id)
+            if existing is not None:
+                return existing, False
+
+        created = True
+        if self.shared is not None:
+            # Written outside the lock; other requests keep being served meanwhile
+            session, created = self.shared.publish(session)
+
+        with self._lock:
+            existing = self._reuse(session.session_id)
+            if existing is not None:
+                return existing, False
+            self._sessions[session.session_id] = session
+            self.memory_used += session.nbytes
+            logger.info(f"Session {session.session_id} {'created' if created else 'attached'} ({session.nbytes} bytes)")
+        self._evict_to_budget(keep=session.session_id)
+        return session, created
+
+    def _reuse(self, session_id):
+        existing = self._sessions.get(session_id)
+        # A spilled session is reopened as for get(); if that fails it is dropped and replaced
+        if existing is not None and existing.data is None and not self._reopen(existing):
+            existing = None
+        if existing is not None:
+            existing.touch()
+            self._sessions.move_to_end(session_id)
+            logger.info(f"Session {session_id} reused for duplicate upload")
+        return existing
+
+    def get(self, session_id):
+        """
+        (session, store) for `session_id`, refreshing it, or (None, None). The
+        store is read under the lock: a spill may release session.data at any
+        time afterwards, while the returned store stays usable.
+        """
+        with self._lock:
+            self.expire_idle()
+            session = self._sessions.get(session_id)
+            if self.shared is None:
+                if session is None:
+                    return None, None
+                if session.data is None and not self._reopen(session):
+                    return None, None
+                session.touch()
+                self._sessions.move_to_end(session_id)
+                return session, session.data
+        return self._get_shared(session_id, session)
+
+    def _get_shared(self, session_id, session):
+        if session is not None and session_id not in self.shared:
+            # Another worker dropped it, or the shared store expired it
+            self.drop(session_id, reason="removed from shared store", local_only=True)
+            return None, None
+        if session is None:
+            session = self.shared.attach(session_id)
+            if session is None:
+                return None, None
+            logger.info(f"Session {session_id} attached from shared store")
+            with self._lock:
+                existing = self._sessions.get(session_id)
+                if existing is not None:
+                    session = existing
+                else:
+                    self._sessions[session_id] = session
+                    self.memory_used += session.nbytes
+            self._evict_to_budget(keep=session_id)
+        self.shared.touch(session_id)
+        with self._lock:
+            session.touch()
+            if session_id in self._sessions:
+                self._sessions.move_to_end(session_id)
+            return session, session.data
+
+    def _reopen(self, session):
+        started = time.perf_counter()
+        try:
+            session.data = self.spill.reopen(session.spill_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Spilled session {session.session_id} could not be reopened: {e}")
+            self.drop(session.session_id, reason="lost (spill files unreadable)")
+            return False
+        logger.info(f"Session {session.session_id} reopened from {session.spill_path} "
+                    f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return True
+
+    def drop(self, session_id, reason="dropped", local_only=False):
+        """
+        Remove a session. Unless `local_only`, its shared copy goes too, even
+        when this process never attached it.
+        """
+        removed = False
+        if self.shared is not None and not local_only:
+            removed = self.shared.remove(session_id)
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return removed
+            if session.spill_path is None:
+                self.memory_used -= session.nbytes
+        if session.spill_path is not None:
+            self.spill.remove(session.spill_path)
+        logger.info(f"Session {session_id} {reason}")
+        for callback in self._drop_listeners:
+            callback(session)
+        return True
+
+    def expire_idle(self, now=None):
+        """Drop every session idle for longer than the TTL."""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [sid for sid, s in self._sessions.items()
+                       if now - s.last_access > self.idle_ttl]
+        for sid in expired:
+            self.drop(sid, reason="expired", local_only=True)
+
+    def _evict_to_budget(self, keep=None):
+        with self._lock:
+            victims = []
+            used = self.memory_used
+            for sid, session in self._sessions.items():
+                if used <= self.memory_budget:
+                    break
+                if sid == keep or session.spill_path is not None or session.spilling:
+                    continue
+                victims.append(session)
+                used -= session.nbytes
+                session.spilling = self.spill is not None
+        for session in victims:
+            if self.spill is not None:
+                self._spill(session)
+            else:
+                self.drop(session.session_id, reason="evicted (memory budget)", local_only=True)
+
+    def _spill(self, session):
+        # Written outside the lock; the session stays usable from memory meanwhile
+        try:
+            path = self.spill.write(session)
+        except OSError as e:
+            logger.warning(f"Session {session.session_id} could not be spilled: {e}")
+            session.spilling = False
+            self.drop(session.session_id, reason="evicted (memory budget)")
+            return
+        with self._lock:
+            session.spilling = False
+            if self._sessions.get(session.session_id) is not session:
+                # Dropped while it was being written
+                self.spill.remove(path)
+                return
+            session.data = None
+            session.spill_path = path
+            self.memory_used -= session.nbytes
+        logger.info(f"Session {session.session_id} spilled to {path} ({session.nbytes} bytes)")
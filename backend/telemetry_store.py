@@ -0,0 +1,502 @@
+"""
+Columnar telemetry store.
+
+The frontend sends parsed logs as nested dicts: message type -> field ->
+list of samples (typed arrays arrive as dicts keyed "0", "1", ...). The store
+converts every field once into a contiguous NumPy array and keeps a shared
+millisecond time column per message type, so the tools can answer with
+vectorized reductions instead of looping over boxed Python values.
+"""
+import logging
+import math
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from anomalies import detect_events
+from derived_series import DERIVED_CACHE_MAX_BYTES, DERIVED_TYPE, NAMED_SERIES, DerivedSeriesError, available_series, derived_name, evaluate
+from downsample import downsample_indices
+from path_index import PathIndex, PathResolution, normalize
+from series_index import COMPARISONS, INDEX_CACHE
+
+logger = logging.getLogger(__name__)
+
+# Preferred timestamp columns, in order. TimeUS is converted to milliseconds.
+TIME_FIELDS = (("time_boot_ms", 1.0), ("TimeUS", 1e-3))
+
+SUMMARY_OPERATIONS = (
+    "first", "last", "min", "max", "average", "first_index_where", "count_where"
+)
+WHERE_OPERATIONS = ("first_index_where", "count_where")
+
+# Where flight-mode changes are recorded (message type, field), in order of preference
+MODE_SOURCES = (("MODE", "asText"), ("MODE", "Mode"), ("HEARTBEAT", "asText"))
+
+# Operations answered straight from the per-series statistics sidecar
+SIDECAR_OPERATIONS = {"first": "first", "last": "last", "min": "min", "max": "max", "average": "mean"}
+
+
+def to_array(values):
+    """Convert one parsed field (list or index-keyed dict) to a typed array."""
+    if isinstance(values, dict):
+        values = list(values.values())
+    try:
+        array = np.asarray(values)
+    except ValueError:
+        # Ragged nested values; keep them boxed rather than failing the ingest
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+    if array.dtype == object:
+        # Numbers mixed with null: store as float with NaN for the gaps
+        try:
+            array = np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            pass
+    return np.ascontiguousarray(array)
+
+
+def is_series(values):
+    """True for list-like field payloads (lists or index-keyed dicts)."""
+    if isinstance(values, (list, tuple, np.ndarray)):
+        return True
+    if isinstance(values, dict):
+        return all(isinstance(k, str) and k.isdigit() for k in values)
+    return False
+
+
+def to_jsonable(value):
+    """Turn arrays, tables and NumPy scalars into plain JSON-serializable values."""
+    if isinstance(value, MessageTable):
+        return {field: to_jsonable(column) for field, column in value.columns.items()}
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind == "f":
+            return [None if math.isnan(v) else v for v in value.tolist()]
+        return value.tolist()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, dict):
+        return {k: to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    return value
+
+
+def _scalar(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def series_stats(column, time_ms=None):
+    """
+    Statistics sidecar for one series: count, first, last and, for numeric
+    series, min, max, mean, sum, NaN count and the timestamps (ms) of the
+    min/max samples. NaNs are ignored by every reduction.
+    """
+    count = len(column)
+    stats = {"count": count, "first": None, "last": None}
+    if count == 0:
+        return stats
+    stats["first"] = _scalar(column[0])
+    stats["last"] = _scalar(column[-1])
+    if column.dtype.kind not in "biuf":
+        return stats
+
+    values = column.view(np.uint8) if column.dtype.kind == "b" else column
+    nan_count = int(np.count_nonzero(np.isnan(values))) if values.dtype.kind == "f" else 0
+    stats["nan_count"] = nan_count
+    if nan_count == count:
+        stats.update({"min": None, "max": None, "mean": None, "sum": None,
+                      "argmin_time_ms": None, "argmax_time_ms": None})
+        return stats
+
+    if nan_count:
+        argmin, argmax = int(np.nanargmin(values)), int(np.nanargmax(values))
+        total = np.nansum(values, dtype=np.float64)
+    else:
+        argmin, argmax = int(np.argmin(values)), int(np.argmax(values))
+        total = np.sum(values, dtype=np.float64)
+    has_time = time_ms is not None and len(time_ms) == count
+    stats.update({
+        "min": _scalar(column[argmin]),
+        "max": _scalar(column[argmax]),
+        "sum": float(total),
+        "mean": float(total) / (count - nan_count),
+        "argmin_time_ms": float(time_ms[argmin]) if has_time else None,
+        "argmax_time_ms": float(time_ms[argmax]) if has_time else None,
+    })
+    return stats
+
+
+class MessageTable:
+    """
+    All fields of one message type, each a contiguous array of equal length.
+    A table reopened from disk (see session_files.py) passes its saved
+    time column and statistics instead of recomputing them.
+    """
+
+    def __init__(self, name, columns, time_ms=None, stats=None):
+        self.name = name
+        self.columns = columns
+        self.time_field = None
+        self.time_ms = None
+        for field, scale in TIME_FIELDS:
+            column = columns.get(field)
+            if column is not None and column.dtype.kind in "iuf":
+                self.time_field = field
+                if time_ms is not None:
+                    self.time_ms = time_ms
+                else:
+                    self.time_ms = column.astype(np.float64) * scale if scale != 1.0 \
+                        else column.astype(np.float64, copy=False)
+                break
+        if stats is None:
+            stats = {field: series_stats(column, self.time_ms) for field, column in columns.items()}
+        self.stats = stats
+
+    def series_index(self, field):
+        """
+        Threshold index for `field`, built on first use and kept in INDEX_CACHE
+        while recently used. None for boxed (object) columns such as text with
+        nulls: their values do not sort, so they are scanned instead.
+        """
+        if self.columns[field].dtype == object:
+            return None
+        return INDEX_CACHE.get(self, field)
+
+    def __len__(self):
+        return max((len(c) for c in self.columns.values()), default=0)
+
+    def window(self, start_ms=None, end_ms=None):
+        """
+        Sample range [lo, hi) with start_ms <= time <= end_ms, found by binary
+        search on the (monotonic) time column. None when there is no time column.
+        """
+        if self.time_ms is None:
+            return None
+        lo = 0 if start_ms is None else int(np.searchsorted(self.time_ms, start_ms, side="left"))
+        hi = len(self.time_ms) if end_ms is None else int(np.searchsorted(self.time_ms, end_ms, side="right"))
+        return lo, max(lo, hi)
+
+    @property
+    def nbytes(self):
+        total = sum(c.nbytes for c in self.columns.values())
+        if self.time_ms is not None and not any(self.time_ms is c for c in self.columns.values()):
+            total += self.time_ms.nbytes
+        return total
+
+
+class TelemetryStore:
+    """Columnar view of a parsed log, keyed by message type then field."""
+
+    def __init__(self, tables, digest=None, events=None):
+        self.tables = tables
+        self.digest = digest
+        self.message_types = list(tables)
+        self.paths = PathIndex(tables)
+        self._mode_segments = None
+        self._events = events
+        self._derived_series = None
+        self._derived = OrderedDict()
+        self._derived_lock = threading.Lock()
+
+    @classmethod
+    def from_messages(cls, messages, digest=None):
+        tables = {}
+        for message_type, fields in (messages or {}).items():
+            if not isinstance(fields, dict):
+                continue
+            columns = {field: to_array(values) for field, values in fields.items() if is_series(values)}
+            tables[message_type] = MessageTable(message_type, columns)
+        store = cls(tables, digest=digest)
+        logger.info(f"Telemetry store built: {len(tables)} message types, {store.nbytes} bytes")
+        return store
+
+    def __contains__(self, message_type):
+        return message_type in self.tables
+
+    @property
+    def nbytes(self):
+        return sum(t.nbytes for t in self.tables.values())
+
+    def mode_segments(self):
+        """
+        Flight-mode segments as [(start_ms, end_ms, mode)], computed once from
+        the first available MODE_SOURCES series. The last segment is open-ended.
+        """
+        if self._mode_segments is None:
+            # Built locally and published once: concurrent tool threads never see a partial list
+            segments = []
+            for message_type, field in MODE_SOURCES:
+                table = self.tables.get(message_type)
+                if table is None or field not in table.columns or table.time_ms is None:
+                    continue
+                modes, times = table.columns[field], table.time_ms
+                changes = np.flatnonzero(modes[1:] != modes[:-1]) + 1 if len(modes) else []
+                starts = np.concatenate(([0], changes)).astype(int) if len(modes) else []
+                for i, start in enumerate(starts):
+                    end_ms = float(times[starts[i + 1]]) if i + 1 < len(starts) else math.inf
+                    segments.append((float(times[start]), end_ms, _scalar(modes[start])))
+                break
+            self._mode_segments = segments
+        return self._mode_segments
+
+    def events(self):
+        """Anomaly event table (see anomalies.py), computed once per store."""
+        if self._events is None:
+            self._events = detect_events(self)
+            elapsed = sum(d["elapsed_ms"] for d in self._events["detectors"].values())
+            logger.info(f"Anomaly detectors found {len(self._events['events'])} events in {elapsed:.1f} ms")
+        return self._events
+
+    def derived_series(self):
+        """{name: (expression, description)} of the derived series this log supports, computed once."""
+        if self._derived_series is None:
+            self._derived_series = available_series(self)
+        return self._derived_series
+
+    def derived(self, name):
+        """
+        (canonical name, MessageTable) of the derived series `name`: a
+        derived_series() name, a NAMED_SERIES name in any spelling, or an
+        expression. Recently used series are kept, least recently used first
+        out beyond DERIVED_CACHE_MAX_BYTES; raises DerivedSeriesError.
+        """
+        catalog = self.derived_series()
+        key = name
+        if key not in catalog:
+            named = {normalize(n): n for n in NAMED_SERIES}
+            key = named.get(normalize(name))
+            if key is not None and key not in catalog:
+                raise DerivedSeriesError(f"{key} needs one of {', '.join(NAMED_SERIES[key][1])}; none is in this log")
+            key = key or re.sub(r"\s+", "", name)
+        with self._derived_lock:
+            table = self._derived.get(key)
+            if table is not None:
+                self._derived.move_to_end(key)
+                return key, table
+        values, time_ms = evaluate(self, catalog[key][0] if key in catalog else key)
+        columns = {key: values}
+        if time_ms is not None:
+            columns["time_boot_ms"] = time_ms
+        table = MessageTable(DERIVED_TYPE, columns)
+        with self._derived_lock:
+            self._derived[key] = table
+            self._derived.move_to_end(key)
+            # The newest series stays even alone over the budget: the caller is about to use it
+            while len(self._derived) > 1 and \
+                    sum(t.nbytes for t in self._derived.values()) > DERIVED_CACHE_MAX_BYTES:
+                self._derived.popitem(last=False)
+        return key, table
+
+    def table(self, message_type, field=None):
+        """The MessageTable of a message type, or of the derived series `field` for DERIVED."""
+        if message_type == DERIVED_TYPE and message_type not in self.tables:
+            return self.derived(field)[1]
+        return self.tables[message_type]
+
+    def window_ranges(self, message_type, start_ms=None, end_ms=None, flight_mode=None, field=None):
+        """
+        Sample ranges [(lo, hi)] of `message_type` inside the time window and,
+        if given, inside every segment flown in `flight_mode`. Returns None
+        when the message type has no time column. `field` names the series of
+        a DERIVED path.
+        """
+        table = self.table(message_type, field)
+        if flight_mode is None:
+            window = table.window(start_ms, end_ms)
+            return None if window is None else [window]
+
+        wanted = str(flight_mode).strip().lower()
+        ranges = []
+        for seg_start, seg_end, mode in self.mode_segments():
+            if str(mode).strip().lower() != wanted:
+                continue
+            lo_ms = seg_start if start_ms is None else max(seg_start, start_ms)
+            hi_ms = seg_end if end_ms is None else min(seg_end, end_ms)
+            if lo_ms > hi_ms:
+                continue
+            window = table.window(lo_ms, None if math.isinf(hi_ms) else hi_ms)
+            if window is None:
+                return None
+            # Segments are half-open: samples at the next mode change belong to the next segment
+            if not math.isinf(seg_end) and (end_ms is None or seg_end <= end_ms):
+                window = (window[0], int(np.searchsorted(table.time_ms, seg_end, side="left")))
+            if window[1] > window[0]:
+                ranges.append(window)
+        return ranges
+
+    def fields(self, message_type):
+        return list(self.tables[message_type].columns)
+
+    def resolve(self, keys_list):
+        """
+        Resolve a tool path through the precompiled PathIndex. ['DERIVED', name]
+        resolves (and evaluates) a derived series instead.
+        """
+        name = derived_name(keys_list) if DERIVED_TYPE not in self.tables else None
+        if name is None:
+            return self.paths.resolve(keys_list)
+        try:
+            key, _ = self.derived(name)
+        except DerivedSeriesError as e:
+            logger.info(f"Derived series {name!r} not available: {e}")
+            suggestions = [[DERIVED_TYPE, n] for n in self.derived_series()]
+            return PathResolution(suggestions=suggestions[:10], detail=str(e))
+        return PathResolution(DERIVED_TYPE, key, corrected=key != name)
+
+    def get(self, resolution):
+        """
+        Value addressed by a found PathResolution: a table, a series or a
+        single sample. Returns None for an out-of-range sample index.
+        """
+        table = self.table(resolution.message_type, resolution.field)
+        if resolution.field is None:
+            return table
+        series = table.columns[resolution.field]
+        if resolution.index is None:
+            return series
+        if not -len(series) <= resolution.index < len(series):
+            return None
+        return series[resolution.index]
+
+    def lookup(self, keys_list):
+        """Value at `keys_list`, or None when the path does not resolve."""
+        resolution = self.resolve(keys_list)
+        return self.get(resolution) if resolution.found else None
+
+
+def _coerce_threshold(series, threshold):
+    """Match the threshold's type to the series so comparisons are vectorizable."""
+    if series.dtype.kind in "biuf":
+        if isinstance(threshold, str):
+            return float(threshold)
+        return threshold
+    if series.dtype.kind == "U" and not isinstance(threshold, str):
+        return str(threshold)
+    return threshold
+
+
+def summarize(series, operation, comparison=None, threshold=None, stats=None, index=None):
+    """
+    Vectorized summary of one series; mirrors flight_data_summary_tool's
+    results. first/last/min/max/average come from the `stats` sidecar
+    when given, without touching the series; *_where operations use the
+    SeriesIndex `index` when given instead of scanning.
+    """
+    if operation not in SUMMARY_OPERATIONS:
+        return {"error": "unknown_operation"}
+    if operation in WHERE_OPERATIONS:
+        if comparison is None or threshold is None:
+            return {"error": "comparison_or_threshold_missing"}
+        if comparison not in COMPARISONS:
+            return {"error": "unknown_comparison"}
+    if len(series) == 0:
+        return None
+
+    if stats is not None and operation in SIDECAR_OPERATIONS:
+        if operation not in ("first", "last") and "min" not in stats:
+            return {"error": "not_numeric"}
+        return stats[SIDECAR_OPERATIONS[operation]]
+
+    if operation == "first":
+        return _scalar(series[0])
+    if operation == "last":
+        return _scalar(series[-1])
+    if operation in ("min", "max", "average"):
+        if series.dtype.kind not in "biuf":
+            return {"error": "not_numeric"}
+        values = series.astype(np.float64, copy=False) if series.dtype.kind == "b" else series
+        if series.dtype.kind == "f" and np.isnan(values).all():
+            return None
+        reducer = {"min": np.nanmin, "max": np.nanmax, "average": np.nanmean}[operation]
+        return reducer(values).item()
+
+    try:
+        threshold = _coerce_threshold(series, threshold)
+        if index is not None:
+            if operation == "count_where":
+                return {"count": index.count(comparison, threshold)}
+            idx = index.first_index(comparison, threshold)
+            return {"index": idx, "value": None if idx is None else _scalar(series[idx])}
+        mask = COMPARISONS[comparison](series, threshold)
+    except (TypeError, ValueError):
+        return {"error": "threshold_type_mismatch"}
+    mask = np.asarray(mask, dtype=bool)
+    if operation == "count_where":
+        return {"count": int(np.count_nonzero(mask))}
+    idx = int(np.argmax(mask)) if mask.size else 0
+    if not mask.size or not mask[idx]:
+        return {"index": None, "value": None}
+    return {"index": idx, "value": _scalar(series[idx])}
+
+
+def summarize_window(series, time_ms, ranges, operation, comparison=None, threshold=None):
+    """
+    Summary restricted to the sample ranges from TelemetryStore.window_ranges.
+    Only the samples inside the window are touched. first_index_where
+    reports the index in the full series and its timestamp.
+    """
+    if len(ranges) == 1:
+        lo, hi = ranges[0]
+        window = series[lo:hi]
+        positions = None
+    else:
+        window = np.concatenate([series[lo:hi] for lo, hi in ranges]) if ranges else series[:0]
+        positions = np.concatenate([np.arange(lo, hi) for lo, hi in ranges]) if ranges else None
+
+    result = summarize(window, operation, comparison, threshold)
+    if operation == "first_index_where" and isinstance(result, dict) and result.get("index") is not None:
+        idx = result["index"]
+        idx = int(positions[idx]) if positions is not None else ranges[0][0] + idx
+        result = dict(result, index=idx, time_ms=float(time_ms[idx]))
+    return result
+
+
+def series_payload(table, field, lo, hi, max_points, method="lttb", exact=False, exact_limit=None):
+    """
+    Samples [lo, hi) of one field (or, with field None, of the whole table)
+    in a bounded form for the model: all samples when `exact` (refused
+    beyond `exact_limit`), otherwise at most `max_points` samples chosen by
+    `method` for numeric series, by value changes for text series, and by
+    an even stride for whole tables. The original sample count and time
+    range are always reported.
+    """
+    count = hi - lo
+    times = table.time_ms
+    payload = {
+        "samples": count,
+        "time_range_ms": [float(times[lo]), float(times[hi - 1])] if times is not None and count else None,
+    }
+    if exact:
+        if exact_limit is not None and count > exact_limit:
+            return dict(payload, error="slice_too_large", limit=exact_limit)
+        picked, payload["method"] = np.arange(lo, hi), "exact"
+    elif count <= max_points:
+        picked, payload["method"] = np.arange(lo, hi), "none"
+    elif field is None:
+        picked, payload["method"] = np.unique(np.linspace(lo, hi - 1, max_points).astype(np.int64)), "stride"
+    else:
+        series = table.columns[field][lo:hi]
+        if series.dtype.kind in "biuf":
+            x = times[lo:hi] if times is not None else None
+            picked = lo + downsample_indices(series, x, max_points, method)
+            payload["method"] = method
+        else:
+            # Text series (e.g. MSG.Message): keep the samples where the value changes
+            changes = np.concatenate(([0], np.flatnonzero(series[1:] != series[:-1]) + 1))
+            payload["truncated"] = len(changes) > max_points
+            picked, payload["method"] = lo + changes[:max_points], "changes"
+
+    payload["returned"] = len(picked)
+    if times is not None:
+        payload["time_ms"] = to_jsonable(times[picked])
+    else:
+        payload["index"] = picked.tolist()
+    if field is None:
+        payload["fields"] = {name: to_jsonable(column[picked]) for name, column in table.columns.items()}
+    else:
+        payload["values"] = to_jsonable(table.columns[field][picked])
+    return payload
@@ -0,0 +1,33 @@
+import pytest
+
+from app import app
+from metrics import registry
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def _finished(outcome):
+    return f'endpoint="chat_stream",outcome="{outcome}"' in registry.render()
+
+
+def test_invalid_body(client):
+    response = client.post("/api/chat/stream", data="not json", content_type="application/json")
+    assert response.status_code == 400
+    assert response.json == {"status": "error", "message": "invalid_request_body"}
+    assert _finished("error")
+
+
+def test_unknown_session(client):
+    response = client.post("/api/chat/stream", json={"message": "max altitude?", "sessionId": "ab" * 16})
+    assert response.status_code == 404
+    assert response.json["message"] == "unknown_or_expired_session"
+    assert _finished("unknown_session")
+
+
+def test_unreadable_inline_log(client):
+    response = client.post("/api/chat/stream", json={"message": "max altitude?", "fileInfo": {"messages": 3}})
+    assert response.status_code == 500
+    assert response.json["status"] == "error"
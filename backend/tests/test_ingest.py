@@ -0,0 +1,67 @@
+import gzip
+import io
+import json
+
+import numpy as np
+import pytest
+
+import ingest
+from ingest import IngestError, ingest_stream
+
+
+def _ingest(body, chunk_size, monkeypatch):
+    monkeypatch.setattr(ingest, "CHUNK_SIZE", chunk_size)
+    return ingest_stream(io.BytesIO(json.dumps(body).encode()))[1]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_text_field_across_chunk_boundaries(chunk_size, monkeypatch):
+    body = {"meta": {"type": "bin"}, "messages": {
+        "ACC": {"AccX": list(range(1000)), "time_boot_ms": [i * 10 for i in range(1000)]},
+        "MODE": {"asText": {str(i): "AUTO" for i in range(50)}, "Mode": [3, 5]},
+        "MSG": {"Message": {str(i): f"step {i}" + "]}" * (i % 2) for i in range(50)}},
+    }}
+    messages = _ingest(body, chunk_size, monkeypatch)
+    assert messages["ACC"]["AccX"].dtype == np.int64
+    assert messages["ACC"]["AccX"][-1] == 999
+    assert messages["MODE"]["asText"].tolist() == ["AUTO"] * 50
+    assert messages["MODE"]["Mode"].tolist() == [3, 5]
+    assert messages["MSG"]["Message"].tolist() == [f"step {i}" + "]}" * (i % 2) for i in range(50)]
+
+
+@pytest.mark.parametrize("chunk_size", [5, 1 << 20])
+def test_numeric_series(chunk_size, monkeypatch):
+    body = {"messages": {"ATT": {
+        "Roll": [0.5, -1.25, 1e3],
+        "Typed": {"0": 1, "1": 2, "2": 3},
+        "Nulls": [1, None, 3],
+        "Empty": [],
+        "Huge": [2 ** 63, 1],
+    }}}
+    fields = _ingest(body, chunk_size, monkeypatch)["ATT"]
+    assert fields["Roll"].tolist() == [0.5, -1.25, 1e3]
+    assert fields["Typed"].tolist() == [1, 2, 3]
+    assert np.isnan(fields["Nulls"][1])
+    assert len(fields["Empty"]) == 0
+    assert fields["Huge"][0] == float(2 ** 63)
+
+
+def test_non_index_keyed_object_is_skipped(monkeypatch):
+    messages = _ingest({"messages": {"PARM": {"Value": {"a": 1}, "Count": [1]}}}, 4, monkeypatch)
+    assert list(messages["PARM"]) == ["Count"]
+
+
+def test_gzip_and_digest():
+    body = json.dumps({"messages": {"ACC": {"AccX": [1, 2]}}}).encode()
+    _, plain, digest = ingest_stream(io.BytesIO(body))
+    _, packed, gzip_digest = ingest_stream(io.BytesIO(gzip.compress(body)))
+    assert digest == gzip_digest
+    assert packed["ACC"]["AccX"].tolist() == plain["ACC"]["AccX"].tolist()
+
+
+@pytest.mark.parametrize("body", [b'{"messages": {"ACC": {"AccX": [1, 2,, 3]}}}', b'{"messages": {"ACC": {"AccX": [1, 2',
+                                  b'{"messages": {"ACC": {"AccX": [1, 2]}} x'])
+def test_malformed_json_is_an_ingest_error(body, monkeypatch):
+    monkeypatch.setattr(ingest, "CHUNK_SIZE", 4)
+    with pytest.raises(IngestError):
+        ingest_stream(io.BytesIO(body))
@@ -0,0 +1,20 @@
+from app import flight_data_summary_tool
+from result_cache import ResultCache
+from telemetry_store import TelemetryStore
+
+
+def test_numeric_thresholds_share_a_key():
+    assert ResultCache.key("log", ["ATT", "Roll"], "count_where", ">", "1") == \
+        ResultCache.key("log", ["ATT", "Roll"], "count_where", ">", 1.0)
+
+
+def test_text_thresholds_keep_their_spelling():
+    keys = {ResultCache.key("log", ["MSG", "Code"], "count_where", "==", threshold, numeric=False)
+            for threshold in ("1", "1.0", 1, 1.0)}
+    assert len(keys) == 4
+
+
+def test_text_column_answers_each_spelling():
+    store = TelemetryStore.from_messages({"MSG": {"Code": ["1", "1.0", "1", "2"]}}, digest="result-cache-test")
+    assert flight_data_summary_tool(["MSG", "Code"], "count_where", store, "==", "1") == {"count": 2}
+    assert flight_data_summary_tool(["MSG", "Code"], "count_where", store, "==", "1.0") == {"count": 1}
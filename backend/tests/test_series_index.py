@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from series_index import COMPARISONS, IndexCache, SeriesIndex
+from telemetry_store import MessageTable, TelemetryStore, summarize
+
+SERIES = {
+    "float": np.array([0.5, np.nan, 3.0, -1.0, 3.0, np.nan, 7.25] * 400),
+    "int": np.arange(5000, dtype=np.int64) % 37,
+    "enum": np.array([0, 3, 3, 4, 6, 3, 0] * 300, dtype=np.int64),
+    "bool": np.array([False, True, True, False] * 600),
+    "text": np.array(["AUTO", "LOITER", "RTL", "AUTO", "LAND"] * 300),
+}
+
+
+def _scan(series, operation, comparison, threshold):
+    """The unindexed result, for comparison with the index."""
+    return summarize(series, operation, comparison, threshold)
+
+
+@pytest.mark.parametrize("name", list(SERIES))
+@pytest.mark.parametrize("comparison", list(COMPARISONS))
+def test_index_matches_scan(name, comparison):
+    series = SERIES[name]
+    index = SeriesIndex(series)
+    thresholds = ["AUTO", "RTL", "ZZZ"] if name == "text" else [-5, 0, 3, 3.0, 4, 7.25, 100]
+    for threshold in thresholds:
+        for operation in ("count_where", "first_index_where"):
+            assert summarize(series, operation, comparison, threshold, index=index) == \
+                _scan(series, operation, comparison, threshold), (operation, threshold)
+
+
+def test_object_column_is_scanned():
+    table = MessageTable("MSG", {"Message": np.array(["a", None, "b"], dtype=object)})
+    assert table.series_index("Message") is None
+    series = table.columns["Message"]
+    assert summarize(series, "count_where", "==", "b") == {"count": 1}
+    assert summarize(series, "first_index_where", "!=", "a") == {"index": 1, "value": None}
+
+
+def test_summary_tool_on_text_with_nulls():
+    from app import flight_data_summary_tool
+    store = TelemetryStore.from_messages({"MSG": {"Message": ["a", None, "b"], "time_boot_ms": [0, 10, 20]}},
+                                         digest="series-index-test")
+    assert flight_data_summary_tool(["MSG", "Message"], "count_where", store, "==", "b") == {"count": 1}
+
+
+def test_cache_bounded_and_released_with_table():
+    series = np.arange(10000, dtype=np.float64)
+    nbytes = SeriesIndex(series).nbytes
+    cache = IndexCache(max_bytes=2 * nbytes)
+    tables = [MessageTable("T", {"x": series.copy()}) for _ in range(3)]
+    indexes = [cache.get(table, "x") for table in tables]
+    assert cache.get(tables[2], "x") is indexes[2]
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 1 and stats["bytes"] <= 2 * nbytes
+    del tables[1:], indexes
+    import gc
+    gc.collect()
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+import pytest
+
+from session_files import SharedSessions, load_store, private_directory, save_store
+from sessions import LogSession
+from telemetry_store import TelemetryStore
+
+SESSION_ID = "0123456789abcdef" * 4
+
+
+def _store():
+    return TelemetryStore.from_messages({
+        "ATT": {"Roll": [0.5, 1.5, -2.0], "TimeUS": [1000, 2000, 3000]},
+        "MSG": {"Message": ["armed", None, "landed"], "time_boot_ms": [0, 10, 20]},
+        "EMPTY": {"Value": []},
+        "RAGGED": {"Points": [[1, 2], [3], None]},
+    }, digest=SESSION_ID)
+
+
+def _session(store):
+    return LogSession(SESSION_ID, "flight.bin", "bin", store, {"ATT": {"Roll": "deg"}}, store.nbytes)
+
+
+def test_store_round_trip_without_pickles(tmp_path):
+    save_store(_store(), str(tmp_path), name="flight.bin")
+    meta, store = load_store(str(tmp_path))
+    assert meta["name"] == "flight.bin"
+    assert store.tables["ATT"].columns["Roll"].tolist() == [0.5, 1.5, -2.0]
+    assert store.tables["ATT"].time_ms.tolist() == [1.0, 2.0, 3.0]
+    assert store.tables["MSG"].columns["Message"].tolist() == ["armed", None, "landed"]
+    assert store.tables["RAGGED"].columns["Points"].tolist() == [[1, 2], [3], None]
+    assert len(store.tables["EMPTY"].columns["Value"]) == 0
+    for name in os.listdir(tmp_path):
+        if name.endswith(".npy"):
+            assert not np.load(tmp_path / name, mmap_mode="r").dtype.hasobject
+
+
+def test_planted_pickle_is_not_loaded(tmp_path):
+    save_store(_store(), str(tmp_path))
+    target = next(name for name in sorted(os.listdir(tmp_path)) if name.endswith(".npy"))
+    np.save(tmp_path / target, np.array([object()], dtype=object), allow_pickle=True)
+    with pytest.raises(ValueError):
+        load_store(str(tmp_path))
+
+
+def test_private_directory(tmp_path):
+    root = tmp_path / "sessions"
+    private_directory(str(root))
+    assert os.stat(root).st_mode & 0o777 == 0o700
+    os.chmod(root, 0o777)
+    private_directory(str(root))
+    assert os.stat(root).st_mode & 0o777 == 0o700
+
+
+def test_private_directory_of_another_user(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, "getuid", lambda: os.stat(tmp_path).st_uid + 1)
+    with pytest.raises(PermissionError):
+        private_directory(str(tmp_path))
+
+
+def test_shared_sessions_publish_attach_remove(tmp_path):
+    shared = SharedSessions(str(tmp_path / "shared"))
+    session, created = shared.publish(_session(_store()))
+    assert created and SESSION_ID in shared
+    assert isinstance(session.data.tables["ATT"].columns["Roll"], np.memmap)
+    again, created = shared.publish(_session(_store()))
+    assert not created
+    assert again.data.tables["MSG"].columns["Message"].tolist() == ["armed", None, "landed"]
+    assert shared.attach("../etc") is None
+    assert shared.remove(SESSION_ID) and shared.attach(SESSION_ID) is None
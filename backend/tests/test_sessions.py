@@ -0,0 +1,67 @@
+import numpy as np
+
+from session_files import SharedSessions, SpillDirectory
+from sessions import LogSession, SessionStore
+from telemetry_store import TelemetryStore
+
+
+def _session(n, rows=1000):
+    session_id = f"{n:016x}" * 4
+    store = TelemetryStore.from_messages({"ATT": {"Roll": np.arange(rows, dtype=np.float64) + n,
+                                                  "time_boot_ms": np.arange(rows) * 10}}, digest=session_id)
+    return LogSession(session_id, f"log{n}.bin", "bin", store, {}, store.nbytes)
+
+
+def _spilling_store(tmp_path, logs=2):
+    # Room for one log: adding the next spills the previous one
+    return SessionStore(memory_budget=int(_session(0).nbytes * (logs - 0.5)), spill=SpillDirectory(str(tmp_path)))
+
+
+def test_spill_and_reopen(tmp_path):
+    store = _spilling_store(tmp_path)
+    first, _ = store.add(_session(1))
+    store.add(_session(2))
+    assert first.data is None and first.spill_path is not None
+    session, data = store.get(first.session_id)
+    assert session is first
+    assert data.tables["ATT"].columns["Roll"][:2].tolist() == [1.0, 2.0]
+    assert isinstance(data.tables["ATT"].columns["Roll"], np.memmap)
+
+
+def test_store_stays_usable_when_spilled_after_get(tmp_path):
+    store = _spilling_store(tmp_path)
+    first, _ = store.add(_session(1))
+    session, data = store.get(first.session_id)
+    store.add(_session(2))
+    assert session.data is None
+    assert data.tables["ATT"].columns["Roll"][-1] == 1000.0
+
+
+def test_duplicate_upload_of_spilled_session(tmp_path):
+    store = _spilling_store(tmp_path)
+    first, _ = store.add(_session(1))
+    store.add(_session(2))
+    assert first.data is None
+    session, created = store.add(_session(1))
+    assert session is first and not created and session.data is not None
+
+
+def test_unreadable_spill_is_dropped(tmp_path):
+    store = _spilling_store(tmp_path)
+    first, _ = store.add(_session(1))
+    store.add(_session(2))
+    store.spill.remove(first.spill_path)
+    assert store.get(first.session_id) == (None, None)
+    assert first.session_id not in store
+
+
+def test_shared_sessions_across_stores(tmp_path):
+    shared = SharedSessions(str(tmp_path / "shared"))
+    uploader = SessionStore(shared=shared)
+    other = SessionStore(shared=SharedSessions(str(tmp_path / "shared")))
+    session, created = uploader.add(_session(3))
+    assert created
+    attached, data = other.get(session.session_id)
+    assert attached.name == "log3.bin" and data.tables["ATT"].columns["Roll"][0] == 3.0
+    uploader.drop(session.session_id)
+    assert other.get(session.session_id) == (None, None)
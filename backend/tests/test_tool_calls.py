@@ -0,0 +1,24 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from app import handle_tool_calls
+from telemetry_store import TelemetryStore
+
+
+def _call(call_id, name, arguments):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def test_bad_arguments_fail_only_their_call():
+    store = TelemetryStore.from_messages({"ATT": {"Roll": [1.0, 4.0, 2.0]}}, digest="tool-calls-test")
+    calls = [
+        _call("1", "flight_data_summary_tool", "{not json"),
+        _call("2", "flight_data_summary_tool", "[1, 2]"),
+        _call("3", "flight_data_summary_tool", json.dumps({"keys_list": ["ATT", "Roll"], "operation": "max"})),
+        _call("4", "no_such_tool", "{}"),
+    ]
+    results = asyncio.run(handle_tool_calls(calls, store))
+    assert [r["tool_call_id"] for r in results] == ["1", "2", "3", "4"]
+    assert [json.loads(r["content"]).get("error") if r["tool_call_id"] != "3" else json.loads(r["content"])
+            for r in results] == ["invalid_arguments", "invalid_arguments", 4.0, "unknown_tool"]
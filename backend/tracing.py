@@ -0,0 +1,118 @@
+"""
+Per-request timing spans for the chat pipeline.
+
+Every chat request gets a Trace. Spans are opened either on the trace
+directly (request thread) or with span(), which finds the current trace
+through a context variable. The pipeline coroutine is bound to its trace
+with traced(); tasks and asyncio.to_thread workers started below it copy
+the context, so tool calls running in worker threads land in the same
+trace.
+
+A finished span is observed in the chat_span_duration_seconds histogram
+(labelled by span name and kind, e.g. the tool or model stage) and kept
+with its attributes on the trace. A finished trace is observed in
+chat_request_duration_seconds and written to the log as one JSON line.
+"""
+import contextvars
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Write one structured line per finished trace to the log
+TRACE_LOG = os.getenv("TRACE_LOG", "1") == "1"
+
+registry.histogram("chat_request_duration_seconds", "Chat request latency by endpoint and outcome.")
+registry.histogram("chat_span_duration_seconds", "Chat pipeline span latency by span name and kind.")
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+class Span:
+    __slots__ = ("name", "kind", "attributes", "start", "duration_s")
+
+    def __init__(self, name, kind, attributes, start):
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start = start
+        self.duration_s = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self):
+        return None if self.duration_s is None else round(self.duration_s * 1000, 3)
+
+
+class Trace:
+    """The spans of one chat request."""
+
+    def __init__(self, endpoint):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.spans = []
+
+    @contextmanager
+    def span(self, name, kind="", **attributes):
+        current = Span(name, kind, attributes, time.perf_counter())
+        try:
+            yield current
+        except BaseException as e:
+            current.attributes["error"] = type(e).__name__
+            raise
+        finally:
+            current.duration_s = time.perf_counter() - current.start
+            registry.observe("chat_span_duration_seconds", current.duration_s, span=name, kind=kind)
+            self.spans.append(current)
+
+    def summary(self, outcome=None):
+        return {
+            "trace_id": self.trace_id,
+            "endpoint": self.endpoint,
+            "outcome": outcome,
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 3),
+            "spans": [dict(
+                span.attributes,
+                name=span.name,
+                kind=span.kind,
+                offset_ms=round((span.start - self.start) * 1000, 3),
+                duration_ms=span.duration_ms
+            ) for span in sorted(self.spans, key=lambda span: span.start)]
+        }
+
+    def finish(self, outcome):
+        registry.observe("chat_request_duration_seconds", time.perf_counter() - self.start,
+                         endpoint=self.endpoint, outcome=outcome)
+        if TRACE_LOG:
+            logger.info(f"trace {json.dumps(self.summary(outcome), default=str)}")
+
+
+@contextmanager
+def span(name, kind="", **attributes):
+    """Span on the current trace; outside a trace it is only observed in the histogram."""
+    trace = _current.get()
+    if trace is not None:
+        with trace.span(name, kind, **attributes) as current:
+            yield current
+        return
+    current = Span(name, kind, attributes, time.perf_counter())
+    try:
+        yield current
+    finally:
+        current.duration_s = time.perf_counter() - current.start
+        registry.observe("chat_span_duration_seconds", current.duration_s, span=name, kind=kind)
+
+
+async def traced(trace, coro):
+    """Await `coro` with `trace` as the current trace."""
+    _current.set(trace)
+    return await coro
@@ -0,0 +1,80 @@
+// Encodes parsed log messages into the backend's columnar frame format (see backend/ingest.py),
+// so uploads to /api/logs carry raw typed-array bytes instead of JSON text.
+
+const MAGIC = [0x55, 0x4c, 0x46, 0x31] // "ULF1"
+
+const TYPED_ARRAY_CODES = [
+    [Float64Array, 'd'],
+    [Float32Array, 'f'],
+    [Int32Array, 'i'],
+    [Uint32Array, 'I'],
+    [Int16Array, 'h'],
+    [Uint16Array, 'H'],
+    [Int8Array, 'b'],
+    [Uint8Array, 'B']
+]
+
+function columnOf (values) {
+    if (ArrayBuffer.isView(values)) {
+        for (const [Type, code] of TYPED_ARRAY_CODES) {
+            if (values instanceof Type) {
+                return { code: code, bytes: new Uint8Array(values.buffer, values.byteOffset, values.byteLength) }
+            }
+        }
+    }
+    if (Array.isArray(values) && values.every(v => typeof v === 'number')) {
+        const column = Float64Array.from(values)
+        return { code: 'd', bytes: new Uint8Array(column.buffer) }
+    }
+    if (Array.isArray(values)) {
+        return { code: 'J', bytes: new TextEncoder().encode(JSON.stringify(values)) }
+    }
+    return null
+}
+
+function header (encoder, messageType, field, code, count) {
+    const type = encoder.encode(messageType)
+    const name = encoder.encode(field)
+    const buffer = new ArrayBuffer(2 + type.length + 2 + name.length + 1 + 4)
+    const view = new DataView(buffer)
+    const bytes = new Uint8Array(buffer)
+    let offset = 0
+    view.setUint16(offset, type.length, true)
+    bytes.set(type, offset + 2)
+    offset += 2 + type.length
+    view.setUint16(offset, name.length, true)
+    bytes.set(name, offset + 2)
+    offset += 2 + name.length
+    view.setUint8(offset, code.charCodeAt(0))
+    view.setUint32(offset + 1, count, true)
+    return bytes
+}
+
+function sizeOf (code) {
+    return { d: 8, f: 4, i: 4, I: 4, h: 2, H: 2, b: 1, B: 1 }[code]
+}
+
+export default function encodeLogFrames (meta, messages) {
+    const encoder = new TextEncoder()
+    const metaBytes = encoder.encode(JSON.stringify(meta))
+    const metaLength = new Uint8Array(4)
+    new DataView(metaLength.buffer).setUint32(0, metaBytes.length, true)
+    const parts = [new Uint8Array(MAGIC), metaLength, metaBytes]
+
+    for (const [messageType, fields] of Object.entries(messages || {})) {
+        for (const [field, values] of Object.entries(fields || {})) {
+            const column = columnOf(values)
+            if (column === null) continue
+            const count = column.code === 'J' ? column.bytes.length : column.bytes.length / sizeOf(column.code)
+            parts.push(header(encoder, messageType, field, column.code, count), column.bytes)
+        }
+    }
+    return new Blob(parts, { type: 'application/x-uavlog-frames' })
+}
+
+export async function compressLogFrames (blob) {
+    // Gzip in the browser when supported; the backend detects gzip from its magic bytes
+    if (typeof CompressionStream === 'undefined') return blob
+    const stream = blob.stream().pipeThrough(new CompressionStream('gzip'))
+    return new Response(stream).blob()
+}